@@ -4,10 +4,9 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-# Get MongoDB URL from Secret Manager
+# Get MongoDB URL from the shared secret provider
 try:
-    from services.secret_manager_service import SecretManagerService
-    secret_manager = SecretManagerService()
+    from services.secret_manager_service import secret_manager
     MONGO_URL = secret_manager.get_secret("mongo-uri") or os.getenv("MONGO_URL", "mongodb://localhost:27017")
 except Exception as e:
     print(f"Warning: Could not load secret from Secret Manager: {e}")
@@ -27,6 +26,12 @@ async def connect_db():
     await db.tools.create_index("name")
     await db.credentials.create_index([("user_id", 1), ("tool_id", 1)])
     await db.issues.create_index("user_id")
+    # Activity logs are browsed newest-first with keyset pagination on (created_at, _id)
+    await db.activity_logs.create_index([("created_at", -1), ("_id", -1)])
+    await db.activity_logs.create_index([("user_email", 1), ("created_at", -1), ("_id", -1)])
+    await db.activity_logs.create_index([("activity_type", 1), ("created_at", -1), ("_id", -1)])
+    await db.activity_logs.create_index([("user_role", 1), ("created_at", -1), ("_id", -1)])
+    await db.activity_log_user_stats.create_index([("log_count", -1)])
     
     print(f"Connected to MongoDB: {DB_NAME}")
     
@@ -50,7 +55,7 @@ def env_bool(name: str, default: bool = False) -> bool:
 
 async def seed_initial_data():
     """Seed initial data only when explicitly enabled via environment variables."""
-    from utils.security import hash_password
+    from utils.security import hash_password_async
 
     if not env_bool("ENABLE_BOOTSTRAP_SEED", False):
         print("Bootstrap seed disabled (set ENABLE_BOOTSTRAP_SEED=true to enable).")
@@ -70,7 +75,7 @@ async def seed_initial_data():
         # Create admin user
         admin_user = {
             "email": admin_email,
-            "password": hash_password(initial_admin_password),
+            "password": await hash_password_async(initial_admin_password),
             "name": "Admin User",
             "role": "Administrator",
             "status": "Active",
@@ -91,7 +96,7 @@ async def seed_initial_data():
         sample_users = [
             {
                 "email": "john.smith@dsgtransport.com",
-                "password": hash_password(sample_user_password),
+                "password": await hash_password_async(sample_user_password),
                 "name": "John Smith",
                 "role": "User",
                 "status": "Active",
@@ -101,7 +106,7 @@ async def seed_initial_data():
             },
             {
                 "email": "sarah.johnson@dsgtransport.com",
-                "password": hash_password(sample_user_password),
+                "password": await hash_password_async(sample_user_password),
                 "name": "Sarah Johnson",
                 "role": "User",
                 "status": "Active",
@@ -1,10 +1,13 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query, Request
 from models.activity_log import ActivityLogCreate, ActivityLogResponse, ActivityType
 from database import get_db
+from services.activity_log_sink import activity_log_sink, COUNTED_FIELD, USER_STATS_COLLECTION
 from routes.auth import get_current_user, require_super_admin
 from bson import ObjectId
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from datetime import datetime, timezone
+import base64
+import json
 
 router = APIRouter()
 
@@ -15,17 +18,22 @@ async def log_activity(
     target: str = "System",
     details: str = None,
     activity_type: ActivityType = ActivityType.ADMIN,
-    ip_address: str = None
+    ip_address: str = None,
+    user_role: str = None
 ):
     """
     Utility function to log an activity from anywhere in the backend.
     Call this whenever an admin action occurs.
+    The entry is queued on the write-behind sink and flushed in batches.
+    The actor's role is captured at write time; pass it when it is already known.
     """
-    db = await get_db()
+    if user_role is None:
+        user_role = await lookup_user_role(user_email)
     
     log_entry = {
         "user_email": user_email,
         "user_name": user_name,
+        "user_role": user_role,
         "action": action,
         "target": target,
         "details": details,
@@ -34,19 +42,44 @@ async def log_activity(
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    result = await db.activity_logs.insert_one(log_entry)
-    return str(result.inserted_id)
+    return await activity_log_sink.enqueue(log_entry)
 
 
-@router.get("", response_model=List[dict])
-async def get_activity_logs(
-    limit: int = Query(50, le=200),
-    activity_type: Optional[str] = Query(None),
-    user_role: Optional[str] = Query(None),  # Filter by user role
-    user_email: Optional[str] = Query(None),  # Filter by specific user
-    current_user: dict = Depends(require_super_admin)
-):
-    """Get activity logs (Super Admin only) - Can filter by activity type, user role, or specific user"""
+async def lookup_user_role(user_email: str) -> str:
+    """Role of the user with this email (unique index lookup), or Unknown"""
+    db = await get_db()
+    user = await db.users.find_one({"email": user_email}, {"role": 1})
+    return user.get("role", "Unknown") if user else "Unknown"
+
+
+def encode_log_cursor(created_at: str, log_id: ObjectId) -> str:
+    """Opaque keyset cursor over (created_at, _id)"""
+    raw = json.dumps({"c": created_at, "i": str(log_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_log_cursor(cursor: str) -> Tuple[str, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        return data["c"], ObjectId(data["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def query_activity_logs(
+    limit: int,
+    cursor: Optional[str] = None,
+    activity_type: Optional[str] = None,
+    user_role: Optional[str] = None,
+    user_email: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    Fetch one page of logs, newest first, and the cursor for the next page.
+    Sorting on (created_at, _id) is served by the compound indexes created in
+    database.connect_db, so each page costs O(limit) regardless of depth.
+    Roles are denormalized onto each log, so this is a single indexed query.
+    """
     db = await get_db()
     
     # Build filter
@@ -54,26 +87,30 @@ async def get_activity_logs(
     if activity_type and activity_type != "all":
         query_filter["activity_type"] = activity_type
     
-    # Filter by user role - need to join with users collection
+    # Filter by user role - captured on the log entry at write time
     if user_role and user_role != "all":
-        # Get all users with this role
-        users_with_role = await db.users.find({"role": user_role}, {"email": 1}).to_list(1000)
-        role_emails = [u["email"] for u in users_with_role]
-        query_filter["user_email"] = {"$in": role_emails}
+        query_filter["user_role"] = user_role
     
     # Filter by specific user
     if user_email:
         query_filter["user_email"] = user_email
     
-    logs = []
-    cursor = db.activity_logs.find(query_filter).sort("created_at", -1).limit(limit)
+    # Keyset pagination - continue strictly after the last row of the previous page
+    if cursor:
+        cursor_created_at, cursor_id = decode_log_cursor(cursor)
+        query_filter["$or"] = [
+            {"created_at": {"$lt": cursor_created_at}},
+            {"created_at": cursor_created_at, "_id": {"$lt": cursor_id}}
+        ]
     
-    # Get user roles for display (limit to 1000 users)
-    all_users = {}
-    async for u in db.users.find({}, {"email": 1, "role": 1}).limit(1000):
-        all_users[u["email"]] = u.get("role", "Unknown")
+    logs = []
+    last_log = None
+    cursor_query = db.activity_logs.find(query_filter).sort(
+        [("created_at", -1), ("_id", -1)]
+    ).limit(limit)
     
-    async for log in cursor:
+    async for log in cursor_query:
+        last_log = log
         # Format time ago
         created_at = log.get("created_at", "")
         time_ago = format_time_ago(created_at) if created_at else "Unknown"
@@ -83,7 +120,7 @@ async def get_activity_logs(
             "id": str(log["_id"]),
             "user": user_email_val,
             "user_name": log.get("user_name", "Unknown"),
-            "user_role": all_users.get(user_email_val, "Unknown"),
+            "user_role": log.get("user_role", "Unknown"),
             "action": log.get("action", ""),
             "tool": log.get("target", "System"),
             "details": log.get("details"),
@@ -93,9 +130,44 @@ async def get_activity_logs(
             "created_at": created_at
         })
     
+    next_cursor = None
+    if last_log is not None and len(logs) == limit:
+        next_cursor = encode_log_cursor(last_log.get("created_at", ""), last_log["_id"])
+    
+    return logs, next_cursor
+
+
+@router.get("", response_model=List[dict])
+async def get_activity_logs(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),  # next_cursor from the previous page
+    activity_type: Optional[str] = Query(None),
+    user_role: Optional[str] = Query(None),  # Filter by user role
+    user_email: Optional[str] = Query(None),  # Filter by specific user
+    current_user: dict = Depends(require_super_admin)
+):
+    """Get activity logs (Super Admin only) - Can filter by activity type, user role, or specific user"""
+    logs, _ = await query_activity_logs(limit, cursor, activity_type, user_role, user_email)
     return logs
 
 
+@router.get("/page")
+async def get_activity_logs_page(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None),
+    activity_type: Optional[str] = Query(None),
+    user_role: Optional[str] = Query(None),
+    user_email: Optional[str] = Query(None),
+    current_user: dict = Depends(require_super_admin)
+):
+    """
+    Cursor-paginated activity logs (Super Admin only).
+    Pass next_cursor back as `cursor` to fetch older entries; it is null on the last page.
+    """
+    logs, next_cursor = await query_activity_logs(limit, cursor, activity_type, user_role, user_email)
+    return {"logs": logs, "next_cursor": next_cursor}
+
+
 def format_time_ago(iso_timestamp: str) -> str:
     """Format ISO timestamp to 'X minutes/hours/days ago' format"""
     try:
@@ -133,14 +205,18 @@ async def create_activity_log(
     current_user: dict = Depends(get_current_user)
 ):
     """Create a new activity log entry"""
-    db = await get_db()
-    
     # Get IP from request if not provided
     ip_address = log_data.ip_address or request.client.host if request.client else "Unknown"
     
+    if log_data.user_email == current_user["email"]:
+        user_role = current_user["role"]
+    else:
+        user_role = await lookup_user_role(log_data.user_email)
+    
     log_entry = {
         "user_email": log_data.user_email,
         "user_name": log_data.user_name,
+        "user_role": user_role,
         "action": log_data.action,
         "target": log_data.target,
         "details": log_data.details,
@@ -149,10 +225,10 @@ async def create_activity_log(
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     
-    result = await db.activity_logs.insert_one(log_entry)
+    log_id = await activity_log_sink.enqueue(log_entry)
     
     return {
-        "id": str(result.inserted_id),
+        "id": log_id,
         "message": "Activity logged successfully"
     }
 
@@ -179,6 +255,12 @@ async def delete_activity_log(
     
     await db.activity_logs.delete_one({"_id": obj_id})
     
+    # Keep the per-user rollup in step (logs it never counted don't decrement it)
+    log_email = log.get("user_email")
+    if log_email and log.get(COUNTED_FIELD):
+        await db[USER_STATS_COLLECTION].update_one({"_id": log_email}, {"$inc": {"log_count": -1}})
+        await db[USER_STATS_COLLECTION].delete_one({"_id": log_email, "log_count": {"$lte": 0}})
+    
     return {"message": "Activity log deleted successfully"}
 
 
@@ -198,6 +280,7 @@ async def delete_user_activity_logs(
     
     # Delete all logs for this user
     result = await db.activity_logs.delete_many({"user_email": user_email})
+    await db[USER_STATS_COLLECTION].delete_one({"_id": user_email})
     
     return {
         "message": f"Deleted {result.deleted_count} activity log(s) for {user_email}",
@@ -218,6 +301,7 @@ async def delete_all_activity_logs(
         raise HTTPException(status_code=404, detail="No activity logs to delete")
     
     result = await db.activity_logs.delete_many({})
+    await db[USER_STATS_COLLECTION].delete_many({})
     
     return {
         "message": f"Deleted all {result.deleted_count} activity logs",
@@ -229,24 +313,25 @@ async def delete_all_activity_logs(
 async def get_users_with_logs(
     current_user: dict = Depends(require_super_admin)
 ):
-    """Get list of users who have activity logs (for dropdown filter)"""
+    """
+    Get list of users who have activity logs (for dropdown filter).
+    Served from the per-user rollup maintained by the log writer, joined to
+    users for the current role in the same pipeline - O(users), not O(logs).
+    """
     db = await get_db()
+    stats = db[USER_STATS_COLLECTION]
     
-    # Get unique user emails from activity logs
     pipeline = [
-        {"$group": {"_id": "$user_email", "count": {"$sum": 1}, "user_name": {"$first": "$user_name"}}},
-        {"$sort": {"count": -1}}
+        {"$match": {"log_count": {"$gt": 0}}},
+        {"$sort": {"log_count": -1}},
+        {"$lookup": {"from": "users", "localField": "_id", "foreignField": "email", "as": "user"}},
+        {"$project": {
+            "_id": 0,
+            "email": "$_id",
+            "name": {"$ifNull": ["$user_name", "$_id"]},
+            "role": {"$ifNull": [{"$arrayElemAt": ["$user.role", 0]}, "Unknown"]},
+            "log_count": 1
+        }}
     ]
     
-    users = []
-    async for doc in db.activity_logs.aggregate(pipeline):
-        # Get user role from users collection
-        user = await db.users.find_one({"email": doc["_id"]}, {"role": 1})
-        users.append({
-            "email": doc["_id"],
-            "name": doc.get("user_name", doc["_id"]),
-            "role": user.get("role", "Unknown") if user else "Unknown",
-            "log_count": doc["count"]
-        })
-    
-    return users
+    return await stats.aggregate(pipeline).to_list(None)
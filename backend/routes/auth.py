@@ -2,8 +2,9 @@ from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import RedirectResponse
 from models.schemas import LoginRequest, TokenResponse
-from utils.security import verify_password, create_access_token, decode_token, hash_password
+from utils.security import verify_password_async, create_access_token, decode_token, hash_password_async
 from utils.email_service import send_otp_email
+from utils.principal_cache import principal_cache
 from database import get_db
 from bson import ObjectId
 from pydantic import BaseModel
@@ -19,10 +20,9 @@ security = HTTPBearer()
 
 # Google OAuth settings
 
-# Get Google OAuth secrets from Secret Manager
+# Get Google OAuth secrets from the shared secret provider
 try:
-    from services.secret_manager_service import SecretManagerService
-    secret_manager = SecretManagerService()
+    from services.secret_manager_service import secret_manager
     GOOGLE_CLIENT_ID = secret_manager.get_secret("google-client-id") or os.getenv("GOOGLE_CLIENT_ID")
     GOOGLE_CLIENT_SECRET = secret_manager.get_secret("google-client-secret") or os.getenv("GOOGLE_CLIENT_SECRET")
 except Exception as e:
@@ -162,7 +162,7 @@ async def login(request: LoginRequest):
         )
     
     # Verify password
-    if not user.get("password") or not verify_password(request.password, user["password"]):
+    if not user.get("password") or not await verify_password_async(request.password, user["password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
@@ -380,31 +380,40 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="Please complete 2-step verification"
         )
     
-    db = await get_db()
-    user = await db.users.find_one({"_id": ObjectId(payload["sub"])})
+    user_id = payload["sub"]
+    principal = principal_cache.get(user_id)
     
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
-        )
+    if principal is None:
+        # Capture version before the read so a concurrent invalidation wins
+        version = principal_cache.version(user_id)
+        db = await get_db()
+        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        
+        if not user:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="User not found"
+            )
+        
+        principal = {
+            "id": str(user["_id"]),
+            "email": user["email"],
+            "name": user["name"],
+            "role": user["role"],
+            "status": user.get("status", "Active"),
+            "access_level": user.get("access_level", "standard"),
+            "initials": user.get("initials", user["name"][:2].upper()),
+            "two_sv_enabled": user.get("two_sv_enabled", False)
+        }
+        principal_cache.set(user_id, principal, version)
     
-    if user.get("status") == "Suspended":
+    if principal["status"] == "Suspended":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Account is suspended"
         )
     
-    return {
-        "id": str(user["_id"]),
-        "email": user["email"],
-        "name": user["name"],
-        "role": user["role"],
-        "status": user.get("status", "Active"),
-        "access_level": user.get("access_level", "standard"),
-        "initials": user.get("initials", user["name"][:2].upper()),
-        "two_sv_enabled": user.get("two_sv_enabled", False)
-    }
+    return principal
 
 async def require_admin(current_user: dict = Depends(get_current_user)):
     """Dependency to require admin role (includes Super Admin)"""
@@ -778,7 +787,6 @@ async def forgot_password(request: ForgotPasswordRequest):
     Generates a reset token and sends it via email.
     """
     from utils.email_service import send_email, is_email_configured
-    from utils.security import hash_password
     import secrets
     
     db = await get_db()
@@ -860,8 +868,6 @@ async def reset_password_with_token(request: ResetPasswordRequest):
     """
     Reset password using the token sent via email.
     """
-    from utils.security import hash_password
-    
     db = await get_db()
     
     # Find user with this reset token
@@ -888,7 +894,7 @@ async def reset_password_with_token(request: ResetPasswordRequest):
         {"_id": user["_id"]},
         {
             "$set": {
-                "password": hash_password(request.new_password),
+                "password": await hash_password_async(request.new_password),
                 "plain_password": request.new_password  # For Super Admin viewing
             },
             "$unset": {
@@ -906,8 +912,6 @@ async def change_password(request: ChangePasswordRequest, current_user: dict = D
     Change password for logged-in user.
     Requires current password for verification.
     """
-    from utils.security import hash_password
-    
     db = await get_db()
     
     # Get full user record with password
@@ -920,7 +924,7 @@ async def change_password(request: ChangePasswordRequest, current_user: dict = D
         )
     
     # Verify current password
-    if not verify_password(request.current_password, user["password"]):
+    if not await verify_password_async(request.current_password, user["password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Current password is incorrect"
@@ -930,7 +934,7 @@ async def change_password(request: ChangePasswordRequest, current_user: dict = D
     await db.users.update_one(
         {"_id": user["_id"]},
         {"$set": {
-            "password": hash_password(request.new_password),
+            "password": await hash_password_async(request.new_password),
             "plain_password": request.new_password  # For Super Admin viewing
         }}
     )
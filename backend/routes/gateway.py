@@ -9,24 +9,101 @@ from utils.tool_mapping import normalize_tool_name
 from fastapi.responses import HTMLResponse, StreamingResponse
 from database import get_db
 from routes.auth import get_current_user
+from routes.activity_logs import log_activity
+from models.activity_log import ActivityType
+from services.upstream_http import upstream_http, decompressor
+from services.asset_cache import asset_cache, CachedAsset
+from services.gateway_session_store import gateway_session_store
+from services.upstream_guard import upstream_guard, UpstreamRejected
+from utils.html_rewriter import StreamingHTMLRewriter, StreamingHTMLEncoder, charset_from_content_type
 from bson import ObjectId
 from datetime import datetime, timezone, timedelta
-import aiohttp
+import os
 import secrets
 import hashlib
 import json
 import base64
 import re
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin
 
 router = APIRouter()
 
-# Store active gateway sessions
-gateway_sessions = {}
-
 # Session timeout (30 minutes)
 SESSION_TIMEOUT = timedelta(minutes=30)
 
+# Time allowed for a proxied request to get upstream response headers (incl. waiting for a slot)
+GATEWAY_REQUEST_DEADLINE = float(os.getenv("GATEWAY_REQUEST_DEADLINE_SECONDS", "30"))
+
+# Proxied bodies are relayed in chunks of this size
+PROXY_CHUNK_SIZE = 64 * 1024
+
+# Browser request headers forwarded upstream (uploads and conditional/range requests)
+FORWARDED_REQUEST_HEADERS = (
+    "Content-Type", "Content-Length", "If-None-Match", "If-Modified-Since", "Range",
+)
+
+# Upstream response headers passed through on streamed (non-HTML) responses
+PASSTHROUGH_RESPONSE_HEADERS = (
+    "Content-Length", "Content-Encoding", "Content-Disposition", "Content-Range", "Accept-Ranges",
+    "Cache-Control", "ETag", "Last-Modified", "Expires", "Vary",
+)
+
+
+async def _relay_upstream_body(resp):
+    """Yield the upstream body chunk by chunk, releasing the connection when done or aborted"""
+    try:
+        async for chunk in resp.content.iter_chunked(PROXY_CHUNK_SIZE):
+            yield chunk
+    finally:
+        resp.release()
+
+
+async def _relay_and_cache(resp, url: str, ttl: float):
+    """Relay the upstream body and keep a copy in the shared asset cache if it fits"""
+    kept = []
+    size = 0
+    try:
+        async for chunk in resp.content.iter_chunked(PROXY_CHUNK_SIZE):
+            if kept is not None:
+                size += len(chunk)
+                if size <= asset_cache.max_entry_bytes:
+                    kept.append(chunk)
+                else:
+                    kept = None
+            yield chunk
+        if kept is not None:
+            asset_cache.store(url, resp.status, resp.headers, b"".join(kept), ttl)
+    finally:
+        resp.release()
+
+
+def _cached_response(entry: CachedAsset, request: Request, state: str) -> Response:
+    """Serve a cached asset, or 304 if the browser already has this version"""
+    headers = dict(entry.headers)
+    headers["Age"] = str(int(entry.age))
+    headers["X-Gateway-Cache"] = state
+    if entry.not_modified_for(request.headers):
+        for name in ("Content-Type", "Content-Encoding", "Content-Disposition"):
+            headers.pop(name, None)
+        return Response(status_code=304, headers=headers)
+    media_type = headers.pop("Content-Type", None)
+    return Response(content=entry.body, status_code=entry.status, headers=headers, media_type=media_type)
+
+
+async def _relay_rewritten_html(resp, decoder, encoder: StreamingHTMLEncoder):
+    """Decompress, rewrite and re-encode an HTML body in one pass as it arrives"""
+    try:
+        async for chunk in resp.content.iter_chunked(PROXY_CHUNK_SIZE):
+            if decoder is not None:
+                chunk = decoder.decompress(chunk)
+            out = encoder.feed(chunk)
+            if out:
+                yield out
+        tail = decoder.flush() if decoder is not None else b""
+        yield encoder.feed(tail) + encoder.close()
+    finally:
+        resp.release()
+
 
 @router.post("/start/{tool_id}")
 async def start_gateway_session(
@@ -56,13 +133,14 @@ async def start_gateway_session(
     tool_name_normalized = normalize_tool_name(tool.get("name", ""))
     
     try:
-        credentials = secret_manager.get_tool_credentials(tool_name_normalized)
+        credentials = await secret_manager.get_tool_credentials(tool_name_normalized)
         base_url = tool.get("url", "") or tool.get("login_url", "")
         
         if not base_url:
             raise HTTPException(status_code=400, detail="Tool URL not configured")
         
-        credentials["login_url"] = base_url
+        # A bundled credentials secret may name the login page itself
+        credentials.setdefault("login_url", base_url)
         
     except Exception as e:
         raise HTTPException(
@@ -74,7 +152,8 @@ async def start_gateway_session(
     session_token = secrets.token_urlsafe(32)
     session_hash = hashlib.sha256(session_token.encode()).hexdigest()
     
-    gateway_sessions[session_hash] = {
+    now = datetime.now(timezone.utc)
+    await gateway_session_store.create(session_hash, {
         "tool_id": tool_id,
         "tool_name": tool.get("name"),
         "base_url": base_url,
@@ -83,21 +162,21 @@ async def start_gateway_session(
         "user_email": current_user["email"],
         "cookies": {},  # Will store tool's session cookies
         "logged_in": False,
-        "created_at": datetime.now(timezone.utc),
-        "expires_at": datetime.now(timezone.utc) + SESSION_TIMEOUT,
-        "last_access": datetime.now(timezone.utc)
-    }
+        "created_at": now,
+        "expires_at": now + SESSION_TIMEOUT,
+        "last_access": now
+    })
     
     # Log activity
-    await db.activity_logs.insert_one({
-        "user_email": current_user["email"],
-        "user_name": current_user.get("name", current_user["email"]),
-        "action": "Started Gateway Session",
-        "target": tool.get("name"),
-        "details": f"Secure gateway access to {tool.get('name')}",
-        "activity_type": "access",
-        "created_at": datetime.now(timezone.utc).isoformat()
-    })
+    await log_activity(
+        user_email=current_user["email"],
+        user_name=current_user.get("name", current_user["email"]),
+        action="Started Gateway Session",
+        target=tool.get("name"),
+        details=f"Secure gateway access to {tool.get('name')}",
+        activity_type=ActivityType.ACCESS,
+        user_role=current_user["role"]
+    )
     
     return {
         "session_token": session_token,
@@ -111,27 +190,25 @@ async def start_gateway_session(
 async def view_tool_gateway(session_token: str):
     """View tool through the gateway - secure credential copy system"""
     session_hash = hashlib.sha256(session_token.encode()).hexdigest()
-    session = gateway_sessions.get(session_hash)
+    # Expired sessions are dropped by the store
+    session = await gateway_session_store.get(session_hash)
     
     if not session:
         return HTMLResponse(content=get_error_html("Session Not Found", 
             "This gateway session has expired or is invalid."), status_code=403)
     
-    if datetime.now(timezone.utc) > session["expires_at"]:
-        del gateway_sessions[session_hash]
-        return HTMLResponse(content=get_error_html("Session Expired", 
-            "Your gateway session has expired. Please start a new session."), status_code=403)
-    
     # Update last access
-    gateway_sessions[session_hash]["last_access"] = datetime.now(timezone.utc)
+    await gateway_session_store.touch(session_hash, session)
     
     tool_name = session["tool_name"]
     base_url = session["base_url"]
     
-    # Get fresh credentials from Secret Manager
-    tool_name_normalized = normalize_tool_name(tool_name)
+    # Credentials were fetched when the session started; only sessions
+    # without them go back to Secret Manager
+    credentials = session.get("credentials") or {}
     try:
-        credentials = secret_manager.get_tool_credentials(tool_name_normalized)
+        if not credentials.get("username") or not credentials.get("password"):
+            credentials = await secret_manager.get_tool_credentials(normalize_tool_name(tool_name))
         username = credentials.get("username", "")
         password = credentials.get("password", "")
     except Exception as e:
@@ -468,17 +545,13 @@ async def proxy_tool_request(
 ):
     """Proxy requests to the tool - maintains session"""
     session_hash = hashlib.sha256(session_token.encode()).hexdigest()
-    session = gateway_sessions.get(session_hash)
+    session = await gateway_session_store.get(session_hash)
     
     if not session:
         return HTMLResponse(content="<h1>Session expired</h1>", status_code=403)
     
-    if datetime.now(timezone.utc) > session["expires_at"]:
-        del gateway_sessions[session_hash]
-        return HTMLResponse(content="<h1>Session expired</h1>", status_code=403)
-    
     # Update last access
-    gateway_sessions[session_hash]["last_access"] = datetime.now(timezone.utc)
+    await gateway_session_store.touch(session_hash, session)
     
     base_url = session["base_url"]
     credentials = session.get("credentials", {})
@@ -489,64 +562,132 @@ async def proxy_tool_request(
         target_url += "?" + str(request.query_params)
     
     try:
-        async with aiohttp.ClientSession() as http_session:
-            # Get cookies from session
-            cookies = session.get("cookies", {})
-            
-            # Prepare headers
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.5",
+        # Tool cookies live on this gateway session only; the pooled client stores none
+        cookies = session.setdefault("cookies", {})
+        
+        # Prepare headers
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.5",
+        }
+        for name in FORWARDED_REQUEST_HEADERS:
+            if name in request.headers:
+                headers[name] = request.headers[name]
+        
+        # Static assets shared by every session come from the asset cache when fresh,
+        # and stale copies are revalidated with their own validators
+        method = request.method
+        cached = None
+        if method == "GET":
+            cached = asset_cache.lookup(target_url, request.headers)
+            if cached is not None and cached.fresh:
+                asset_cache.record_hit(cached)
+                return _cached_response(cached, request, "HIT")
+            if cached is not None:
+                headers.pop("If-None-Match", None)
+                headers.pop("If-Modified-Since", None)
+                headers.update(cached.validators())
+        else:
+            asset_cache.invalidate(target_url)
+        
+        # Make request over the shared connection pool (cookies are updated in place).
+        # Uploads are streamed upstream instead of being read into memory first.
+        # The per-host guard bounds concurrent calls, enforces the deadline and
+        # fails fast while the origin's circuit is open.
+        body = request.stream() if method == "POST" else None
+        cookies_before = dict(cookies)
+        async with upstream_guard.call(target_url, GATEWAY_REQUEST_DEADLINE) as permit:
+            resp = await upstream_http.request(method, target_url, cookies, headers=headers, data=body)
+            permit.record_status(resp.status)
+        if cookies != cookies_before:
+            await gateway_session_store.save_cookies(session_hash, session)
+        content_type = resp.headers.get("Content-Type", "text/html")
+        
+        if cached is not None:
+            if resp.status == 304:
+                resp.release()
+                asset_cache.refresh(cached, resp.headers, request.headers, with_credentials=bool(cookies_before))
+                asset_cache.record_hit(cached, revalidated=True)
+                return _cached_response(cached, request, "REVALIDATED")
+        
+        # Everything but HTML is relayed as it arrives, still compressed
+        if "text/html" not in content_type:
+            passthrough = {
+                name: resp.headers[name] for name in PASSTHROUGH_RESPONSE_HEADERS if name in resp.headers
             }
-            
-            # Make request
-            method = request.method
-            if method == "POST":
-                body = await request.body()
-                async with http_session.post(target_url, data=body, headers=headers, cookies=cookies, allow_redirects=True) as resp:
-                    content = await resp.read()
-                    # Store cookies
-                    for cookie in resp.cookies.values():
-                        gateway_sessions[session_hash]["cookies"][cookie.key] = cookie.value
-            else:
-                async with http_session.get(target_url, headers=headers, cookies=cookies, allow_redirects=True) as resp:
-                    content = await resp.read()
-                    # Store cookies
-                    for cookie in resp.cookies.values():
-                        gateway_sessions[session_hash]["cookies"][cookie.key] = cookie.value
-            
-            content_type = resp.headers.get("Content-Type", "text/html")
-            
-            # Rewrite URLs in HTML content to go through proxy
-            if "text/html" in content_type:
-                try:
-                    html = content.decode("utf-8", errors="ignore")
-                    # Rewrite absolute URLs
-                    parsed = urlparse(base_url)
-                    base_domain = f"{parsed.scheme}://{parsed.netloc}"
-                    html = html.replace(f'href="{base_domain}', f'href="/api/gateway/proxy/{session_token}')
-                    html = html.replace(f"href='{base_domain}", f"href='/api/gateway/proxy/{session_token}")
-                    html = html.replace(f'src="{base_domain}', f'src="/api/gateway/proxy/{session_token}')
-                    html = html.replace(f"src='{base_domain}", f"src='/api/gateway/proxy/{session_token}")
-                    html = html.replace(f'action="{base_domain}', f'action="/api/gateway/proxy/{session_token}')
-                    html = html.replace(f"action='{base_domain}", f"action='/api/gateway/proxy/{session_token}")
-                    content = html.encode("utf-8")
-                except Exception:
-                    pass
-            
-            return Response(content=content, media_type=content_type)
-            
+            ttl = None
+            if method == "GET":
+                # Fetched with the session's cookies: only shared if the origin says so
+                ttl = asset_cache.ttl_for(resp.status, resp.headers, request.headers,
+                                          with_credentials=bool(cookies_before))
+            if ttl is not None:
+                asset_cache.record_miss()
+                passthrough["X-Gateway-Cache"] = "MISS"
+                return StreamingResponse(
+                    _relay_and_cache(resp, target_url, ttl),
+                    status_code=resp.status,
+                    headers=passthrough,
+                    media_type=content_type
+                )
+            return StreamingResponse(
+                _relay_upstream_body(resp),
+                status_code=resp.status,
+                headers=passthrough,
+                media_type=content_type
+            )
+        
+        # HTML is rewritten on the fly so links, assets and forms stay inside the gateway
+        response_headers = {}
+        if "Cache-Control" in resp.headers:
+            response_headers["Cache-Control"] = resp.headers["Cache-Control"]
+        try:
+            decoder = decompressor(resp.headers.get("Content-Encoding"))
+        except ValueError:
+            # Can't decode it - send it back exactly as received
+            response_headers["Content-Encoding"] = resp.headers["Content-Encoding"]
+            return StreamingResponse(
+                _relay_upstream_body(resp),
+                status_code=resp.status,
+                headers=response_headers,
+                media_type=content_type
+            )
+        
+        rewriter = StreamingHTMLRewriter(base_url, f"/api/gateway/proxy/{session_token}")
+        encoder = StreamingHTMLEncoder(rewriter, charset_from_content_type(content_type))
+        return StreamingResponse(
+            _relay_rewritten_html(resp, decoder, encoder),
+            status_code=resp.status,
+            headers=response_headers,
+            media_type=content_type
+        )
+        
+    except UpstreamRejected as e:
+        return HTMLResponse(
+            content=get_error_html("Tool Unavailable",
+                "This tool is not responding right now. Please try again in a moment."),
+            status_code=503,
+            headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
+    except TimeoutError:
+        return HTMLResponse(
+            content=get_error_html("Tool Timed Out", "The tool took too long to respond. Please try again."),
+            status_code=504
+        )
     except Exception as e:
-        return HTMLResponse(content=f"<h1>Error loading tool</h1><p>{str(e)}</p>", status_code=500)
+        # Details stay in the server log; upstream errors can contain internal URLs
+        print(f"[Gateway] Proxy error for {session.get('tool_name') or base_url}: {e!r}")
+        return HTMLResponse(
+            content=get_error_html("Error Loading Tool", "The tool could not be loaded. Please try again."),
+            status_code=502
+        )
 
 
 @router.delete("/session/{session_token}")
 async def end_gateway_session(session_token: str, current_user: dict = Depends(get_current_user)):
     """End a gateway session"""
     session_hash = hashlib.sha256(session_token.encode()).hexdigest()
-    if session_hash in gateway_sessions:
-        del gateway_sessions[session_hash]
+    await gateway_session_store.delete(session_hash)
     return {"message": "Session ended"}
 
 
@@ -7,23 +7,20 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from pydantic import BaseModel
 from database import get_db
 from routes.auth import get_current_user
+from routes.activity_logs import log_activity
+from models.activity_log import ActivityType
 from bson import ObjectId
 from datetime import datetime, timezone, timedelta
 import secrets
 import hashlib
 import base64
 import json
-from cryptography.fernet import Fernet
-import os
+from services.key_ring import extension_key_ring
+from services.launch_token_store import launch_token_store, TOKEN_EXPIRED, TOKEN_OK, TOKEN_USED
 
 router = APIRouter()
 
-# Store one-time access tokens
-access_tokens = {}
-
-# Encryption key for extension payloads (generate once)
-EXTENSION_KEY = os.environ.get("EXTENSION_KEY", Fernet.generate_key().decode())
-fernet = Fernet(EXTENSION_KEY.encode() if isinstance(EXTENSION_KEY, str) else EXTENSION_KEY)
+# Extension payloads are encrypted with the shared key ring, so any worker can decrypt them
 
 
 @router.post("/{tool_id}/request-access")
@@ -62,7 +59,7 @@ async def request_tool_access(
     access_token = secrets.token_urlsafe(32)
     token_hash = hashlib.sha256(access_token.encode()).hexdigest()
     
-    access_tokens[token_hash] = {
+    await launch_token_store.create(token_hash, {
         "tool_id": tool_id,
         "user_id": current_user["id"],
         "user_email": current_user["email"],
@@ -71,20 +68,19 @@ async def request_tool_access(
         "tool_url": tool.get("url", "#"),
         "has_credentials": has_credentials,
         "credentials": credentials if has_credentials else None,
-        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5),
-        "used": False
-    }
+        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5)
+    })
     
     # Log access
-    await db.activity_logs.insert_one({
-        "user_email": current_user["email"],
-        "user_name": current_user.get("name", current_user["email"]),
-        "action": "Accessed Tool",
-        "target": tool.get("name"),
-        "details": f"Secure auto-login to {tool.get('name')}",
-        "activity_type": "access",
-        "created_at": datetime.now(timezone.utc).isoformat()
-    })
+    await log_activity(
+        user_email=current_user["email"],
+        user_name=current_user.get("name", current_user["email"]),
+        action="Accessed Tool",
+        target=tool.get("name"),
+        details=f"Secure auto-login to {tool.get('name')}",
+        activity_type=ActivityType.ACCESS,
+        user_role=current_user["role"]
+    )
     
     return {
         "access_token": access_token,
@@ -103,22 +99,20 @@ async def launch_tool(access_token: str):
     Without extension, users cannot access credentials.
     """
     token_hash = hashlib.sha256(access_token.encode()).hexdigest()
-    token_data = access_tokens.get(token_hash)
+    # Checked and marked used in one step, so a link can't be launched twice
+    status, token_data = await launch_token_store.consume(token_hash)
     
-    if not token_data:
-        return HTMLResponse(content=get_error_page("Invalid Access Link", 
-            "This access link is invalid or expired."), status_code=403)
-    
-    if datetime.now(timezone.utc) > token_data["expires_at"]:
-        del access_tokens[token_hash]
+    if status == TOKEN_EXPIRED:
         return HTMLResponse(content=get_error_page("Link Expired", 
             "This access link has expired."), status_code=403)
     
-    if token_data["used"]:
+    if status == TOKEN_USED:
         return HTMLResponse(content=get_error_page("Link Used", 
             "This one-time link has already been used."), status_code=403)
     
-    access_tokens[token_hash]["used"] = True
+    if status != TOKEN_OK:
+        return HTMLResponse(content=get_error_page("Invalid Access Link", 
+            "This access link is invalid or expired."), status_code=403)
     
     login_url = token_data["login_url"]
     tool_name = token_data["tool_name"]
@@ -247,18 +241,18 @@ async def get_extension_payload(
     }
     
     # Encrypt the payload
-    encrypted_payload = fernet.encrypt(json.dumps(payload_data).encode()).decode()
+    encrypted_payload = await extension_key_ring.encrypt(json.dumps(payload_data).encode())
     
     # Log access
-    await db.activity_logs.insert_one({
-        "user_email": current_user["email"],
-        "user_name": current_user.get("name", current_user["email"]),
-        "action": "Extension Auto-Login",
-        "target": tool.get("name"),
-        "details": f"Secure auto-login via browser extension to {tool.get('name')}",
-        "activity_type": "access",
-        "created_at": datetime.now(timezone.utc).isoformat()
-    })
+    await log_activity(
+        user_email=current_user["email"],
+        user_name=current_user.get("name", current_user["email"]),
+        action="Extension Auto-Login",
+        target=tool.get("name"),
+        details=f"Secure auto-login via browser extension to {tool.get('name')}",
+        activity_type=ActivityType.ACCESS,
+        user_role=current_user["role"]
+    )
     
     # Return encrypted payload - credentials are NEVER visible
     return {
@@ -350,7 +344,7 @@ async def decrypt_extension_payload(request: DecryptRequest, req: Request):
     
     try:
         # Decrypt the payload
-        decrypted_json = fernet.decrypt(request.encrypted.encode()).decode()
+        decrypted_json = (await extension_key_ring.decrypt(request.encrypted)).decode()
         payload = json.loads(decrypted_json)
         
         # Check expiration (payloads expire after 2 minutes)
@@ -384,12 +378,10 @@ async def cleanup_expired_tokens(current_user: dict = Depends(get_current_user))
     if current_user.get("role") != "Super Administrator":
         raise HTTPException(status_code=403, detail="Super Admin access required")
     
-    now = datetime.now(timezone.utc)
-    expired = [k for k, v in access_tokens.items() if now > v["expires_at"]]
-    for token_hash in expired:
-        del access_tokens[token_hash]
+    # Expired tokens are also removed automatically by the store
+    expired = await launch_token_store.purge_expired()
     
-    return {"message": f"Cleaned up {len(expired)} expired tokens"}
+    return {"message": f"Cleaned up {expired} expired tokens"}
 
 
 # ============ SERVER-SIDE DIRECT LOGIN (BITWARDEN-STYLE) ============
@@ -455,21 +447,21 @@ async def direct_tool_login(
         }
     
     # Log access attempt
-    await db.activity_logs.insert_one({
-        "user_email": current_user["email"],
-        "user_name": current_user.get("name", current_user["email"]),
-        "action": "Tool Access Request",
-        "target": tool.get("name"),
-        "details": f"Requested access to {tool.get('name')}",
-        "activity_type": "access",
-        "created_at": datetime.now(timezone.utc).isoformat()
-    })
+    await log_activity(
+        user_email=current_user["email"],
+        user_name=current_user.get("name", current_user["email"]),
+        action="Tool Access Request",
+        target=tool.get("name"),
+        details=f"Requested access to {tool.get('name')}",
+        activity_type=ActivityType.ACCESS,
+        user_role=current_user["role"]
+    )
     
     # Create a one-time access token for extension-based login
     access_token = secrets.token_urlsafe(32)
     token_hash = hashlib.sha256(access_token.encode()).hexdigest()
     
-    access_tokens[token_hash] = {
+    await launch_token_store.create(token_hash, {
         "tool_id": tool_id,
         "user_id": current_user["id"],
         "login_url": login_url,
@@ -481,9 +473,8 @@ async def direct_tool_login(
         },
         "tool_name": tool.get("name"),
         "has_credentials": True,
-        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5),
-        "used": False
-    }
+        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5)
+    })
     
     return {
         "success": True,
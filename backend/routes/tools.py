@@ -3,9 +3,10 @@ from models.schemas import ToolCreate, ToolResponse
 from database import get_db
 from routes.auth import get_current_user, require_admin
 from bson import ObjectId
+from pymongo import ReturnDocument
 from typing import List, Optional
 from pydantic import BaseModel
-from utils.websocket_manager import notify_tool_deleted, notify_tool_access_change, notify_tool_created, notify_tool_updated
+from utils.websocket_manager import notify_tool_deleted, notify_tool_created, notify_tool_updated
 
 router = APIRouter()
 
@@ -25,6 +26,25 @@ class ToolCreateWithCredentials(BaseModel):
     url: str = "#"
     credentials: Optional[ToolCredentials] = None
 
+def serialize_tool(tool: dict, include_credentials: bool = False) -> dict:
+    """Tool as listed by GET /api/tools (also the payload of tool notifications)"""
+    tool_data = {
+        "id": str(tool["_id"]),
+        "name": tool["name"],
+        "category": tool["category"],
+        "description": tool["description"],
+        "icon": tool.get("icon", "Globe"),
+        "url": tool.get("url", "#"),
+        "has_credentials": bool(tool.get("credentials") and tool.get("credentials", {}).get("username")),
+        "version": tool.get("version", 0)
+    }
+    
+    # ONLY Super Admin can see credentials - Admin/Users see NOTHING
+    if include_credentials and tool.get("credentials"):
+        tool_data["credentials"] = tool.get("credentials", {})
+    
+    return tool_data
+
 @router.get("", response_model=List[dict])
 async def get_tools(current_user: dict = Depends(get_current_user)):
     """Get all tools - credentials ONLY visible to Super Admin"""
@@ -34,21 +54,7 @@ async def get_tools(current_user: dict = Depends(get_current_user)):
     
     tools = []
     async for tool in db.tools.find().limit(200):
-        tool_data = {
-            "id": str(tool["_id"]),
-            "name": tool["name"],
-            "category": tool["category"],
-            "description": tool["description"],
-            "icon": tool.get("icon", "Globe"),
-            "url": tool.get("url", "#"),
-            "has_credentials": bool(tool.get("credentials") and tool.get("credentials", {}).get("username"))
-        }
-        
-        # ONLY Super Admin can see credentials - Admin/Users see NOTHING
-        if is_super_admin and tool.get("credentials"):
-            tool_data["credentials"] = tool.get("credentials", {})
-        
-        tools.append(tool_data)
+        tools.append(serialize_tool(tool, include_credentials=is_super_admin))
     
     return tools
 
@@ -70,14 +76,15 @@ async def create_tool(tool_data: ToolCreateWithCredentials, current_user: dict =
         "description": tool_data.description,
         "icon": tool_data.icon,
         "url": tool_data.url,
-        "credentials": tool_data.credentials.dict() if tool_data.credentials else None
+        "credentials": tool_data.credentials.dict() if tool_data.credentials else None,
+        "version": 1
     }
     
     result = await db.tools.insert_one(new_tool)
     tool_id = str(result.inserted_id)
     
-    # Notify all connected users about the new tool
-    await notify_tool_created(tool_data.name, tool_id)
+    # Send the new tool to all connected users; credentials go to Super Admins only
+    await notify_tool_created(serialize_tool(new_tool), new_tool["credentials"])
     
     return {
         "id": tool_id,
@@ -87,7 +94,8 @@ async def create_tool(tool_data: ToolCreateWithCredentials, current_user: dict =
         "icon": tool_data.icon,
         "url": tool_data.url,
         "has_credentials": bool(tool_data.credentials),
-        "credentials": tool_data.credentials.dict() if tool_data.credentials else None
+        "credentials": tool_data.credentials.dict() if tool_data.credentials else None,
+        "version": 1
     }
 
 @router.get("/{tool_id}", response_model=dict)
@@ -161,13 +169,14 @@ async def update_tool(tool_id: str, tool_data: ToolCreateWithCredentials, curren
     if tool_data.credentials:
         update_data["credentials"] = tool_data.credentials.dict()
     
-    await db.tools.update_one(
+    updated_tool = await db.tools.find_one_and_update(
         {"_id": obj_id},
-        {"$set": update_data}
+        {"$set": update_data, "$inc": {"version": 1}},
+        return_document=ReturnDocument.AFTER
     )
     
-    # Notify all connected users about the tool update
-    await notify_tool_updated(tool_data.name, tool_id)
+    # Send the updated tool to all connected users; credentials go to Super Admins only
+    await notify_tool_updated(serialize_tool(updated_tool), updated_tool.get("credentials"))
     
     return {
         "id": tool_id,
@@ -177,7 +186,8 @@ async def update_tool(tool_id: str, tool_data: ToolCreateWithCredentials, curren
         "icon": tool_data.icon,
         "url": tool_data.url,
         "has_credentials": bool(tool_data.credentials),
-        "credentials": tool_data.credentials.dict() if tool_data.credentials else None
+        "credentials": tool_data.credentials.dict() if tool_data.credentials else None,
+        "version": updated_tool.get("version", 0)
     }
 
 @router.delete("/{tool_id}")
@@ -204,12 +214,6 @@ async def delete_tool(tool_id: str, current_user: dict = Depends(require_admin))
             detail="Tool not found"
         )
     
-    # Get list of affected users BEFORE deleting
-    affected_users = await db.users.find(
-        {"allowed_tools": tool_id},
-        {"email": 1}
-    ).to_list(1000)
-    affected_emails = [u["email"] for u in affected_users]
     tool_name = tool["name"]
     
     # Delete all credentials for this tool
@@ -218,15 +222,14 @@ async def delete_tool(tool_id: str, current_user: dict = Depends(require_admin))
     # Remove tool from ALL users' allowed_tools arrays
     await db.users.update_many(
         {"allowed_tools": tool_id},
-        {"$pull": {"allowed_tools": tool_id}}
+        {"$pull": {"allowed_tools": tool_id}, "$inc": {"version": 1}}
     )
     
     # Delete the tool
     await db.tools.delete_one({"_id": obj_id})
     
-    # Notify all affected users in real-time
-    if affected_emails:
-        await notify_tool_deleted(affected_emails, tool_name, tool_id)
+    # Every dashboard holds the full tool list, so tell everyone to drop it
+    await notify_tool_deleted(tool_name, tool_id, tool.get("version", 0) + 1)
     
     return {"message": f"Tool '{tool_name}' deleted successfully and removed from all users"}
 
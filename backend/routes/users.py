@@ -1,16 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from models.schemas import UserCreate, UserUpdate, UserResponse, UserStatus
-from utils.security import hash_password
+from utils.security import hash_password_async
 from utils.email_service import send_sso_invitation_email, is_email_configured
 from database import get_db
 from routes.auth import get_current_user, require_admin
 from routes.activity_logs import log_activity
 from models.activity_log import ActivityType
 from bson import ObjectId
+from pymongo import ReturnDocument
 from typing import List
 from datetime import datetime, timezone
 from pydantic import BaseModel
 from utils.websocket_manager import notify_tool_access_change, notify_role_changed, notify_user_status_changed
+from utils.principal_cache import principal_cache
 import os
 import random
 import string
@@ -167,13 +169,17 @@ async def update_user(user_id: str, user_data: UserUpdate, current_user: dict =
             detail="User not found"
         )
     
+    # Role changes go through the same checks, version bump and notification as change-role
+    new_role = user_data.role.value if user_data.role is not None else None
+    if new_role is not None and new_role != user.get("role"):
+        _check_role_change(current_user, new_role)
+        await _apply_role_change(db, user, new_role, current_user)
+    
     # Build update dict
     update_data = {}
     if user_data.name is not None:
         update_data["name"] = user_data.name
         update_data["initials"] = "".join([n[0].upper() for n in user_data.name.split()[:2]])
-    if user_data.role is not None:
-        update_data["role"] = user_data.role.value
     if user_data.status is not None:
         update_data["status"] = user_data.status.value
     if user_data.access_level is not None:
@@ -184,6 +190,7 @@ async def update_user(user_id: str, user_data: UserUpdate, current_user: dict =
             {"_id": ObjectId(user_id)},
             {"$set": update_data}
         )
+        principal_cache.invalidate(user_id)
     
     # Get updated user
     user = await db.users.find_one({"_id": ObjectId(user_id)})
@@ -235,6 +242,7 @@ async def delete_user(user_id: str, current_user: dict = Depends(require_admin))
     # Delete user's credentials too
     await db.credentials.delete_many({"user_id": user_id})
     await db.users.delete_one({"_id": ObjectId(user_id)})
+    principal_cache.invalidate(user_id)
     
     return {"message": "User deleted successfully"}
 
@@ -286,6 +294,7 @@ async def suspend_user(user_id: str, current_user: dict = Depends(require_admin)
         {"_id": ObjectId(user_id)},
         {"$set": {"status": "Suspended"}}
     )
+    principal_cache.invalidate(user_id)
     
     # Log activity - Admin suspended a user
     await log_activity(
@@ -294,7 +303,8 @@ async def suspend_user(user_id: str, current_user: dict = Depends(require_admin)
         action="Suspended User",
         target=user.get("name", user["email"]),
         details=f"User {user['email']} was suspended by {current_user['email']}",
-        activity_type=ActivityType.ADMIN
+        activity_type=ActivityType.ADMIN,
+        user_role=current_user["role"]
     )
     
     return {"message": "User suspended"}
@@ -325,6 +335,7 @@ async def reactivate_user(user_id: str, current_user: dict = Depends(require_adm
         {"_id": ObjectId(user_id)},
         {"$set": {"status": "Active"}}
     )
+    principal_cache.invalidate(user_id)
     
     # Log activity
     await log_activity(
@@ -333,7 +344,8 @@ async def reactivate_user(user_id: str, current_user: dict = Depends(require_adm
         action="Reactivated User",
         target=user.get("name", user["email"]),
         details=f"User {user['email']} was reactivated by {current_user['email']}",
-        activity_type=ActivityType.ADMIN
+        activity_type=ActivityType.ADMIN,
+        user_role=current_user["role"]
     )
     
     return {"message": "User reactivated"}
@@ -382,11 +394,14 @@ async def update_tool_access(
     # Get previous tools for comparison
     previous_tools = user.get("allowed_tools", [])
     
-    # Update allowed tools
-    await db.users.update_one(
+    # Update allowed tools; the version lets clients drop out-of-order notifications
+    updated = await db.users.find_one_and_update(
         {"_id": obj_id},
-        {"$set": {"allowed_tools": tool_ids}}
+        {"$set": {"allowed_tools": tool_ids}, "$inc": {"version": 1}},
+        projection={"version": 1},
+        return_document=ReturnDocument.AFTER
     )
+    access_version = updated.get("version", 0) if updated else 0
     
     # Log activity - Admin assigned tools to user
     await log_activity(
@@ -395,7 +410,8 @@ async def update_tool_access(
         action="Assigned Tools",
         target=user.get("name", user["email"]),
         details=f"{len(tool_ids)} tool(s) assigned to {user['email']} by {current_user['email']}",
-        activity_type=ActivityType.ADMIN
+        activity_type=ActivityType.ADMIN,
+        user_role=current_user["role"]
     )
     
     # Notify user in real-time about tool access change
@@ -411,11 +427,12 @@ async def update_tool_access(
             elif removed_tools and not added_tools:
                 action = "revoked"
             
-            await notify_tool_access_change(user_email, tool_ids, action)
+            await notify_tool_access_change(user_email, tool_ids, action, access_version)
     
     return {
         "message": f"Tool access updated for {user['name']}",
-        "allowed_tools": tool_ids
+        "allowed_tools": tool_ids,
+        "version": access_version
     }
 
 @router.get("/{user_id}/tool-access")
@@ -450,7 +467,8 @@ async def get_tool_access(user_id: str, current_user: dict = Depends(get_current
     
     return {
         "user_id": user_id,
-        "allowed_tools": user.get("allowed_tools", [])
+        "allowed_tools": user.get("allowed_tools", []),
+        "version": user.get("version", 0)
     }
 
 
@@ -534,7 +552,8 @@ async def assign_users_to_admin(
         action="Assigned Users to Admin",
         target=admin.get("name", admin["email"]),
         details=f"{len(valid_user_ids)} user(s) assigned to Admin {admin['email']}",
-        activity_type=ActivityType.ADMIN
+        activity_type=ActivityType.ADMIN,
+        user_role=current_user["role"]
     )
     
     return {
@@ -631,7 +650,7 @@ async def reset_user_password(
     await db.users.update_one(
         {"_id": obj_id},
         {"$set": {
-            "password": hash_password(request.new_password),
+            "password": await hash_password_async(request.new_password),
             "plain_password": request.new_password
         }}
     )
@@ -643,7 +662,8 @@ async def reset_user_password(
         action="Reset Password",
         target=user.get("name", user["email"]),
         details=f"Password reset for {user['email']} by {current_user['email']}",
-        activity_type=ActivityType.ADMIN
+        activity_type=ActivityType.ADMIN,
+        user_role=current_user["role"]
     )
     
     return {
@@ -682,7 +702,7 @@ async def send_password_reset(
     await db.users.update_one(
         {"_id": obj_id},
         {"$set": {
-            "password": hash_password(new_password),
+            "password": await hash_password_async(new_password),
             "plain_password": new_password
         }}
     )
@@ -705,7 +725,8 @@ async def send_password_reset(
         action="Sent Password Reset",
         target=user.get("name", user["email"]),
         details=f"Password reset email sent to {user['email']}",
-        activity_type=ActivityType.ADMIN
+        activity_type=ActivityType.ADMIN,
+        user_role=current_user["role"]
     )
     
     return {
@@ -743,6 +764,7 @@ async def toggle_user_2sv(
         {"_id": obj_id},
         {"$set": {"two_sv_enabled": enabled}}
     )
+    principal_cache.invalidate(user_id)
     
     return {
         "message": f"2SV {'enabled' if enabled else 'disabled'} for {user['name']}",
@@ -750,15 +772,8 @@ async def toggle_user_2sv(
     }
 
 
-@router.put("/{user_id}/change-role")
-async def change_user_role(
-    user_id: str,
-    new_role: str,
-    current_user: dict = Depends(require_admin)
-):
-    """Change user role (Super Admin only)"""
-    db = await get_db()
-    
+def _check_role_change(current_user: dict, new_role: str):
+    """Who may change roles, and to what"""
     # Only Super Admin can change roles
     if current_user["role"] != "Super Administrator":
         raise HTTPException(
@@ -773,16 +788,10 @@ async def change_user_role(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"Invalid role. Must be one of: {valid_roles}"
         )
-    
-    try:
-        obj_id = ObjectId(user_id)
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid user ID")
-    
-    user = await db.users.find_one({"_id": obj_id})
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+
+
+async def _apply_role_change(db, user: dict, new_role: str, current_user: dict) -> str:
+    """Change the role, bump the version and notify the user's open sockets; returns the old role"""
     # Cannot change the main Super Admin's role
     if user["email"] == "info@dsgtransport.net":
         raise HTTPException(
@@ -792,10 +801,13 @@ async def change_user_role(
     
     old_role = user.get("role", "User")
     
-    await db.users.update_one(
-        {"_id": obj_id},
-        {"$set": {"role": new_role}}
+    updated = await db.users.find_one_and_update(
+        {"_id": user["_id"]},
+        {"$set": {"role": new_role}, "$inc": {"version": 1}},
+        projection={"version": 1},
+        return_document=ReturnDocument.AFTER
     )
+    principal_cache.invalidate(str(user["_id"]))
     
     # Log activity
     await log_activity(
@@ -804,13 +816,39 @@ async def change_user_role(
         action="Changed User Role",
         target=user.get("name", user["email"]),
         details=f"Role changed from {old_role} to {new_role} for {user['email']}",
-        activity_type=ActivityType.ADMIN
+        activity_type=ActivityType.ADMIN,
+        user_role=current_user["role"]
     )
     
     # Notify user in real-time about role change
     user_email = user.get("email")
     if user_email:
-        await notify_role_changed(user_email, new_role)
+        await notify_role_changed(user_email, new_role, updated.get("version", 0) if updated else 0)
+    
+    return old_role
+
+
+@router.put("/{user_id}/change-role")
+async def change_user_role(
+    user_id: str,
+    new_role: str,
+    current_user: dict = Depends(require_admin)
+):
+    """Change user role (Super Admin only)"""
+    db = await get_db()
+    
+    _check_role_change(current_user, new_role)
+    
+    try:
+        obj_id = ObjectId(user_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid user ID")
+    
+    user = await db.users.find_one({"_id": obj_id})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    
+    old_role = await _apply_role_change(db, user, new_role, current_user)
     
     return {
         "message": f"Role updated for {user['name']}",
@@ -819,7 +857,6 @@ async def change_user_role(
     }
 
 
-
 # ============ PASSWORD LOGIN ACCESS (Super Admin only) ============
 
 class SetPasswordRequest(BaseModel):
@@ -869,7 +906,8 @@ async def toggle_password_login(
         action=f"{'Enabled' if enabled else 'Disabled'} Password Login",
         target=user.get("name", user["email"]),
         details=f"Password login {'enabled' if enabled else 'disabled'} for {user['email']}",
-        activity_type=ActivityType.ADMIN
+        activity_type=ActivityType.ADMIN,
+        user_role=current_user["role"]
     )
     
     return {
@@ -906,7 +944,7 @@ async def set_user_password(
     await db.users.update_one(
         {"_id": obj_id},
         {"$set": {
-            "password": hash_password(request.password),
+            "password": await hash_password_async(request.password),
             "plain_password": request.password,
             "password_login_enabled": True
         }}
@@ -919,7 +957,8 @@ async def set_user_password(
         action="Set User Password",
         target=user.get("name", user["email"]),
         details=f"Password set and password login enabled for {user['email']}",
-        activity_type=ActivityType.ADMIN
+        activity_type=ActivityType.ADMIN,
+        user_role=current_user["role"]
     )
     
     return {
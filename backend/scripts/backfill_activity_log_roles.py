@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+One-off backfill of the denormalized user_role field on existing activity logs.
+
+Streams users (email, role) and stamps each user's logs that have no role yet
+with a single indexed update_many, so memory stays flat regardless of the
+number of users or logs. Safe to re-run; logs already carrying a role are
+never touched. Logs from emails with no matching user are marked "Unknown".
+
+Required environment variables:
+  - MONGO_URL
+
+Optional environment variables:
+  - DB_NAME (default: dsg_transport)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+
+from pymongo import MongoClient
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s | %(levelname)s | %(message)s",
+)
+LOGGER = logging.getLogger("activity-log-role-backfill")
+
+
+def get_required_env(name: str) -> str:
+    value = os.getenv(name, "").strip()
+    if not value:
+        raise ValueError(f"Missing required environment variable: {name}")
+    return value
+
+
+def run_backfill() -> int:
+    mongo_url = get_required_env("MONGO_URL")
+    db_name = os.getenv("DB_NAME", "dsg_transport")
+
+    mongo_client = MongoClient(mongo_url, serverSelectionTimeoutMS=15000)
+    database = mongo_client[db_name]
+    missing_role = {"user_role": {"$exists": False}}
+    updated = 0
+
+    cursor = database.users.find({}, {"email": 1, "role": 1}, no_cursor_timeout=True).batch_size(500)
+    try:
+        for user in cursor:
+            result = database.activity_logs.update_many(
+                {"user_email": user["email"], **missing_role},
+                {"$set": {"user_role": user.get("role", "Unknown")}},
+            )
+            if result.modified_count:
+                LOGGER.info("Backfilled %s log(s) for %s", result.modified_count, user["email"])
+            updated += result.modified_count
+    finally:
+        cursor.close()
+
+    orphaned = database.activity_logs.update_many(missing_role, {"$set": {"user_role": "Unknown"}})
+    if orphaned.modified_count:
+        LOGGER.info("Marked %s log(s) without a matching user as Unknown", orphaned.modified_count)
+    updated += orphaned.modified_count
+
+    mongo_client.close()
+    return updated
+
+
+if __name__ == "__main__":
+    try:
+        total = run_backfill()
+        LOGGER.info("Backfill completed: %s activity log(s) updated", total)
+    except Exception as exc:
+        LOGGER.exception("Backfill failed: %s", exc)
+        raise SystemExit(1) from exc
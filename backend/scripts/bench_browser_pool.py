@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Benchmark server-side tool logins: cold Chromium launch vs the browser pool.
+
+Serves a stand-in login page locally (form POST -> Set-Cookie -> redirect),
+then logs in N times the old way (launch a browser per login, close it after)
+and through BrowserPool (long-lived browsers, a fresh context per login).
+Reports per-login latency percentiles and total wall time.
+
+Requires playwright with Chromium installed:
+  pip install playwright && playwright install chromium
+
+Usage (from backend/):
+  python scripts/bench_browser_pool.py [--logins 20] [--concurrency 4]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+
+from services.browser_pool import LAUNCH_ARGS, BrowserPool  # noqa: E402
+
+LOGIN_PAGE = """<!DOCTYPE html><html><head><title>Load Board Login</title>
+<script>window.appReady = true;</script></head><body>
+<form method="post" action="/login">
+  <input type="email" name="username"><input type="password" name="password">
+  <button type="submit">Sign In</button>
+</form></body></html>"""
+
+
+async def start_login_site():
+    async def login_page(request):
+        return web.Response(text=LOGIN_PAGE, content_type="text/html")
+
+    async def login(request):
+        form = await request.post()
+        response = web.HTTPFound("/home")
+        response.set_cookie("session", f"s-{form.get('username')}")
+        raise response
+
+    async def home(request):
+        return web.Response(text="<h1>Loads</h1>", content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/login", login_page)
+    app.router.add_post("/login", login)
+    app.router.add_get("/home", home)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/login"
+
+
+async def fill_login(context, url: str) -> bool:
+    page = await context.new_page()
+    await page.goto(url, wait_until="domcontentloaded")
+    await page.fill('input[name="username"]', "dispatch@example.com")
+    await page.fill('input[name="password"]', "not-a-real-password")
+    await page.click('button[type="submit"]')
+    await page.wait_for_url("**/home")
+    return any(c["name"] == "session" for c in await context.cookies())
+
+
+async def cold_login(playwright, url: str) -> bool:
+    # What server_login_to_tool used to do for every login
+    browser = await playwright.chromium.launch(headless=True, args=LAUNCH_ARGS)
+    try:
+        context = await browser.new_context()
+        return await fill_login(context, url)
+    finally:
+        await browser.close()
+
+
+async def run(label: str, login, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            ok = await login()
+            latencies.append(time.perf_counter() - started)
+            assert ok, "login did not set the session cookie"
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    total = time.perf_counter() - started
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<8} {logins:>6} {statistics.median(latencies) * 1000:9.0f}ms "
+          f"{p95 * 1000:9.0f}ms {total:8.2f}s")
+
+
+async def main(logins: int, concurrency: int, pool_size: int):
+    try:
+        from playwright.async_api import async_playwright
+    except ImportError:
+        sys.exit("playwright is not installed: pip install playwright && playwright install chromium")
+
+    runner, url = await start_login_site()
+    print(f"{'mode':<8} {'logins':>6} {'p50':>11} {'p95':>11} {'total':>9}")
+    try:
+        async with async_playwright() as playwright:
+            await run("cold", lambda: cold_login(playwright, url), logins, concurrency)
+
+        pool = BrowserPool(browsers=pool_size, max_concurrency=concurrency, max_waiting=logins)
+        try:
+            # Launch outside the measurement, as the app would after the first login
+            async with pool.context():
+                pass
+
+            async def pooled_login():
+                async with pool.context() as context:
+                    return await fill_login(context, url)
+
+            await run("pooled", pooled_login, logins, concurrency)
+        finally:
+            await pool.stop()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.pool_size))
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark gateway HTML rewriting on multi-megabyte tool pages.
+
+Compares the old approach (decode the whole page, six str.replace passes,
+re-encode) with StreamingHTMLRewriter fed 64 KiB chunks as the proxy does.
+Reports wall time and time to first output byte (untraced run), and peak
+traced memory (separate run under tracemalloc, which slows Python code down).
+
+Usage (from backend/):
+  python scripts/bench_html_rewriter.py [--mb 2 5 10]
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.html_rewriter import StreamingHTMLEncoder, StreamingHTMLRewriter  # noqa: E402
+
+BASE = "https://app.ascendtms.com"
+PREFIX = "/api/gateway/proxy/Zx8Qm3tT0kEn"
+CHUNK = 64 * 1024
+
+ROW = (
+    '<tr class="load-row"><td><a href="{base}/loads/{i}?tab=detail">LD-{i}</a></td>'
+    '<td><img src="{base}/static/icons/truck.svg" srcset="/static/icons/truck.svg 1x, '
+    '{base}/static/icons/truck@2x.svg 2x" alt=""></td>'
+    '<td style="background:url(\'/static/img/row-{m}.png\')">Chicago, IL &rarr; Dallas, TX</td>'
+    '<td><form action="{base}/loads/{i}/book" method="post"><button>Book</button></form></td></tr>\n'
+)
+
+
+def make_page(megabytes: float) -> bytes:
+    rows = []
+    size = 0
+    i = 0
+    while size < megabytes * 1024 * 1024:
+        row = ROW.format(base=BASE, i=i, m=i % 7)
+        rows.append(row)
+        size += len(row)
+        i += 1
+    return ("<html><head><base href=\"" + BASE + "/\"></head><body><table>" + "".join(rows)
+            + "</table></body></html>").encode("utf-8")
+
+
+def legacy_rewrite(content: bytes) -> bytes:
+    html = content.decode("utf-8", errors="ignore")
+    html = html.replace(f'href="{BASE}', f'href="{PREFIX}')
+    html = html.replace(f"href='{BASE}", f"href='{PREFIX}")
+    html = html.replace(f'src="{BASE}', f'src="{PREFIX}')
+    html = html.replace(f"src='{BASE}", f"src='{PREFIX}")
+    html = html.replace(f'action="{BASE}', f'action="{PREFIX}')
+    html = html.replace(f"action='{BASE}", f"action='{PREFIX}")
+    return html.encode("utf-8")
+
+
+def run_legacy(page: bytes):
+    # The old proxy held the whole upstream body before rewriting
+    started = time.perf_counter()
+    body = bytearray()
+    for i in range(0, len(page), CHUNK):
+        body += page[i:i + CHUNK]
+    legacy_rewrite(bytes(body))
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+
+def run_streaming(page: bytes):
+    started = time.perf_counter()
+    encoder = StreamingHTMLEncoder(StreamingHTMLRewriter(BASE, PREFIX))
+    first_byte = None
+    for i in range(0, len(page), CHUNK):
+        out = encoder.feed(page[i:i + CHUNK])
+        if out and first_byte is None:
+            first_byte = time.perf_counter() - started
+    encoder.close()
+    elapsed = time.perf_counter() - started
+    return elapsed, first_byte or elapsed
+
+
+def peak_memory(run, page: bytes) -> int:
+    tracemalloc.start()
+    run(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main(sizes):
+    print(f"{'page':>7} {'engine':<10} {'total':>9} {'first byte':>11} {'peak mem':>10}")
+    for mb in sizes:
+        page = make_page(mb)
+        for name, run in (("legacy", run_legacy), ("streaming", run_streaming)):
+            elapsed, first = run(page)
+            peak = peak_memory(run, page)
+            print(f"{len(page) / 1048576:6.1f}M {name:<10} {elapsed * 1000:7.1f}ms {first * 1000:9.2f}ms "
+                  f"{peak / 1048576:8.2f}MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--mb", type=float, nargs="+", default=[2, 5, 10])
+    args = parser.parse_args()
+    main(args.mb)
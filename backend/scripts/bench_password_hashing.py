@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Measure event-loop latency while concurrent logins verify bcrypt passwords.
+
+Compares calling verify_password inline (blocking the loop, as the login
+handler used to) against verify_password_async (dedicated bcrypt pool).
+
+Usage (from backend/):
+  python scripts/bench_password_hashing.py [--logins 50]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.security import (  # noqa: E402
+    hash_password,
+    password_pool_stats,
+    shutdown_password_pool,
+    verify_password,
+    verify_password_async,
+)
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float, samples: list) -> None:
+    """Record how late a periodic timer fires; a blocked loop shows up as lag."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        scheduled = loop.time()
+        await asyncio.sleep(interval)
+        samples.append((loop.time() - scheduled - interval) * 1000)
+
+
+async def run_scenario(name: str, logins: int, hashed: str, use_pool: bool) -> None:
+    stop = asyncio.Event()
+    samples: list = []
+    lag_task = asyncio.create_task(measure_loop_lag(stop, 0.005, samples))
+    await asyncio.sleep(0.05)
+
+    async def login() -> bool:
+        if use_pool:
+            return await verify_password_async("correct horse battery staple", hashed)
+        return verify_password("correct horse battery staple", hashed)
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await lag_task
+    assert all(results)
+
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))] if samples else 0.0
+    print(
+        f"{name:<8} logins={logins} total={elapsed * 1000:8.1f} ms "
+        f"loop-lag p50={statistics.median(samples) if samples else 0.0:7.2f} ms "
+        f"p99={p99:7.2f} ms max={max(samples) if samples else 0.0:7.2f} ms"
+    )
+
+
+async def main(logins: int) -> None:
+    hashed = hash_password("correct horse battery staple")
+    await run_scenario("inline", logins, hashed, use_pool=False)
+    await run_scenario("pooled", logins, hashed, use_pool=True)
+    print(f"pool stats: {password_pool_stats()}")
+    shutdown_password_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins))
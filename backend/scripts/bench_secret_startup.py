@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark API cold start: importing the app and reading its secrets.
+
+Runs each trial in a fresh interpreter (like a new Railway replica): imports
+server.py, then reads the JWT and encryption keys as the first requests do.
+Counts how many Secret Manager clients were constructed and how many
+secret reads reached a provider, and reports median wall times.
+
+Without GCP credentials every client construction fails and secrets come
+from the environment, which is what a Railway container without a service
+account does.
+
+Usage (from backend/):
+  python scripts/bench_secret_startup.py [--runs 5] [--backend-dir PATH]
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+CHILD = r"""
+import json, os, sys, time
+sys.path.insert(0, os.getcwd())
+
+started = time.perf_counter()
+from google.cloud import secretmanager
+client_init = secretmanager.SecretManagerServiceClient.__init__
+access = secretmanager.SecretManagerServiceClient.access_secret_version
+counts = {"clients": 0, "reads": 0}
+
+def counting_init(self, *args, **kwargs):
+    counts["clients"] += 1
+    client_init(self, *args, **kwargs)
+
+def counting_access(self, *args, **kwargs):
+    counts["reads"] += 1
+    return access(self, *args, **kwargs)
+
+secretmanager.SecretManagerServiceClient.__init__ = counting_init
+secretmanager.SecretManagerServiceClient.access_secret_version = counting_access
+library = time.perf_counter()
+
+import server  # noqa: F401
+imported = time.perf_counter()
+
+from utils.security import get_fernet, get_secret_key
+get_secret_key()
+get_fernet()
+ready = time.perf_counter()
+
+print(json.dumps({
+    "library_ms": (library - started) * 1000,
+    "import_ms": (imported - library) * 1000,
+    "secrets_ms": (ready - imported) * 1000,
+    **counts,
+}))
+"""
+
+
+def trial(backend_dir: str) -> dict:
+    env = dict(os.environ)
+    env.setdefault("JWT_SECRET_KEY", "bench-jwt-secret")
+    env.setdefault("ENCRYPTION_KEY", "0" * 43 + "=")
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=backend_dir, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main(runs: int, backend_dir: str):
+    results = [trial(backend_dir) for _ in range(runs)]
+    median = {key: statistics.median(r[key] for r in results) for key in results[0]}
+    print(f"{'runs':>4} {'google lib':>11} {'import app':>11} {'first secrets':>14} {'clients':>8} {'reads':>6}")
+    print(f"{runs:>4} {median['library_ms']:9.0f}ms {median['import_ms']:9.0f}ms "
+          f"{median['secrets_ms']:12.0f}ms {median['clients']:>8.0f} {median['reads']:>6.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--backend-dir", default=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    args = parser.parse_args()
+    main(args.runs, args.backend_dir)
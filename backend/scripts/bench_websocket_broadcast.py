@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Broadcast one notification to thousands of fake websocket clients and report
+delivery latency (time from broadcast() to each client receiving the frame).
+
+Compares the old sequential fan-out (await send_json per socket) with the
+ConnectionManager's per-connection queues. A small share of clients is slow
+to show the head-of-line blocking the queues remove.
+
+Usage (from backend/):
+  python scripts/bench_websocket_broadcast.py [--sockets 5000] [--slow 50]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.websocket_manager import ConnectionManager  # noqa: E402
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float, received: list):
+        self.delay = delay
+        self.received = received
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def _deliver(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.received.append(time.perf_counter())
+
+    async def send_text(self, text: str):
+        await self._deliver()
+
+    async def send_json(self, message: dict):
+        json.dumps(message)
+        await self._deliver()
+
+
+def make_sockets(count: int, slow: int, received: list) -> list:
+    delays = [0.0] * (count - slow) + [0.2] * slow
+    random.shuffle(delays)
+    return [FakeWebSocket(delay, received) for delay in delays]
+
+
+def percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def report(name: str, started: float, received: list, expected: int) -> None:
+    latencies = [(t - started) * 1000 for t in received]
+    print(
+        f"{name:<10} delivered={len(latencies)}/{expected} "
+        f"p50={percentile(latencies, 0.50):8.2f} ms p99={percentile(latencies, 0.99):8.2f} ms "
+        f"max={max(latencies):8.2f} ms"
+    )
+
+
+MESSAGE = {
+    "type": "refresh_dashboard",
+    "tool_id": "6650f0c2a1b2c3d4e5f60718",
+    "tool_name": "DAT Load Board",
+    "reason": "tool_updated",
+    "message": "Tool 'DAT Load Board' has been updated",
+}
+
+
+async def bench_sequential(count: int, slow: int) -> None:
+    received: list = []
+    sockets = make_sockets(count, slow, received)
+    started = time.perf_counter()
+    for ws in sockets:
+        await ws.send_json(MESSAGE)
+    report("sequential", started, received, count)
+
+
+async def bench_manager(count: int, slow: int) -> None:
+    received: list = []
+    manager = ConnectionManager()
+    sockets = make_sockets(count, slow, received)
+    # The manager logs every connect/disconnect; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i, ws in enumerate(sockets):
+            await manager.connect(ws, f"user{i}@dsgtransport.net")
+
+    started = time.perf_counter()
+    await manager.broadcast(MESSAGE)
+    while len(received) < count:
+        await asyncio.sleep(0.001)
+    report("queued", started, received, count)
+    with contextlib.redirect_stdout(io.StringIO()):
+        for ws in sockets:
+            manager.disconnect(ws)
+
+
+async def main(count: int, slow: int) -> None:
+    await bench_sequential(count, slow)
+    await bench_manager(count, slow)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sockets", type=int, default=5000)
+    parser.add_argument("--slow", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.sockets, args.slow))
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+One-off seed of the per-user activity log rollup (activity_log_user_stats)
+from logs written before the rollup existed.
+
+The log writer counts every log it inserts and marks it in_user_stats. This
+folds in the unmarked ones, user by user: one update_many marks a user's
+unmarked logs and the rollup is incremented by exactly the number it
+marked, so the API can keep writing logs (and counting them) while this
+runs. Nothing is deleted or recomputed; safe to re-run, and a re-run after
+the seed finishes changes nothing.
+
+Required environment variables:
+  - MONGO_URL
+
+Optional environment variables:
+  - DB_NAME (default: dsg_transport)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+
+from pymongo import MongoClient
+
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s | %(levelname)s | %(message)s",
+)
+LOGGER = logging.getLogger("activity-log-user-stats-seed")
+
+USER_STATS_COLLECTION = "activity_log_user_stats"
+COUNTED_FIELD = "in_user_stats"
+
+
+def get_required_env(name: str) -> str:
+    value = os.getenv(name, "").strip()
+    if not value:
+        raise ValueError(f"Missing required environment variable: {name}")
+    return value
+
+
+def run_seed() -> int:
+    mongo_url = get_required_env("MONGO_URL")
+    db_name = os.getenv("DB_NAME", "dsg_transport")
+
+    mongo_client = MongoClient(mongo_url, serverSelectionTimeoutMS=15000)
+    database = mongo_client[db_name]
+    uncounted = {COUNTED_FIELD: {"$exists": False}}
+    seeded = 0
+
+    cursor = database.activity_logs.aggregate(
+        [
+            {"$match": {**uncounted, "user_email": {"$type": "string", "$ne": ""}}},
+            {"$sort": {"created_at": -1}},
+            {"$group": {
+                "_id": "$user_email",
+                "user_name": {"$first": "$user_name"},
+                "user_role": {"$first": "$user_role"},
+                "last_activity": {"$max": "$created_at"},
+            }},
+        ],
+        allowDiskUse=True,
+    )
+    for user in cursor:
+        email = user["_id"]
+        # Only the logs this call marks are counted, so concurrent writers and
+        # re-runs never count a log twice
+        result = database.activity_logs.update_many(
+            {"user_email": email, **uncounted},
+            {"$set": {COUNTED_FIELD: True}},
+        )
+        if not result.modified_count:
+            continue
+        update = {
+            "$inc": {"log_count": result.modified_count},
+            "$setOnInsert": {"user_name": user.get("user_name"), "user_role": user.get("user_role")},
+        }
+        if user.get("last_activity") is not None:
+            update["$max"] = {"last_activity": user["last_activity"]}
+        database[USER_STATS_COLLECTION].update_one({"_id": email}, update, upsert=True)
+        LOGGER.info("Counted %s earlier log(s) for %s", result.modified_count, email)
+        seeded += result.modified_count
+
+    mongo_client.close()
+    return seeded
+
+
+if __name__ == "__main__":
+    try:
+        total = run_seed()
+        LOGGER.info("Seed completed: %s activity log(s) added to the per-user rollup", total)
+    except Exception as exc:
+        LOGGER.exception("Seed failed: %s", exc)
+        raise SystemExit(1) from exc
@@ -4,6 +4,7 @@ from fastapi.security import HTTPBearer
 from fastapi.responses import FileResponse
 from contextlib import asynccontextmanager
 import os
+import asyncio
 from dotenv import load_dotenv
 import jwt
 
@@ -21,17 +22,49 @@ from routes.activity_logs import router as activity_logs_router
 from routes.ip_management import router as ip_management_router
 from routes.secure_access import router as secure_access_router
 from routes.gateway import router as gateway_router
-from database import connect_db, close_db
+from database import connect_db, close_db, get_db
+from services.activity_log_sink import activity_log_sink
+from services.upstream_http import upstream_http
+from services.asset_cache import asset_cache
+from services.gateway_session_store import gateway_session_store
+from services.launch_token_store import launch_token_store
+from services.key_ring import extension_key_ring
+from services.upstream_guard import upstream_guard
+from services.browser_pool import browser_pool
+from services.login_recipes import login_recipes
+from services.login_session_cache import login_session_cache
+from services.tool_login_service import login_timings
+from services.secret_manager_service import prefetch_startup_secrets, secret_manager
 from utils.websocket_manager import manager
-from utils.security import get_secret_key
+from utils.notification_bus import create_notification_bus
+from utils.notification_log import create_notification_log
+from utils.security import get_secret_key, password_pool_stats, shutdown_password_pool
+from utils.principal_cache import principal_cache
+from routes.auth import require_super_admin
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_db()
+    await prefetch_startup_secrets(float(os.getenv("SECRET_PREFETCH_TIMEOUT_SECONDS", "10")))
+    await activity_log_sink.start()
+    await upstream_http.start()
+    await gateway_session_store.start()
+    await launch_token_store.start()
+    manager.attach_event_log(create_notification_log())
+    await manager.attach_bus(create_notification_bus())
     yield
-    # Shutdown
+    # Shutdown - flush buffered activity logs before the DB goes away
+    await manager.detach_bus()
+    await browser_pool.stop()
+    await secret_manager.stop()
+    await gateway_session_store.stop()
+    await launch_token_store.stop()
+    await upstream_http.stop()
+    await activity_log_sink.stop()
     await close_db()
+    # Let in-flight bcrypt jobs finish without blocking the event loop
+    await asyncio.to_thread(shutdown_password_pool)
 
 app = FastAPI(
     title="DSG Transport LLC API",
@@ -88,6 +121,28 @@ async def health_check():
     return {"status": "healthy", "service": "DSG Transport API"}
 
 
+@app.get("/api/metrics")
+async def runtime_metrics(current_user: dict = Depends(require_super_admin)):
+    """In-process cache and queue counters (Super Admin only)"""
+    return {
+        "principal_cache": principal_cache.stats(),
+        "password_pool": password_pool_stats(),
+        "activity_log_sink": activity_log_sink.stats(),
+        "websockets": manager.stats(),
+        "upstream_http": upstream_http.stats(),
+        "gateway_asset_cache": asset_cache.stats(),
+        "gateway_sessions": gateway_session_store.stats(),
+        "launch_tokens": launch_token_store.stats(),
+        "extension_key_ring": extension_key_ring.stats(),
+        "upstream_guard": upstream_guard.stats(),
+        "browser_pool": browser_pool.stats(),
+        "login_recipes": login_recipes.stats(),
+        "tool_login_sessions": login_session_cache.stats(),
+        "tool_login_timings": login_timings.stats(),
+        "secrets": secret_manager.stats(),
+    }
+
+
 @app.get("/api/download/extension")
 async def download_extension():
     """Download the DSG Transport browser extension ZIP file"""
@@ -119,25 +174,41 @@ async def websocket_endpoint(websocket: WebSocket, token: str):
     try:
         # Verify JWT token
         payload = jwt.decode(token, get_secret_key(), algorithms=["HS256"])
-        user_email = payload.get("sub")
+        # Notifications are addressed by email; "sub" carries the user id
+        user_email = payload.get("email")
         
         if not user_email:
             await websocket.close(code=4001)
             return
         
-        # Connect user
-        await manager.connect(websocket, user_email)
+        # Role decides which notification variant (redacted or not) this socket gets;
+        # read it from the DB since the token's role claim can be stale
+        db = await get_db()
+        user = await db.users.find_one({"email": user_email}, {"role": 1, "status": 1})
+        if not user or user.get("status") == "Suspended":
+            await websocket.close(code=4001)
+            return
+        
+        # Connect user, then send what they missed since ?epoch=&last_seq= (if given)
+        await manager.connect(websocket, user_email, user.get("role", "User"))
+        try:
+            last_seq = int(websocket.query_params["last_seq"])
+        except (KeyError, ValueError):
+            last_seq = None
+        await manager.resume(websocket, websocket.query_params.get("epoch"), last_seq)
         
         try:
             while True:
                 # Keep connection alive, listen for messages
                 data = await websocket.receive_text()
                 
-                # Handle ping/pong for connection health
+                # Handle ping/pong for connection health (sent via the connection's writer)
                 if data == "ping":
-                    await websocket.send_text("pong")
+                    await manager.send_text(websocket, "pong")
                     
         except WebSocketDisconnect:
+            pass
+        finally:
             manager.disconnect(websocket)
             
     except jwt.ExpiredSignatureError:
@@ -0,0 +1,244 @@
+"""
+Activity Log Sink
+Write-behind buffer for activity log inserts.
+Entries are queued on the request path and flushed with insert_many when the
+batch is full or the flush interval elapses. A full queue applies backpressure
+to producers instead of dropping audit entries, and failed writes are retried
+before falling back to per-document inserts.
+Every written batch also bumps a per-user log-count rollup, so listing the
+users that have logs is O(users) rather than a scan over every log.
+"""
+import asyncio
+import os
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+DUPLICATE_KEY_ERROR = 11000
+
+# Incrementally maintained rollup: one document per user email with its log count
+USER_STATS_COLLECTION = "activity_log_user_stats"
+
+# Set on every log counted in the rollup; logs from before the rollup lack it and
+# are folded in once by scripts/seed_activity_log_user_stats.py
+COUNTED_FIELD = "in_user_stats"
+
+# Queued by stop() so the flusher exits after everything ahead of it is written
+_STOP = object()
+
+
+class ActivityLogSink:
+    def __init__(
+        self,
+        max_batch: int = 200,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        max_attempts: int = 3,
+        retry_backoff: float = 0.5
+    ):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.enqueued = 0
+        self.written = 0
+        self.flushes = 0
+        self.retries = 0
+        self.failed = 0
+        self.rollup_failures = 0
+        self.backpressure_waits = 0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and not self._worker.done() and not self._stopping
+
+    async def start(self):
+        """Start the background flusher (call from the app lifespan)"""
+        if self.running:
+            return
+        self._stopping = False
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher after it has written everything still queued"""
+        if self._worker is None:
+            return
+        # New entries are written directly from here on
+        self._stopping = True
+        if not self._worker.done():
+            await self._queue.put(_STOP)
+            await self._worker
+        # Only non-empty if the flusher died unexpectedly
+        leftover = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                leftover.append(item)
+        if leftover:
+            await self._insert(leftover)
+        self._worker = None
+        self._queue = None
+
+    async def enqueue(self, entry: dict) -> str:
+        """Queue an entry and return its pre-assigned id"""
+        entry.setdefault("_id", ObjectId())
+        entry[COUNTED_FIELD] = True
+
+        if not self.running:
+            # No flusher (scripts, tests, before startup, shutdown) - write directly
+            await self._insert([entry])
+            return str(entry["_id"])
+
+        if self._queue.full():
+            self.backpressure_waits += 1
+        await self._queue.put(entry)
+        self.enqueued += 1
+        return str(entry["_id"])
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopped = False
+        while not stopped:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch: List[dict] = [item]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopped = True
+                    break
+                batch.append(item)
+
+            await self._insert(batch)
+
+    async def _insert(self, batch: List[dict]):
+        """Write a batch and fold it into the per-user log-count rollup"""
+        written = await self._write_logs(batch)
+        if written:
+            await self._update_user_stats(written)
+
+    async def _write_logs(self, batch: List[dict]) -> List[dict]:
+        """Write a batch, retrying only the documents that did not make it"""
+        from database import get_db
+
+        written: List[dict] = []
+        pending = batch
+        for attempt in range(self.max_attempts):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+            try:
+                db = await get_db()
+                await db.activity_logs.insert_many(pending, ordered=False)
+                written.extend(pending)
+                self.written += len(pending)
+                self.flushes += 1
+                return written
+            except BulkWriteError as e:
+                # Duplicate _id means an earlier attempt already wrote that entry
+                failed_indexes = {
+                    err["index"] for err in e.details.get("writeErrors", [])
+                    if err.get("code") != DUPLICATE_KEY_ERROR
+                }
+                written.extend(doc for i, doc in enumerate(pending) if i not in failed_indexes)
+                self.written += len(pending) - len(failed_indexes)
+                pending = [doc for i, doc in enumerate(pending) if i in failed_indexes]
+                if not pending:
+                    self.flushes += 1
+                    return written
+                print(f"[ActivityLog] {len(pending)} log entries failed to write, retrying: {e}")
+            except Exception as e:
+                print(f"[ActivityLog] Failed to write {len(pending)} log entries, retrying: {e}")
+
+        # Last resort: write entries one by one so a single bad document can't sink the rest
+        db = await get_db()
+        for doc in pending:
+            try:
+                await db.activity_logs.insert_one(doc)
+                written.append(doc)
+                self.written += 1
+            except DuplicateKeyError:
+                written.append(doc)
+                self.written += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"[ActivityLog] Dropped log entry {doc.get('_id')} after {self.max_attempts} attempts: {e}")
+        return written
+
+    async def _update_user_stats(self, docs: List[dict]):
+        """Increment per-user log counts - one upsert per distinct user in the batch"""
+        from database import get_db
+
+        per_user: Dict[str, dict] = {}
+        for doc in docs:
+            email = doc.get("user_email")
+            if not email:
+                continue
+            stats = per_user.setdefault(email, {"count": 0})
+            stats["count"] += 1
+            stats["user_name"] = doc.get("user_name", email)
+            stats["user_role"] = doc.get("user_role", "Unknown")
+            stats["last_activity"] = max(stats.get("last_activity", ""), doc.get("created_at", ""))
+
+        if not per_user:
+            return
+
+        try:
+            db = await get_db()
+            await db[USER_STATS_COLLECTION].bulk_write([
+                UpdateOne(
+                    {"_id": email},
+                    {
+                        "$inc": {"log_count": stats["count"]},
+                        "$set": {"user_name": stats["user_name"], "user_role": stats["user_role"]},
+                        "$max": {"last_activity": stats["last_activity"]}
+                    },
+                    upsert=True
+                )
+                for email, stats in per_user.items()
+            ], ordered=False)
+        except Exception as e:
+            # Counts drift (the logs themselves are safe)
+            self.rollup_failures += 1
+            print(f"[ActivityLog] Failed to update per-user log counts: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "max_batch": self.max_batch,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "flushes": self.flushes,
+            "retries": self.retries,
+            "failed": self.failed,
+            "rollup_failures": self.rollup_failures,
+            "backpressure_waits": self.backpressure_waits,
+        }
+
+
+# Global activity log sink instance
+activity_log_sink = ActivityLogSink(
+    max_batch=int(os.getenv("ACTIVITY_LOG_BATCH_SIZE", "200")),
+    flush_interval=float(os.getenv("ACTIVITY_LOG_FLUSH_INTERVAL_SECONDS", "1.0")),
+    max_queue=int(os.getenv("ACTIVITY_LOG_MAX_QUEUE", "10000")),
+    max_attempts=int(os.getenv("ACTIVITY_LOG_WRITE_ATTEMPTS", "3")),
+)
+
@@ -0,0 +1,290 @@
+"""
+Gateway Asset Cache
+Shared in-process HTTP cache for static assets fetched through the tool gateway.
+Every gateway session of a tool pulls the same JS/CSS/image bundles, so
+responses that are safe to share (no Set-Cookie, not private, public or a
+static asset type) are kept once per upstream URL and served to all sessions.
+A response fetched with the session's tool cookies is only shared if the
+origin marks it public or s-maxage (RFC 9111 3.5): the content type alone
+doesn't make a per-user script or image safe to hand to another session.
+Freshness follows Cache-Control / Expires (or a Last-Modified heuristic);
+stale entries are revalidated upstream with ETag / Last-Modified, and browser
+If-None-Match / If-Modified-Since requests are answered with 304.
+Bodies are held as received (still compressed) under an LRU byte budget.
+"""
+import os
+import time
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+# Response headers kept with a cached body and replayed to the browser
+STORED_HEADERS = (
+    "Content-Type", "Content-Encoding", "Content-Disposition", "Cache-Control",
+    "ETag", "Last-Modified", "Expires", "Vary",
+)
+
+# Content types shared across sessions even without an explicit "public"
+STATIC_TYPES = ("text/css", "javascript", "image/", "font/", "application/font", "application/wasm")
+
+# Vary values that are the same for every gateway request (the proxy sets them)
+SHAREABLE_VARY = frozenset(("accept-encoding", "accept", "user-agent", "accept-language", "origin"))
+
+# Heuristic freshness (RFC 9111 4.2.2): a fraction of the Last-Modified age, capped
+HEURISTIC_FRACTION = 0.1
+HEURISTIC_MAX_SECONDS = 24 * 3600
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    directives = {}
+    for part in (value or "").split(","):
+        name, _, arg = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def _seconds(value: Optional[str]) -> Optional[int]:
+    try:
+        return max(0, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as required for If-None-Match"""
+    if if_none_match.strip() == "*":
+        return True
+    strip_weak = lambda tag: tag.strip().removeprefix("W/")
+    return strip_weak(etag) in {strip_weak(tag) for tag in if_none_match.split(",")}
+
+
+class CachedAsset:
+    __slots__ = ("key", "status", "headers", "body", "stored_at", "ttl", "hits")
+
+    def __init__(self, key: str, status: int, headers: Dict[str, str], body: bytes, ttl: float):
+        self.key = key
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.stored_at = time.monotonic()
+        self.ttl = ttl
+        self.hits = 0
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.stored_at
+
+    @property
+    def fresh(self) -> bool:
+        return self.age < self.ttl
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(k) + len(v) for k, v in self.headers.items()) + len(self.key)
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional headers for revalidating this entry upstream"""
+        headers = {}
+        if "ETag" in self.headers:
+            headers["If-None-Match"] = self.headers["ETag"]
+        if "Last-Modified" in self.headers:
+            headers["If-Modified-Since"] = self.headers["Last-Modified"]
+        return headers
+
+    def not_modified_for(self, request_headers) -> bool:
+        """Whether a browser's conditional request can be answered with 304"""
+        if_none_match = request_headers.get("If-None-Match")
+        if if_none_match is not None:
+            return "ETag" in self.headers and _etag_matches(if_none_match, self.headers["ETag"])
+        since = _http_date(request_headers.get("If-Modified-Since"))
+        modified = _http_date(self.headers.get("Last-Modified"))
+        return since is not None and modified is not None and modified <= since
+
+
+class AssetCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entry_bytes: int = 4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self._entries: "OrderedDict[str, CachedAsset]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(url: str) -> str:
+        """Cache key: upstream origin plus path and query (the same for every session)"""
+        parts = urlsplit(url)
+        return f"{parts.scheme.lower()}://{parts.netloc.lower()}{parts.path or '/'}" + (
+            f"?{parts.query}" if parts.query else ""
+        )
+
+    def lookup(self, url: str, request_headers) -> Optional[CachedAsset]:
+        """Entry for a browser GET, or None if it must go upstream uncached"""
+        if not self.enabled or "Range" in request_headers:
+            return None
+        directives = parse_cache_control(request_headers.get("Cache-Control"))
+        if "no-store" in directives:
+            return None
+        entry = self._entries.get(self.key(url))
+        if entry is None:
+            return None
+        self._entries.move_to_end(entry.key)
+        if "no-cache" in directives or request_headers.get("Pragma") == "no-cache":
+            # Hard reload: make the caller revalidate
+            entry.ttl = 0
+        return entry
+
+    def ttl_for(self, status: int, response_headers, request_headers,
+                with_credentials: bool = False) -> Optional[float]:
+        """Seconds a response may be served without revalidation, or None if it can't be shared.
+        `with_credentials`: the upstream request carried session cookies."""
+        if not self.enabled or status != 200 or "Range" in request_headers:
+            return None
+        if "Set-Cookie" in response_headers:
+            return None
+        directives = parse_cache_control(response_headers.get("Cache-Control"))
+        if "no-store" in directives or "private" in directives:
+            return None
+        vary = {v.strip().lower() for v in response_headers.get("Vary", "").split(",") if v.strip()}
+        if not vary <= SHAREABLE_VARY:
+            return None
+        content_type = response_headers.get("Content-Type", "").lower()
+        if "text/html" in content_type:
+            # Pages are rewritten with the session's token and carry per-user content
+            return None
+        explicitly_shared = "public" in directives or "s-maxage" in directives
+        if not explicitly_shared and (with_credentials or not any(t in content_type for t in STATIC_TYPES)):
+            return None
+
+        has_validator = "ETag" in response_headers or "Last-Modified" in response_headers
+        if "no-cache" in directives:
+            return 0.0 if has_validator else None
+
+        current_age = _seconds(response_headers.get("Age")) or 0
+        lifetime = _seconds(directives.get("s-maxage"))
+        if lifetime is None:
+            lifetime = _seconds(directives.get("max-age"))
+        if lifetime is None:
+            expires = _http_date(response_headers.get("Expires"))
+            if expires is not None:
+                date = _http_date(response_headers.get("Date")) or time.time()
+                lifetime = max(0, int(expires - date))
+        if lifetime is None:
+            modified = _http_date(response_headers.get("Last-Modified"))
+            if modified is not None:
+                date = _http_date(response_headers.get("Date")) or time.time()
+                lifetime = int(min(HEURISTIC_MAX_SECONDS, max(0.0, date - modified) * HEURISTIC_FRACTION))
+        if lifetime is None:
+            return 0.0 if has_validator else None
+        ttl = float(max(0, lifetime - current_age))
+        if ttl == 0 and not has_validator:
+            return None
+        return ttl
+
+    def store(self, url: str, status: int, response_headers, body: bytes, ttl: float) -> Optional[CachedAsset]:
+        if len(body) > self.max_entry_bytes:
+            return None
+        headers = {name: response_headers[name] for name in STORED_HEADERS if name in response_headers}
+        entry = CachedAsset(self.key(url), status, headers, body, ttl)
+        self._remove(entry.key)
+        self._entries[entry.key] = entry
+        self._bytes += entry.size
+        self.stores += 1
+        while self._bytes > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+        return entry
+
+    def refresh(self, entry: CachedAsset, response_headers, request_headers, with_credentials: bool = False):
+        """Apply a 304 from upstream: new validators and freshness, same body"""
+        merged = dict(entry.headers)
+        for name in STORED_HEADERS:
+            if name in response_headers and name not in ("Content-Type", "Content-Encoding"):
+                merged[name] = response_headers[name]
+        combined = dict(merged)
+        for name in ("Set-Cookie", "Age", "Date"):
+            if name in response_headers:
+                combined[name] = response_headers[name]
+        ttl = self.ttl_for(200, combined, request_headers, with_credentials)
+        cached = self._entries.get(entry.key) is entry
+        if ttl is None:
+            # No longer shareable; the body is still valid for this one response
+            if cached:
+                self._remove(entry.key)
+            entry.ttl = 0
+            return
+        if cached:
+            self._bytes -= entry.size
+        entry.headers = merged
+        entry.stored_at = time.monotonic()
+        entry.ttl = ttl
+        if cached:
+            self._bytes += entry.size
+
+    def record_hit(self, entry: CachedAsset, revalidated: bool = False):
+        entry.hits += 1
+        if revalidated:
+            self.revalidated += 1
+        else:
+            self.hits += 1
+        self.bytes_saved += len(entry.body)
+
+    def record_miss(self):
+        """A cacheable response that had to be fetched in full"""
+        self.misses += 1
+
+    def invalidate(self, url: str):
+        """Drop an entry (e.g. after an unsafe request to the same URL)"""
+        self._remove(self.key(url))
+
+    def _remove(self, key: str):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.revalidated + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.revalidated) / lookups, 4) if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "stores": self.stores,
+            "evictions": self.evictions,
+        }
+
+
+# Global gateway asset cache (GATEWAY_ASSET_CACHE_MAX_BYTES=0 disables it)
+asset_cache = AssetCache(
+    max_bytes=int(os.getenv("GATEWAY_ASSET_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    max_entry_bytes=int(os.getenv("GATEWAY_ASSET_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024))),
+)
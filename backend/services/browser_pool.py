@@ -0,0 +1,210 @@
+"""
+Browser Pool
+Long-lived headless Chromium processes for server-side tool logins.
+Instead of launching (and tearing down) a browser per login, callers borrow
+a fresh, isolated BrowserContext from one of a few shared browsers:
+- at most `max_concurrency` contexts are open at once; extra callers wait in
+  a bounded queue and are rejected when it is full or the wait times out
+- a browser is health-checked on checkout (connected, under its use/age
+  budget) and recycled after `max_uses` contexts or `max_age_seconds`
+- playwright is imported on first use, so the API starts without it
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, List, Optional
+
+LAUNCH_ARGS = ["--no-sandbox", "--disable-setuid-sandbox", "--disable-dev-shm-usage"]
+
+
+class BrowserPoolBusy(Exception):
+    """No browser context became available in time"""
+
+
+class PooledBrowser:
+    def __init__(self, browser):
+        self.browser = browser
+        self.launched_at = time.monotonic()
+        self.uses = 0
+        self.active = 0
+        self.retiring = False
+
+    @property
+    def connected(self) -> bool:
+        return self.browser.is_connected()
+
+
+class BrowserPool:
+    def __init__(
+        self,
+        browsers: int = 2,
+        max_concurrency: int = 4,
+        max_waiting: int = 20,
+        acquire_timeout: float = 30.0,
+        max_uses: int = 50,
+        max_age_seconds: float = 3600.0,
+        launcher: Optional[Callable[[], Awaitable[object]]] = None
+    ):
+        self.size = browsers
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.acquire_timeout = acquire_timeout
+        self.max_uses = max_uses
+        self.max_age_seconds = max_age_seconds
+        self._launcher = launcher
+        self._playwright = None
+        self._browsers: List[PooledBrowser] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._launch_lock: Optional[asyncio.Lock] = None
+        self._starting: Optional[asyncio.Future] = None
+        self.waiting = 0
+        self.launches = 0
+        self.recycled = 0
+        self.unhealthy = 0
+        self.contexts = 0
+        self.rejected = 0
+
+    @property
+    def running(self) -> bool:
+        return self._slots is not None
+
+    async def start(self):
+        """Started lazily on first use; concurrent callers share one startup"""
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start())
+        try:
+            await asyncio.shield(self._starting)
+        except Exception:
+            self._starting = None
+            raise
+
+    async def _start(self):
+        if self._launcher is None:
+            from playwright.async_api import async_playwright
+
+            self._playwright = await async_playwright().start()
+            self._launcher = lambda: self._playwright.chromium.launch(headless=True, args=LAUNCH_ARGS)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._launch_lock = asyncio.Lock()
+
+    async def stop(self):
+        """Close every browser (call from the app lifespan)"""
+        browsers, self._browsers = self._browsers, []
+        for pooled in browsers:
+            await self._close(pooled)
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+            self._launcher = None
+        self._slots = None
+        self._launch_lock = None
+        self._starting = None
+
+    def _healthy(self, pooled: PooledBrowser) -> bool:
+        return (
+            not pooled.retiring
+            and pooled.connected
+            and pooled.uses < self.max_uses
+            and time.monotonic() - pooled.launched_at < self.max_age_seconds
+        )
+
+    async def _close(self, pooled: PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            print(f"[BrowserPool] Error closing browser: {e!r}")
+
+    async def _retire(self, pooled: PooledBrowser):
+        """Take a browser out of rotation; it closes once its last context is done"""
+        if not pooled.retiring:
+            pooled.retiring = True
+            if not pooled.connected:
+                self.unhealthy += 1
+            else:
+                self.recycled += 1
+        if pooled.active == 0:
+            if pooled in self._browsers:
+                self._browsers.remove(pooled)
+            await self._close(pooled)
+
+    async def _checkout(self) -> PooledBrowser:
+        async with self._launch_lock:
+            for pooled in list(self._browsers):
+                if not self._healthy(pooled):
+                    await self._retire(pooled)
+            live = [b for b in self._browsers if not b.retiring]
+            if len(live) < self.size:
+                pooled = PooledBrowser(await self._launcher())
+                self.launches += 1
+                self._browsers.append(pooled)
+                live.append(pooled)
+            # Spread contexts across browsers
+            pooled = min(live, key=lambda b: b.active)
+            pooled.active += 1
+            pooled.uses += 1
+            return pooled
+
+    async def _checkin(self, pooled: PooledBrowser):
+        pooled.active -= 1
+        if pooled.retiring or not self._healthy(pooled):
+            await self._retire(pooled)
+
+    @asynccontextmanager
+    async def context(self, **context_options):
+        """Borrow a fresh, isolated BrowserContext; it is closed when the block exits"""
+        await self.start()
+        slots = self._slots
+        if self.waiting >= self.max_waiting and slots.locked():
+            self.rejected += 1
+            raise BrowserPoolBusy("Too many logins waiting for a browser")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise BrowserPoolBusy(f"No browser available within {self.acquire_timeout:.0f}s")
+        finally:
+            self.waiting -= 1
+
+        pooled = None
+        try:
+            pooled = await self._checkout()
+            context = await pooled.browser.new_context(**context_options)
+            self.contexts += 1
+            try:
+                yield context
+            finally:
+                try:
+                    await context.close()
+                except Exception as e:
+                    print(f"[BrowserPool] Error closing context: {e!r}")
+        finally:
+            if pooled is not None:
+                await self._checkin(pooled)
+            slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "browsers": len(self._browsers),
+            "active_contexts": sum(b.active for b in self._browsers),
+            "max_concurrency": self.max_concurrency,
+            "waiting": self.waiting,
+            "launches": self.launches,
+            "contexts": self.contexts,
+            "recycled": self.recycled,
+            "unhealthy": self.unhealthy,
+            "rejected": self.rejected,
+        }
+
+
+# Global browser pool for tool logins
+browser_pool = BrowserPool(
+    browsers=int(os.getenv("BROWSER_POOL_SIZE", "2")),
+    max_concurrency=int(os.getenv("BROWSER_POOL_MAX_CONCURRENCY", "4")),
+    max_waiting=int(os.getenv("BROWSER_POOL_MAX_WAITING", "20")),
+    acquire_timeout=float(os.getenv("BROWSER_POOL_ACQUIRE_TIMEOUT_SECONDS", "30")),
+    max_uses=int(os.getenv("BROWSER_POOL_MAX_USES", "50")),
+    max_age_seconds=float(os.getenv("BROWSER_POOL_MAX_AGE_SECONDS", "3600")),
+)
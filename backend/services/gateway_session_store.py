@@ -0,0 +1,244 @@
+"""
+Gateway Session Store
+Holds tool gateway sessions (tool, user, upstream cookie jar) keyed by the
+SHA-256 of the session token, with expiry and a cap on live sessions.
+In-memory: a min-heap of expiry times drives removal, so abandoned sessions
+are dropped on time without scanning, and the soonest-to-expire session is
+evicted when the cap is reached.
+MongoDB: a TTL index on expires_at removes sessions for every worker; the
+credentials and cookie jar are stored encrypted.
+"""
+import asyncio
+import heapq
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+# Session fields that are encrypted at rest in the Mongo backend
+SECRET_FIELDS = ("credentials", "cookies")
+
+# last_access is persisted at most this often per session (it's informational)
+TOUCH_INTERVAL_SECONDS = 60
+
+
+def _utc(value: datetime) -> datetime:
+    # Motor returns naive datetimes in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class InMemoryGatewaySessionStore:
+    """Sessions in this process, expired via a heap of (expires_at, session_hash)"""
+
+    def __init__(self, max_sessions: int = 5000, sweep_interval: float = 60.0):
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self._sessions: Dict[str, dict] = {}
+        # Lazily cleaned: an entry is stale if the session is gone or got a new expiry
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._sweeper: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    async def start(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._wakeup = asyncio.Event()
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep(self):
+        while True:
+            self._expire(time.time())
+            delay = self.sweep_interval
+            if self._expiry_heap:
+                delay = min(delay, max(0.0, self._expiry_heap[0][0] - time.time()))
+            # Woken early when a session is added that expires before the current top
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _expire(self, now: float):
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, session_hash = heapq.heappop(self._expiry_heap)
+            if self._is_current(session_hash, expires_at):
+                del self._sessions[session_hash]
+                self.expired += 1
+
+    def _is_current(self, session_hash: str, expires_at: float) -> bool:
+        session = self._sessions.get(session_hash)
+        return session is not None and session["expires_at"].timestamp() == expires_at
+
+    def _evict_to_cap(self):
+        while len(self._sessions) > self.max_sessions and self._expiry_heap:
+            expires_at, session_hash = heapq.heappop(self._expiry_heap)
+            if self._is_current(session_hash, expires_at):
+                del self._sessions[session_hash]
+                self.evicted += 1
+
+    async def create(self, session_hash: str, session: dict):
+        now = time.time()
+        self._expire(now)
+        self._sessions[session_hash] = session
+        entry = (session["expires_at"].timestamp(), session_hash)
+        heapq.heappush(self._expiry_heap, entry)
+        if self._wakeup is not None and self._expiry_heap[0] == entry:
+            self._wakeup.set()
+        self.created += 1
+        self._evict_to_cap()
+        # Stale heap entries (deleted sessions) are bounded by rebuilding now and then
+        if len(self._expiry_heap) > 2 * max(len(self._sessions), 64):
+            self._expiry_heap = [
+                (s["expires_at"].timestamp(), h) for h, s in self._sessions.items()
+            ]
+            heapq.heapify(self._expiry_heap)
+
+    async def get(self, session_hash: str) -> Optional[dict]:
+        """The live session, or None if it doesn't exist or has expired"""
+        session = self._sessions.get(session_hash)
+        if session is None:
+            return None
+        if datetime.now(timezone.utc) > session["expires_at"]:
+            del self._sessions[session_hash]
+            self.expired += 1
+            return None
+        return session
+
+    async def touch(self, session_hash: str, session: dict):
+        session["last_access"] = datetime.now(timezone.utc)
+
+    async def save_cookies(self, session_hash: str, session: dict):
+        # The session dict is the stored object; nothing to write back
+        pass
+
+    async def delete(self, session_hash: str):
+        self._sessions.pop(session_hash, None)
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "heap_entries": len(self._expiry_heap),
+            "created": self.created,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+class MongoGatewaySessionStore:
+    """Sessions in a collection with a TTL index, shared by all workers"""
+
+    def __init__(self, collection_name: str = "gateway_sessions", max_sessions: int = 50000):
+        self.collection_name = collection_name
+        self.max_sessions = max_sessions
+        self._ready = False
+        self.created = 0
+        self.evicted = 0
+
+    async def _collection(self):
+        from database import get_db
+
+        db = await get_db()
+        collection = db[self.collection_name]
+        if not self._ready:
+            # Mongo's TTL monitor removes a session within a minute of expires_at
+            await collection.create_index("expires_at", expireAfterSeconds=0)
+            self._ready = True
+        return collection
+
+    async def start(self):
+        await self._collection()
+
+    async def stop(self):
+        pass
+
+    @staticmethod
+    def _encode(session: dict) -> dict:
+        from utils.security import encrypt_credential
+
+        doc = {k: v for k, v in session.items() if k not in SECRET_FIELDS}
+        doc["secrets"] = encrypt_credential(json.dumps({k: session.get(k) or {} for k in SECRET_FIELDS}))
+        return doc
+
+    @staticmethod
+    def _decode(doc: dict) -> dict:
+        from utils.security import decrypt_credential
+
+        session = {k: v for k, v in doc.items() if k not in ("_id", "secrets")}
+        session.update(json.loads(decrypt_credential(doc["secrets"])) if doc.get("secrets") else {})
+        for field in ("created_at", "expires_at", "last_access"):
+            if isinstance(session.get(field), datetime):
+                session[field] = _utc(session[field])
+        return session
+
+    async def create(self, session_hash: str, session: dict):
+        collection = await self._collection()
+        await collection.insert_one({"_id": session_hash, **self._encode(session)})
+        self.created += 1
+        excess = await collection.estimated_document_count() - self.max_sessions
+        if excess > 0:
+            # Over the cap: drop the sessions closest to expiry
+            doomed = await collection.find({}, {"_id": 1}).sort("expires_at", 1).limit(excess).to_list(excess)
+            await collection.delete_many({"_id": {"$in": [d["_id"] for d in doomed]}})
+            self.evicted += len(doomed)
+
+    async def get(self, session_hash: str) -> Optional[dict]:
+        collection = await self._collection()
+        # The TTL monitor runs once a minute, so expiry is also checked here
+        doc = await collection.find_one({"_id": session_hash, "expires_at": {"$gt": datetime.now(timezone.utc)}})
+        return self._decode(doc) if doc else None
+
+    async def touch(self, session_hash: str, session: dict):
+        now = datetime.now(timezone.utc)
+        last = session.get("last_access")
+        session["last_access"] = now
+        if last is None or (now - last).total_seconds() >= TOUCH_INTERVAL_SECONDS:
+            collection = await self._collection()
+            await collection.update_one({"_id": session_hash}, {"$set": {"last_access": now}})
+
+    async def save_cookies(self, session_hash: str, session: dict):
+        collection = await self._collection()
+        await collection.update_one({"_id": session_hash}, {"$set": {"secrets": self._encode(session)["secrets"]}})
+
+    async def delete(self, session_hash: str):
+        collection = await self._collection()
+        await collection.delete_one({"_id": session_hash})
+
+    def stats(self) -> dict:
+        return {
+            "backend": "mongo",
+            "collection": self.collection_name,
+            "max_sessions": self.max_sessions,
+            "created": self.created,
+            "evicted": self.evicted,
+        }
+
+
+def create_gateway_session_store():
+    """Build the store selected by GATEWAY_SESSION_BACKEND (memory | mongo)"""
+    backend = os.getenv("GATEWAY_SESSION_BACKEND", "memory").strip().lower()
+    if backend == "mongo":
+        return MongoGatewaySessionStore(
+            collection_name=os.getenv("GATEWAY_SESSION_COLLECTION", "gateway_sessions"),
+            max_sessions=int(os.getenv("GATEWAY_MAX_SESSIONS", "50000")),
+        )
+    if backend != "memory":
+        raise RuntimeError(f"Unknown GATEWAY_SESSION_BACKEND '{backend}' (expected 'memory' or 'mongo').")
+    return InMemoryGatewaySessionStore(max_sessions=int(os.getenv("GATEWAY_MAX_SESSIONS", "5000")))
+
+
+# Global gateway session store
+gateway_session_store = create_gateway_session_store()
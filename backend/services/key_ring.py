@@ -0,0 +1,146 @@
+"""
+Key Ring
+Fernet keys shared by every worker, read from the secret provider and used
+through MultiFernet: the primary key encrypts, every key in the ring decrypts.
+The secret is either
+- a comma/newline-separated list of keys, primary first (rotate by
+  prepending a new key, drop the old one once its tokens have expired), or
+- a JSON list of {"key": ..., "not_before": ISO-8601} for scheduled rotation:
+  a key becomes primary at its not_before on every worker at once, is
+  accepted for decryption before that (workers see the secret at slightly
+  different times), and a superseded key keeps decrypting for the overlap
+  window before it is dropped.
+Rotated secrets reach the ring through the secret cache's refresh.
+"""
+import hashlib
+import json
+import os
+import re
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from cryptography.fernet import Fernet, MultiFernet
+
+from services.secret_manager_service import secret_manager
+
+KeyEntry = Tuple[Optional[datetime], str]
+
+
+def parse_key_ring(raw: str) -> List[KeyEntry]:
+    """(not_before, key) pairs, newest first; keys from a plain list have no not_before"""
+    raw = raw.strip()
+    if not raw.startswith("["):
+        return [(None, key) for key in re.split(r"[,\s]+", raw) if key]
+    entries = []
+    for item in json.loads(raw):
+        not_before = item.get("not_before")
+        if not_before:
+            not_before = datetime.fromisoformat(not_before.replace("Z", "+00:00"))
+            if not_before.tzinfo is None:
+                not_before = not_before.replace(tzinfo=timezone.utc)
+        entries.append((not_before or None, item["key"]))
+    oldest = datetime.min.replace(tzinfo=timezone.utc)
+    return sorted(entries, key=lambda entry: entry[0] or oldest, reverse=True)
+
+
+def key_id(key: str) -> str:
+    """Short fingerprint for logs and metrics (never the key itself)"""
+    return hashlib.sha256(key.encode()).hexdigest()[:8]
+
+
+def select_keys(entries: List[KeyEntry], now: datetime, overlap: timedelta) -> Tuple[List[str], Optional[datetime]]:
+    """Keys in MultiFernet order (primary first) at `now`, and when that selection next changes"""
+    active = [entry for entry in entries if entry[0] is None or entry[0] <= now]
+    pending = [entry for entry in entries if entry[0] is not None and entry[0] > now]
+    if not active:
+        raise RuntimeError("Key ring has no key that is active yet")
+
+    keys = [active[0][1]]
+    changes = [not_before for not_before, _ in pending]
+    superseded_at = active[0][0]
+    for not_before, key in active[1:]:
+        if superseded_at is not None:
+            retired_at = superseded_at + overlap
+            if now >= retired_at:
+                break
+            changes.append(retired_at)
+        keys.append(key)
+        superseded_at = not_before
+    # Keys scheduled for later already decrypt, for workers that switched first
+    keys += [key for _, key in reversed(pending)]
+    return keys, min(changes) if changes else None
+
+
+class KeyRing:
+    def __init__(self, secret_name: str, overlap_seconds: float = 600.0):
+        self.secret_name = secret_name
+        self.overlap = timedelta(seconds=overlap_seconds)
+        self._raw: Optional[str] = None
+        self._fernet: Optional[MultiFernet] = None
+        self._keys: List[str] = []
+        self._next_change: Optional[datetime] = None
+        self.generated = False
+        self.rebuilds = 0
+
+    def _build(self, raw: str, now: datetime):
+        try:
+            keys, next_change = select_keys(parse_key_ring(raw), now, self.overlap)
+            fernet = MultiFernet([Fernet(key.encode()) for key in keys])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise RuntimeError(f"Secret '{self.secret_name}' is not a valid key ring: {type(e).__name__}")
+        if self._keys and keys[0] != self._keys[0]:
+            print(f"[KeyRing] {self.secret_name}: primary key is now {key_id(keys[0])}")
+        self._raw, self._fernet, self._keys, self._next_change = raw, fernet, keys, next_change
+        self.rebuilds += 1
+
+    async def fernet(self) -> MultiFernet:
+        try:
+            raw = await secret_manager.get(self.secret_name)
+        except Exception:
+            # No provider could answer (e.g. Secret Manager unconfigured and no env
+            # fallback): same as unset, and already-built keys keep working
+            raw = None
+        now = datetime.now(timezone.utc)
+        if not raw:
+            if self._fernet is None:
+                # Only safe with a single worker: nobody else can decrypt these payloads
+                print(f"[KeyRing] WARNING: secret '{self.secret_name}' unavailable; using a per-process key")
+                self.generated = True
+                self._build(Fernet.generate_key().decode(), now)
+            return self._fernet
+        if raw != self._raw or (self._next_change is not None and now >= self._next_change):
+            try:
+                self._build(raw, now)
+            except RuntimeError as e:
+                if self._fernet is None:
+                    raise
+                # A broken rotation must not take down payloads the current ring can serve
+                print(f"[KeyRing] {e}; keeping the previous keys")
+                self._raw = raw
+                return self._fernet
+            self.generated = False
+        return self._fernet
+
+    async def encrypt(self, data: bytes) -> str:
+        return (await self.fernet()).encrypt(data).decode()
+
+    async def decrypt(self, token: str) -> bytes:
+        """Raises cryptography.fernet.InvalidToken if no key in the ring matches"""
+        return (await self.fernet()).decrypt(token.encode())
+
+    def stats(self) -> dict:
+        return {
+            "secret": self.secret_name,
+            "keys": len(self._keys),
+            "primary": key_id(self._keys[0]) if self._keys else None,
+            "generated": self.generated,
+            "next_change": self._next_change.isoformat() if self._next_change else None,
+            "rebuilds": self.rebuilds,
+        }
+
+
+# Keys for browser-extension credential payloads (EXTENSION_KEY in the environment provider)
+extension_key_ring = KeyRing(
+    os.getenv("EXTENSION_KEY_SECRET", "extension-keys"),
+    overlap_seconds=float(os.getenv("EXTENSION_KEY_OVERLAP_SECONDS", "600")),
+)
@@ -0,0 +1,254 @@
+"""
+Launch Token Store
+One-time secure-access launch tokens keyed by the SHA-256 of the token.
+A token can be consumed exactly once: consume() checks and marks it used in
+one step, so two concurrent launches of the same link can't both succeed.
+Used tokens are kept until they expire, so a reused link is reported as such.
+In-memory: a min-heap of expiry times drives removal (O(log n) per token, no
+scans) and the soonest-to-expire token is evicted when the cap is reached.
+MongoDB: a TTL index on expires_at removes tokens for every worker, so a
+token issued on one worker can be launched on another; credentials are
+stored encrypted.
+"""
+import asyncio
+import heapq
+import json
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+# consume() outcomes
+TOKEN_OK = "ok"
+TOKEN_USED = "used"
+TOKEN_EXPIRED = "expired"
+TOKEN_INVALID = "invalid"
+
+
+def _utc(value: datetime) -> datetime:
+    # Motor returns naive datetimes in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class InMemoryLaunchTokenStore:
+    """Tokens in this process, expired via a heap of (expires_at, token_hash)"""
+
+    def __init__(self, max_tokens: int = 10000, sweep_interval: float = 60.0):
+        self.max_tokens = max_tokens
+        self.sweep_interval = sweep_interval
+        self._tokens: Dict[str, dict] = {}
+        # Lazily cleaned: an entry is stale if its token was already removed
+        self._expiry_heap: List[Tuple[float, str]] = []
+        self._sweeper: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.issued = 0
+        self.consumed = 0
+        self.rejected = 0
+        self.expired = 0
+        self.evicted = 0
+
+    async def start(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._wakeup = asyncio.Event()
+            self._sweeper = asyncio.create_task(self._sweep())
+
+    async def stop(self):
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep(self):
+        while True:
+            self._expire(time.time())
+            delay = self.sweep_interval
+            if self._expiry_heap:
+                delay = min(delay, max(0.0, self._expiry_heap[0][0] - time.time()))
+            # Woken early when a token is issued that expires before the current top
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _expire(self, now: float) -> int:
+        removed = 0
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires_at, token_hash = heapq.heappop(self._expiry_heap)
+            if self._is_current(token_hash, expires_at):
+                del self._tokens[token_hash]
+                removed += 1
+        self.expired += removed
+        return removed
+
+    def _is_current(self, token_hash: str, expires_at: float) -> bool:
+        token = self._tokens.get(token_hash)
+        return token is not None and token["expires_at"].timestamp() == expires_at
+
+    async def create(self, token_hash: str, token: dict):
+        self._expire(time.time())
+        self._tokens[token_hash] = {**token, "used": False}
+        entry = (token["expires_at"].timestamp(), token_hash)
+        heapq.heappush(self._expiry_heap, entry)
+        if self._wakeup is not None and self._expiry_heap[0] == entry:
+            self._wakeup.set()
+        self.issued += 1
+        while len(self._tokens) > self.max_tokens and self._expiry_heap:
+            expires_at, evicted_hash = heapq.heappop(self._expiry_heap)
+            if self._is_current(evicted_hash, expires_at):
+                del self._tokens[evicted_hash]
+                self.evicted += 1
+
+    async def consume(self, token_hash: str) -> Tuple[str, Optional[dict]]:
+        """Mark the token used and return it; no await between the check and the mark"""
+        token = self._tokens.get(token_hash)
+        if token is None:
+            status = TOKEN_INVALID
+        elif datetime.now(timezone.utc) > token["expires_at"]:
+            del self._tokens[token_hash]
+            self.expired += 1
+            status = TOKEN_EXPIRED
+        elif token["used"]:
+            status = TOKEN_USED
+        else:
+            token["used"] = True
+            self.consumed += 1
+            return TOKEN_OK, token
+        self.rejected += 1
+        return status, None
+
+    async def purge_expired(self) -> int:
+        return self._expire(time.time())
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "tokens": len(self._tokens),
+            "max_tokens": self.max_tokens,
+            "heap_entries": len(self._expiry_heap),
+            "issued": self.issued,
+            "consumed": self.consumed,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "evicted": self.evicted,
+        }
+
+
+class MongoLaunchTokenStore:
+    """Tokens in a collection with a TTL index, shared by all workers"""
+
+    def __init__(self, collection_name: str = "launch_tokens", max_tokens: int = 100000):
+        self.collection_name = collection_name
+        self.max_tokens = max_tokens
+        self._ready = False
+        self.issued = 0
+        self.consumed = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    async def _collection(self):
+        from database import get_db
+
+        db = await get_db()
+        collection = db[self.collection_name]
+        if not self._ready:
+            # Mongo's TTL monitor removes a token within a minute of expires_at
+            await collection.create_index("expires_at", expireAfterSeconds=0)
+            self._ready = True
+        return collection
+
+    async def start(self):
+        await self._collection()
+
+    async def stop(self):
+        pass
+
+    @staticmethod
+    def _encode(token: dict) -> dict:
+        from utils.security import encrypt_credential
+
+        doc = {k: v for k, v in token.items() if k != "credentials"}
+        if token.get("credentials"):
+            doc["credentials"] = encrypt_credential(json.dumps(token["credentials"]))
+        return doc
+
+    @staticmethod
+    def _decode(doc: dict) -> dict:
+        from utils.security import decrypt_credential
+
+        token = {k: v for k, v in doc.items() if k != "_id"}
+        if token.get("credentials"):
+            token["credentials"] = json.loads(decrypt_credential(token["credentials"]))
+        token["expires_at"] = _utc(token["expires_at"])
+        return token
+
+    async def create(self, token_hash: str, token: dict):
+        collection = await self._collection()
+        await collection.insert_one({"_id": token_hash, **self._encode(token), "used": False})
+        self.issued += 1
+        excess = await collection.estimated_document_count() - self.max_tokens
+        if excess > 0:
+            # Over the cap: drop the tokens closest to expiry
+            doomed = await collection.find({}, {"_id": 1}).sort("expires_at", 1).limit(excess).to_list(excess)
+            await collection.delete_many({"_id": {"$in": [d["_id"] for d in doomed]}})
+            self.evicted += len(doomed)
+
+    async def consume(self, token_hash: str) -> Tuple[str, Optional[dict]]:
+        """Atomic across workers: only one find_one_and_update can flip used to True"""
+        collection = await self._collection()
+        now = datetime.now(timezone.utc)
+        doc = await collection.find_one_and_update(
+            {"_id": token_hash, "used": False, "expires_at": {"$gt": now}},
+            {"$set": {"used": True, "used_at": now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if doc is not None:
+            self.consumed += 1
+            return TOKEN_OK, self._decode(doc)
+
+        # Not consumable - find out why for the launch page
+        self.rejected += 1
+        doc = await collection.find_one({"_id": token_hash}, {"used": 1, "expires_at": 1})
+        if doc is None:
+            return TOKEN_INVALID, None
+        if _utc(doc["expires_at"]) <= now:
+            return TOKEN_EXPIRED, None
+        return TOKEN_USED, None
+
+    async def purge_expired(self) -> int:
+        collection = await self._collection()
+        result = await collection.delete_many({"expires_at": {"$lte": datetime.now(timezone.utc)}})
+        return result.deleted_count
+
+    def stats(self) -> dict:
+        return {
+            "backend": "mongo",
+            "collection": self.collection_name,
+            "max_tokens": self.max_tokens,
+            "issued": self.issued,
+            "consumed": self.consumed,
+            "rejected": self.rejected,
+            "evicted": self.evicted,
+        }
+
+
+def create_launch_token_store():
+    """Build the store selected by LAUNCH_TOKEN_BACKEND (memory | mongo)"""
+    backend = os.getenv("LAUNCH_TOKEN_BACKEND", "memory").strip().lower()
+    if backend == "mongo":
+        return MongoLaunchTokenStore(
+            collection_name=os.getenv("LAUNCH_TOKEN_COLLECTION", "launch_tokens"),
+            max_tokens=int(os.getenv("LAUNCH_TOKEN_MAX_TOKENS", "100000")),
+        )
+    if backend != "memory":
+        raise RuntimeError(f"Unknown LAUNCH_TOKEN_BACKEND '{backend}' (expected 'memory' or 'mongo').")
+    return InMemoryLaunchTokenStore(max_tokens=int(os.getenv("LAUNCH_TOKEN_MAX_TOKENS", "10000")))
+
+
+# Global one-time launch token store
+launch_token_store = create_launch_token_store()
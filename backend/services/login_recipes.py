@@ -0,0 +1,125 @@
+"""
+Login Recipes
+Remembers, per tool login page, which selectors and post-login URL worked, so
+the next server-side login can go straight to them instead of probing every
+candidate selector. Recipes live in MongoDB (shared by all workers); a recipe
+that keeps failing is dropped and re-learned by the next successful probe.
+"""
+import os
+import re
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import urlsplit
+
+from pymongo import ReturnDocument
+
+# A recipe is forgotten after this many consecutive failed logins
+RECIPE_MAX_FAILURES = int(os.getenv("LOGIN_RECIPE_MAX_FAILURES", "3"))
+
+
+def recipe_key(login_url: str) -> str:
+    """One recipe per login page (host + path), whatever the tool is called"""
+    parts = urlsplit(login_url)
+    return f"{parts.netloc.lower()}{parts.path.rstrip('/') or '/'}"
+
+
+def url_matches(pattern: str, url: str) -> bool:
+    """Playwright-style glob match: ** spans anything, * stays within a path segment"""
+    regex = "".join(
+        ".*" if token == "**" else "[^/]*" if token == "*" else re.escape(token)
+        for token in re.split(r"(\*\*|\*)", pattern)
+    )
+    return re.fullmatch(regex, url) is not None
+
+
+def success_url_pattern(final_url: str, login_url: str) -> Optional[str]:
+    """Playwright glob for the post-login URL; path segments with ids become wildcards.
+    None when the pattern would also match the login page (e.g. the tool lands on "/"
+    or a hash route), since reaching it then proves nothing."""
+    parts = urlsplit(final_url)
+    segments = ["*" if any(ch.isdigit() for ch in segment) else segment for segment in parts.path.split("/")]
+    pattern = f"{parts.scheme}://{parts.netloc}{'/'.join(segments)}**"
+    return None if url_matches(pattern, login_url) else pattern
+
+
+class LoginRecipeStore:
+    def __init__(self, collection_name: str = "tool_login_recipes"):
+        self.collection_name = collection_name
+        self.hits = 0
+        self.misses = 0
+        self.learned = 0
+        self.failures = 0
+        self.dropped = 0
+
+    async def _collection(self):
+        from database import get_db
+
+        db = await get_db()
+        # Scripts without a database just don't get recipes
+        return db[self.collection_name] if db is not None else None
+
+    async def get(self, login_url: str) -> Optional[dict]:
+        collection = await self._collection()
+        recipe = await collection.find_one({"_id": recipe_key(login_url)}) if collection is not None else None
+        if recipe:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return recipe
+
+    async def record_success(self, login_url: str, tool_name: str, username_selector: str,
+                             password_selector: str, submit_selector: Optional[str], final_url: str):
+        collection = await self._collection()
+        if collection is None:
+            return
+        now = datetime.now(timezone.utc)
+        recipe = {
+            "tool_name": tool_name,
+            "username_selector": username_selector,
+            "password_selector": password_selector,
+            # None means "press Enter in the password field"
+            "submit_selector": submit_selector,
+            # None: only "left the login page" is checked on replay
+            "success_url": success_url_pattern(final_url, login_url),
+            "consecutive_failures": 0,
+            "last_success_at": now,
+        }
+        existing = await collection.find_one_and_update(
+            {"_id": recipe_key(login_url)},
+            {"$set": recipe, "$inc": {"successes": 1}, "$setOnInsert": {"learned_at": now}},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+        if existing is None or any(existing.get(k) != recipe[k] for k in (
+            "username_selector", "password_selector", "submit_selector", "success_url"
+        )):
+            self.learned += 1
+            print(f"[LoginRecipes] Learned login recipe for {tool_name} ({recipe_key(login_url)})")
+
+    async def record_failure(self, login_url: str):
+        collection = await self._collection()
+        if collection is None:
+            return
+        self.failures += 1
+        recipe = await collection.find_one_and_update(
+            {"_id": recipe_key(login_url)},
+            {"$inc": {"consecutive_failures": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        if recipe and recipe["consecutive_failures"] >= RECIPE_MAX_FAILURES:
+            await collection.delete_one({"_id": recipe["_id"], "consecutive_failures": {"$gte": RECIPE_MAX_FAILURES}})
+            self.dropped += 1
+            print(f"[LoginRecipes] Dropped login recipe for {recipe['_id']} after {RECIPE_MAX_FAILURES} failures")
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "learned": self.learned,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+# Global login recipe store
+login_recipes = LoginRecipeStore(os.getenv("LOGIN_RECIPE_COLLECTION", "tool_login_recipes"))
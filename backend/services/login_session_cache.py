@@ -0,0 +1,189 @@
+"""
+Login Session Cache
+Authenticated tool sessions (cookies + landing URL) from server-side logins,
+keyed by a fingerprint of (login page, username, password).
+- single-flight: concurrent requests for the same key share one in-flight
+  login instead of each driving a browser
+- bounded LRU with expiry in process
+- optionally persisted, encrypted, in MongoDB (TTL index), so restarted
+  workers and other replicas reuse the cookies instead of logging in again
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+LoginResult = Dict[str, Any]
+
+
+def login_cache_key(login_url: str, username: str, password: str) -> str:
+    """Changing the password (or account) gives a new key, so stale sessions aren't reused"""
+    return hashlib.sha256(f"{login_url}\0{username}\0{password}".encode()).hexdigest()
+
+
+class LoginSessionCache:
+    def __init__(self, max_entries: int = 200, ttl_seconds: float = 3600.0, persist: bool = False,
+                 collection_name: str = "tool_login_sessions"):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist = persist
+        self.collection_name = collection_name
+        # key -> (monotonic expiry, session)
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._indexed = False
+        self.hits = 0
+        self.persisted_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.logins = 0
+        self.evictions = 0
+
+    async def _collection(self):
+        from database import get_db
+
+        db = await get_db()
+        if db is None:
+            return None
+        collection = db[self.collection_name]
+        if not self._indexed:
+            await collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+        return collection
+
+    def _remember(self, key: str, session: dict, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, session)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, session = entry
+            if time.monotonic() < expires:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return session
+            del self._entries[key]
+
+        if self.persist:
+            session = await self._load(key)
+            if session is not None:
+                self.persisted_hits += 1
+                return session
+        self.misses += 1
+        return None
+
+    async def _load(self, key: str) -> Optional[dict]:
+        from utils.security import decrypt_credential
+
+        try:
+            collection = await self._collection()
+            if collection is None:
+                return None
+            now = datetime.now(timezone.utc)
+            doc = await collection.find_one({"_id": key, "expires_at": {"$gt": now}})
+            if doc is None:
+                return None
+            session = json.loads(decrypt_credential(doc["data"]))
+        except Exception as e:
+            print(f"[LoginCache] Failed to load persisted session: {e!r}")
+            return None
+        expires_at = doc["expires_at"]
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        self._remember(key, session, (expires_at - now).total_seconds())
+        return session
+
+    async def put(self, key: str, result: LoginResult):
+        session = {k: result[k] for k in ("cookies", "final_url", "tool_name") if k in result}
+        self._remember(key, session, self.ttl_seconds)
+        if not self.persist:
+            return
+
+        from utils.security import encrypt_credential
+
+        try:
+            collection = await self._collection()
+            if collection is None:
+                return
+            await collection.replace_one(
+                {"_id": key},
+                {
+                    "data": encrypt_credential(json.dumps(session)),
+                    "tool_name": session.get("tool_name"),
+                    "expires_at": datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds),
+                },
+                upsert=True
+            )
+        except Exception as e:
+            # Still cached in this process
+            print(f"[LoginCache] Failed to persist session: {e!r}")
+
+    async def invalidate(self, key: str):
+        """Forget a session (e.g. the tool rejected its cookies)"""
+        self._entries.pop(key, None)
+        if self.persist:
+            collection = await self._collection()
+            if collection is not None:
+                await collection.delete_one({"_id": key})
+
+    async def clear(self):
+        self._entries.clear()
+        if self.persist:
+            collection = await self._collection()
+            if collection is not None:
+                await collection.delete_many({})
+
+    async def get_or_login(self, key: str, login: Callable[[], Awaitable[LoginResult]],
+                           force_refresh: bool = False) -> LoginResult:
+        """Cached session, else join the in-flight login for this key, else start one"""
+        if not force_refresh:
+            session = await self.get(key)
+            if session is not None:
+                return {"success": True, **session, "cached": True}
+
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._login(key, login))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded: one caller giving up must not cancel the login the others wait on
+        return await asyncio.shield(task)
+
+    async def _login(self, key: str, login: Callable[[], Awaitable[LoginResult]]) -> LoginResult:
+        self.logins += 1
+        result = await login()
+        if result.get("success"):
+            await self.put(key, result)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "persisted": self.persist,
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "persisted_hits": self.persisted_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "logins": self.logins,
+            "evictions": self.evictions,
+        }
+
+
+# Global cache of authenticated tool sessions
+login_session_cache = LoginSessionCache(
+    max_entries=int(os.getenv("TOOL_LOGIN_CACHE_MAX_ENTRIES", "200")),
+    ttl_seconds=float(os.getenv("TOOL_LOGIN_CACHE_TTL_SECONDS", "3600")),
+    persist=os.getenv("TOOL_LOGIN_CACHE_PERSIST", "false").strip().lower() in {"1", "true", "yes", "on"},
+)
@@ -1,80 +1,358 @@
 """
 Google Cloud Secret Manager Service
 Place this file at: backend/services/secret_manager_service.py
+
+One process-wide `secret_manager` is shared by every module. It reads
+through the providers named in SECRET_PROVIDER, tried in order (default
+"gcp,env": Secret Manager, then environment variables), and keeps values in
+a TTL cache:
+- fresh values are served from memory
+- stale values are still served while one background task refetches them
+  (stale-while-revalidate), so rotated secrets are picked up without a restart
+- values older than the stale window are refetched before returning
+Provider calls are blocking (gRPC / file IO) and run in a worker thread, so
+async handlers never stall the event loop.
 """
 
-import os
+import asyncio
+import json
 import logging
-from google.cloud import secretmanager
-from typing import Optional, Dict
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
 
+# Read at startup so the first requests don't pay for them
+KNOWN_SECRETS = [
+    "mongo-uri", "jwt-secret", "encryption-key", "google-client-id", "google-client-secret", "extension-keys",
+]
+
+
+class GcpSecretProvider:
+    """Google Cloud Secret Manager; the gRPC client is created once, on first read"""
+
+    name = "gcp"
+
+    def __init__(self, project_id: str):
+        self.project_id = project_id
+        self._client = None
+        self._init_error: Optional[Exception] = None
+        self._lock = threading.Lock()
+
+    def _get_client(self):
+        with self._lock:
+            # Creating a client without credentials probes the metadata server
+            # for seconds; a failure is remembered instead of retried per read
+            if self._init_error is not None:
+                raise self._init_error
+            if self._client is None:
+                try:
+                    from google.cloud import secretmanager
+
+                    self._client = secretmanager.SecretManagerServiceClient()
+                except Exception as e:
+                    self._init_error = e
+                    logger.error(f"❌ Failed to initialize Secret Manager: {str(e)}")
+                    raise
+                logger.info(f"✅ Secret Manager initialized for project: {self.project_id}")
+            return self._client
+
+    def read(self, secret_name: str, version: str = "latest") -> Optional[str]:
+        """Blocking; None if the secret doesn't exist"""
+        client = self._get_client()
+        from google.api_core.exceptions import NotFound
+
+        name = f"projects/{self.project_id}/secrets/{secret_name}/versions/{version}"
+        try:
+            response = client.access_secret_version(request={"name": name})
+        except NotFound:
+            return None
+        return response.payload.data.decode('UTF-8')
+
+
+class FileSecretProvider:
+    """One file per secret in a directory (e.g. mounted secrets, or tests)"""
+
+    name = "file"
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    def read(self, secret_name: str, version: str = "latest") -> Optional[str]:
+        # Files only hold the current value
+        if version != "latest" or "/" in secret_name or secret_name.startswith("."):
+            return None
+        try:
+            return (self.directory / secret_name).read_text(encoding="utf-8").strip()
+        except FileNotFoundError:
+            return None
+
+
+class EnvSecretProvider:
+    """Environment variables: "truckstop-password" -> TRUCKSTOP_PASSWORD, plus the app's historical names"""
+
+    name = "env"
+
+    ALIASES = {
+        "mongo-uri": "MONGO_URL",
+        "jwt-secret": "JWT_SECRET_KEY",
+        "encryption-key": "ENCRYPTION_KEY",
+        "google-client-id": "GOOGLE_CLIENT_ID",
+        "google-client-secret": "GOOGLE_CLIENT_SECRET",
+        "extension-keys": "EXTENSION_KEY",
+    }
+
+    def read(self, secret_name: str, version: str = "latest") -> Optional[str]:
+        if version != "latest":
+            return None
+        env_var = self.ALIASES.get(secret_name, secret_name.upper().replace("-", "_"))
+        return os.getenv(env_var, "").strip() or None
+
+
+class ChainSecretProvider:
+    """First provider that has the secret wins; an error only surfaces if no provider has it"""
+
+    def __init__(self, providers: list):
+        self.providers = providers
+        self.name = ",".join(provider.name for provider in providers)
+
+    def read(self, secret_name: str, version: str = "latest") -> Optional[str]:
+        error = None
+        for provider in self.providers:
+            try:
+                value = provider.read(secret_name, version)
+            except Exception as e:
+                error = e
+                continue
+            if value is not None:
+                return value
+        if error is not None:
+            raise error
+        return None
+
+
+def _create_provider(backend: str):
+    if backend == "gcp":
+        return GcpSecretProvider(os.getenv('GCP_PROJECT_ID', 'dsg-transport-platform'))
+    if backend == "file":
+        return FileSecretProvider(os.getenv("SECRETS_DIR", "/run/secrets"))
+    if backend == "env":
+        return EnvSecretProvider()
+    raise RuntimeError(f"Unknown SECRET_PROVIDER '{backend}' (expected 'gcp', 'file' or 'env')")
+
+
+def create_secret_provider():
+    """SECRET_PROVIDER is a comma-separated list of backends, tried in order"""
+    backends = [b.strip().lower() for b in os.getenv("SECRET_PROVIDER", "gcp,env").split(",") if b.strip()]
+    if not backends:
+        raise RuntimeError("SECRET_PROVIDER names no secret backend")
+    providers = [_create_provider(backend) for backend in backends]
+    return providers[0] if len(providers) == 1 else ChainSecretProvider(providers)
+
+
+def tool_secret_prefix(tool_name: str) -> str:
+    return tool_name.lower().replace(" ", "-").replace(".", "")
+
+
+# Keys of a bundled "<tool>-credentials" secret (JSON); username and password are required
+TOOL_CREDENTIAL_FIELDS = ("username", "password", "login_url", "username_field", "password_field")
+
+
+def parse_tool_credentials(raw: str) -> Dict[str, str]:
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        raise ValueError("bundled credentials secret is not valid JSON")
+    if not isinstance(data, dict) or not data.get("username") or not data.get("password"):
+        raise ValueError("bundled credentials secret needs a username and a password")
+    return {key: str(data[key]) for key in TOOL_CREDENTIAL_FIELDS if data.get(key)}
+
+
 class SecretManagerService:
-    def __init__(self):
-        self.project_id = os.getenv('GCP_PROJECT_ID', 'dsg-transport-platform')
-        
+    def __init__(self, provider=None, ttl_seconds: float = 300.0, max_stale_seconds: float = 3600.0):
+        self.provider = provider if provider is not None else create_secret_provider()
+        self.ttl_seconds = ttl_seconds
+        self.max_stale_seconds = max_stale_seconds
+        # "name:version" -> (monotonic fetch time, value or None if the secret doesn't exist)
+        self.cache: Dict[str, Tuple[float, Optional[str]]] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.fetches = 0
+        self.refresh_failures = 0
+
+    def _fetch_sync(self, cache_key: str, secret_name: str, version: str) -> Optional[str]:
+        self.fetches += 1
+        value = self.provider.read(secret_name, version)
+        self.cache[cache_key] = (time.monotonic(), value)
+        return value
+
+    async def _fetch(self, cache_key: str, secret_name: str, version: str) -> Optional[str]:
+        self.fetches += 1
+        value = await asyncio.to_thread(self.provider.read, secret_name, version)
+        self.cache[cache_key] = (time.monotonic(), value)
+        if value is not None:
+            logger.info(f"✅ Retrieved secret: {secret_name}")
+        return value
+
+    def _start_fetch(self, cache_key: str, secret_name: str, version: str) -> asyncio.Task:
+        """One provider call per secret at a time; callers and refreshes share it"""
+        task = self._inflight.get(cache_key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(cache_key, secret_name, version))
+            self._inflight[cache_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(cache_key, None))
+        return task
+
+    def _refresh_in_background(self, cache_key: str, secret_name: str, version: str):
+        if cache_key in self._inflight:
+            return
+        task = self._start_fetch(cache_key, secret_name, version)
+
+        def done(task: asyncio.Task):
+            if not task.cancelled() and task.exception() is not None:
+                # Keep serving the stale value; the next read tries again
+                self.refresh_failures += 1
+                logger.error(f"❌ Failed to refresh secret {secret_name}: {task.exception()!s}")
+
+        task.add_done_callback(done)
+
+    async def get(self, secret_name: str, version: str = "latest") -> Optional[str]:
+        """Cached secret value; None if the secret doesn't exist"""
+        cache_key = f"{secret_name}:{version}"
+        entry = self.cache.get(cache_key)
+        if entry is not None:
+            fetched_at, value = entry
+            age = time.monotonic() - fetched_at
+            if age < self.ttl_seconds:
+                self.hits += 1
+                return value
+            if age < self.max_stale_seconds:
+                self.stale_hits += 1
+                self._refresh_in_background(cache_key, secret_name, version)
+                return value
+
         try:
-            self.client = secretmanager.SecretManagerServiceClient()
-            self.cache: Dict[str, str] = {}
-            logger.info(f"✅ Secret Manager initialized for project: {self.project_id}")
+            # Shielded: a cancelled request must not cancel a fetch others wait on
+            return await asyncio.shield(self._start_fetch(cache_key, secret_name, version))
         except Exception as e:
-            logger.error(f"❌ Failed to initialize Secret Manager: {str(e)}")
-            self.client = None
-            self.cache = {}
-    
-    def get_secret(self, secret_name: str, version: str = "latest") -> Optional[str]:
-        if not self.client:
+            logger.error(f"❌ Failed to retrieve secret {secret_name}: {str(e)}")
             raise HTTPException(
                 status_code=500,
-                detail="Secret Manager not initialized. Check GCP_PROJECT_ID environment variable."
+                detail=f"Failed to retrieve secret: {secret_name}"
             )
-        
+
+    def get_secret(self, secret_name: str, version: str = "latest") -> Optional[str]:
+        """Blocking read for import-time configuration; use `await get(...)` in request handlers"""
         cache_key = f"{secret_name}:{version}"
-        
-        if cache_key in self.cache:
-            logger.debug(f"📦 Retrieved {secret_name} from cache")
-            return self.cache[cache_key]
-        
+        entry = self.cache.get(cache_key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl_seconds:
+            self.hits += 1
+            return entry[1]
         try:
-            name = f"projects/{self.project_id}/secrets/{secret_name}/versions/{version}"
-            response = self.client.access_secret_version(request={"name": name})
-            secret_value = response.payload.data.decode('UTF-8')
-            
-            self.cache[cache_key] = secret_value
-            logger.info(f"✅ Retrieved secret: {secret_name}")
-            return secret_value
-            
+            return self._fetch_sync(cache_key, secret_name, version)
         except Exception as e:
             logger.error(f"❌ Failed to retrieve secret {secret_name}: {str(e)}")
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to retrieve secret: {secret_name}"
             )
-    
-    def get_tool_credentials(self, tool_name: str) -> Dict[str, str]:
+
+    async def get_tool_credentials(self, tool_name: str) -> Dict[str, str]:
+        """One "<tool>-credentials" JSON secret (username, password and optionally login_url,
+        username_field, password_field), else the legacy "<tool>-username" / "<tool>-password" pair"""
+        prefix = tool_secret_prefix(tool_name)
         try:
-            tool_name = tool_name.lower().replace(" ", "-").replace(".", "")
-            
-            credentials = {
-                "username": self.get_secret(f"{tool_name}-username"),
-                "password": self.get_secret(f"{tool_name}-password")
-            }
-            
-            logger.info(f"✅ Retrieved credentials for tool: {tool_name}")
-            return credentials
-            
+            bundle = await self.get(f"{prefix}-credentials")
+            if bundle is not None:
+                credentials = parse_tool_credentials(bundle)
+            else:
+                username, password = await asyncio.gather(
+                    self.get(f"{prefix}-username"),
+                    self.get(f"{prefix}-password")
+                )
+                if not username or not password:
+                    raise ValueError(f"secret {prefix}-username or {prefix}-password is not set")
+                credentials = {"username": username, "password": password}
         except Exception as e:
-            logger.error(f"❌ Failed to get {tool_name} credentials: {str(e)}")
+            logger.error(f"❌ Failed to get {prefix} credentials: {str(e)}")
             raise HTTPException(
                 status_code=500,
-                detail=f"Failed to retrieve credentials for {tool_name}"
+                detail=f"Failed to retrieve credentials for {prefix}"
             )
-    
+        logger.info(f"✅ Retrieved credentials for tool: {prefix}")
+        return credentials
+
+    async def prefetch(self, secret_names: List[str]) -> int:
+        """Fetch secrets in parallel; returns how many exist. Failures are logged, not raised."""
+        results = await asyncio.gather(*(self.get(name) for name in secret_names), return_exceptions=True)
+        for name, result in zip(secret_names, results):
+            if isinstance(result, Exception):
+                logger.warning(f"⚠️ Could not prefetch secret {name}: {result!s}")
+        return sum(1 for result in results if isinstance(result, str))
+
+    async def stop(self):
+        """Cancel background refreshes (call from the app lifespan)"""
+        tasks = list(self._inflight.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
     def clear_cache(self):
         self.cache = {}
         logger.info("🔄 Secret cache cleared")
 
-# Global instance
-secret_manager = SecretManagerService()
+    def stats(self) -> dict:
+        return {
+            "provider": self.provider.name,
+            "cached": len(self.cache),
+            "in_flight": len(self._inflight),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "fetches": self.fetches,
+            "refresh_failures": self.refresh_failures,
+        }
+
+
+async def prefetch_startup_secrets(timeout: float = 10.0) -> int:
+    """Warm the cache with the app's own secrets and every configured tool's credentials.
+    Startup doesn't wait longer than `timeout`; unfinished reads still land in the cache."""
+    from database import get_db
+    from utils.tool_mapping import normalize_tool_name
+
+    tools = []
+    db = await get_db()
+    if db is not None:
+        async for tool in db.tools.find({}, {"name": 1}):
+            tool_name = normalize_tool_name(tool.get("name", ""))
+            if tool_name and tool_name not in tools:
+                tools.append(tool_name)
+    started = time.perf_counter()
+    try:
+        found, *credentials = await asyncio.wait_for(
+            asyncio.gather(
+                secret_manager.prefetch(KNOWN_SECRETS),
+                *(secret_manager.get_tool_credentials(tool_name) for tool_name in tools),
+                return_exceptions=True
+            ),
+            timeout=timeout
+        )
+    except asyncio.TimeoutError:
+        print(f"[Secrets] Prefetch still running after {timeout:.0f}s, continuing startup")
+        return 0
+    loaded = sum(1 for result in credentials if isinstance(result, dict))
+    print(f"[Secrets] Prefetched {found}/{len(KNOWN_SECRETS)} app secrets and credentials for "
+          f"{loaded}/{len(tools)} tools in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return found + loaded
+
+
+# The one secret provider for the process (the GCP client is created on first read)
+secret_manager = SecretManagerService(
+    ttl_seconds=float(os.getenv("SECRET_CACHE_TTL_SECONDS", "300")),
+    max_stale_seconds=float(os.getenv("SECRET_CACHE_MAX_STALE_SECONDS", "3600")),
+)
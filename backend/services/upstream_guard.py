@@ -0,0 +1,239 @@
+"""
+Upstream Guard
+Per-host bulkhead and circuit breaker for calls to tool origins (gateway
+proxy, server-side tool logins).
+Bulkhead: at most N calls per host run at once; callers wait for a slot only
+up to a short timeout, so a slow origin can't pile requests onto the loop.
+Breaker: consecutive failures (errors, timeouts, 502/503/504) open the
+circuit and calls fail fast; after a cool-down a limited number of half-open
+probes decide whether it closes again or re-opens with a longer cool-down.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Upstream statuses that mean the origin itself is in trouble
+FAILURE_STATUSES = frozenset((502, 503, 504))
+
+
+class UpstreamRejected(Exception):
+    """The call was not attempted (circuit open or bulkhead full)"""
+
+    def __init__(self, host: str, reason: str, retry_after: float):
+        super().__init__(f"{host} is unavailable ({reason})")
+        self.host = host
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class HostGuard:
+    """Concurrency limit and breaker state for one upstream host"""
+
+    def __init__(self, host: str, max_concurrent: int, failure_threshold: int,
+                 reset_timeout: float, max_reset_timeout: float, half_open_probes: int):
+        self.host = host
+        self.max_concurrent = max_concurrent
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.half_open_probes = half_open_probes
+        self.reset_timeout = reset_timeout
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.in_flight = 0
+        self.waiting = 0
+        self.probes_in_flight = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected_open = 0
+        self.rejected_full = 0
+        self.trips = 0
+
+    def retry_after(self) -> float:
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def admit(self) -> bool:
+        """Breaker check before taking a slot; returns whether this call is a half-open probe"""
+        if self.state == OPEN:
+            if self.retry_after() > 0:
+                self.rejected_open += 1
+                raise UpstreamRejected(self.host, "circuit open", self.retry_after())
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            if self.probes_in_flight >= self.half_open_probes:
+                self.rejected_open += 1
+                raise UpstreamRejected(self.host, "circuit half-open", self.base_reset_timeout)
+            self.probes_in_flight += 1
+            return True
+        return False
+
+    def record(self, ok: bool, probe: bool):
+        if probe:
+            self.probes_in_flight -= 1
+        if ok:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if self.state != CLOSED:
+                print(f"[UpstreamGuard] Circuit for {self.host} closed")
+            self.state = CLOSED
+            self.reset_timeout = self.base_reset_timeout
+            return
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.state == HALF_OPEN:
+            # Probe failed: back off harder before the next one
+            self.reset_timeout = min(self.reset_timeout * 2, self.max_reset_timeout)
+            self._open()
+        elif self.state == CLOSED and self.consecutive_failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.trips += 1
+        print(f"[UpstreamGuard] Circuit for {self.host} opened for {self.reset_timeout:.0f}s "
+              f"after {self.consecutive_failures} failures")
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "retry_after": round(self.retry_after(), 1) if self.state == OPEN else 0,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "consecutive_failures": self.consecutive_failures,
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected_open": self.rejected_open,
+            "rejected_full": self.rejected_full,
+            "trips": self.trips,
+        }
+
+
+class Permit:
+    """A held bulkhead slot; report the outcome with record(), always release()"""
+
+    def __init__(self, guard: HostGuard, probe: bool):
+        self.guard = guard
+        self.probe = probe
+        self._recorded = False
+        self._released = False
+
+    def record(self, ok: bool):
+        if not self._recorded:
+            self._recorded = True
+            self.guard.record(ok, self.probe)
+
+    def record_status(self, status: int):
+        self.record(status not in FAILURE_STATUSES)
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        if not self._recorded:
+            # Abandoned without an outcome (e.g. the client went away) - not the host's fault
+            self._recorded = True
+            if self.probe:
+                self.guard.probes_in_flight -= 1
+        self.guard.in_flight -= 1
+        self.guard._slots.release()
+
+
+class UpstreamGuard:
+    def __init__(
+        self,
+        max_concurrent_per_host: int = 16,
+        queue_timeout: float = 2.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        max_reset_timeout: float = 300.0,
+        half_open_probes: int = 1
+    ):
+        self.max_concurrent_per_host = max_concurrent_per_host
+        self.queue_timeout = queue_timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_reset_timeout = max_reset_timeout
+        self.half_open_probes = half_open_probes
+        self._hosts: Dict[str, HostGuard] = {}
+
+    @staticmethod
+    def host_of(url: str) -> str:
+        parts = urlsplit(url)
+        return (parts.netloc or parts.path).lower()
+
+    def for_host(self, host: str) -> HostGuard:
+        guard = self._hosts.get(host)
+        if guard is None:
+            guard = self._hosts[host] = HostGuard(
+                host, self.max_concurrent_per_host, self.failure_threshold,
+                self.reset_timeout, self.max_reset_timeout, self.half_open_probes,
+            )
+        return guard
+
+    async def acquire(self, url: str, timeout: Optional[float] = None) -> Permit:
+        """Take a slot for the URL's host, or raise UpstreamRejected without calling it"""
+        guard = self.for_host(self.host_of(url))
+        probe = guard.admit()
+        wait = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+        guard.waiting += 1
+        try:
+            await asyncio.wait_for(guard._slots.acquire(), timeout=wait)
+        except asyncio.TimeoutError:
+            guard.rejected_full += 1
+            if probe:
+                guard.probes_in_flight -= 1
+            raise UpstreamRejected(guard.host, "too many concurrent requests", 1.0)
+        finally:
+            guard.waiting -= 1
+        guard.in_flight += 1
+        return Permit(guard, probe)
+
+    @asynccontextmanager
+    async def call(self, url: str, deadline: float):
+        """Guard a whole call: slot, deadline, and success/failure bookkeeping"""
+        started = time.monotonic()
+        permit = await self.acquire(url, timeout=deadline)
+        try:
+            async with asyncio.timeout(max(0.0, deadline - (time.monotonic() - started))):
+                yield permit
+        except TimeoutError:
+            permit.guard.timeouts += 1
+            permit.record(False)
+            raise
+        except Exception:
+            permit.record(False)
+            raise
+        else:
+            permit.record(True)
+        finally:
+            permit.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrent_per_host": self.max_concurrent_per_host,
+            "open_circuits": sorted(h for h, g in self._hosts.items() if g.state != CLOSED),
+            "hosts": {host: guard.stats() for host, guard in self._hosts.items()},
+        }
+
+
+# Global upstream guard instance
+upstream_guard = UpstreamGuard(
+    max_concurrent_per_host=int(os.getenv("UPSTREAM_MAX_CONCURRENT_PER_HOST", "16")),
+    queue_timeout=float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_SECONDS", "2")),
+    failure_threshold=int(os.getenv("UPSTREAM_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("UPSTREAM_BREAKER_RESET_SECONDS", "30")),
+    max_reset_timeout=float(os.getenv("UPSTREAM_BREAKER_MAX_RESET_SECONDS", "300")),
+)
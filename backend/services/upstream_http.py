@@ -0,0 +1,177 @@
+"""
+Upstream HTTP Client
+One long-lived aiohttp session for the tool gateway proxy.
+Connections are pooled with keep-alive and a per-host limit, DNS lookups are
+cached, and connect/read timeouts are configurable. There is deliberately no
+total timeout: aiohttp keeps it running until the response is released, so
+it would cut off long streamed downloads and uploads. Time to headers is
+bounded by the caller's deadline (the upstream guard). The shared session never stores
+cookies: each gateway session passes its own cookie dict, and redirects are
+followed here so cookies set along the way land in that dict only.
+Bodies are not decompressed, so the proxy can stream them through with their
+Content-Encoding; decompressor() is for callers that need the text.
+"""
+import os
+import zlib
+from typing import Dict, Optional
+from urllib.parse import urljoin
+
+import aiohttp
+
+REDIRECT_STATUSES = {301, 302, 303, 307, 308}
+
+# Only ask for encodings decompressor() can undo (no brotli dependency)
+ACCEPT_ENCODING = "gzip, deflate"
+
+
+class UpstreamHTTPClient:
+    def __init__(
+        self,
+        max_connections: int = 100,
+        max_per_host: int = 8,
+        keepalive_seconds: float = 30.0,
+        dns_cache_seconds: int = 300,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 30.0,
+        max_redirects: int = 10
+    ):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.keepalive_seconds = keepalive_seconds
+        self.dns_cache_seconds = dns_cache_seconds
+        self.timeout = aiohttp.ClientTimeout(
+            total=None, connect=connect_timeout, sock_read=read_timeout
+        )
+        self.max_redirects = max_redirects
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_lookups = 0
+        self.dns_cache_hits = 0
+
+    def _trace_config(self) -> aiohttp.TraceConfig:
+        trace = aiohttp.TraceConfig()
+
+        async def on_create(session, ctx, params):
+            self.connections_created += 1
+
+        async def on_reuse(session, ctx, params):
+            self.connections_reused += 1
+
+        async def on_dns(session, ctx, params):
+            self.dns_lookups += 1
+
+        async def on_dns_hit(session, ctx, params):
+            self.dns_cache_hits += 1
+
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        trace.on_dns_resolvehost_end.append(on_dns)
+        trace.on_dns_cache_hit.append(on_dns_hit)
+        return trace
+
+    async def start(self):
+        """Open the pooled session (call from the app lifespan)"""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.max_connections,
+            limit_per_host=self.max_per_host,
+            keepalive_timeout=self.keepalive_seconds,
+            ttl_dns_cache=self.dns_cache_seconds,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            # Cookies belong to gateway sessions, never to the shared pool
+            cookie_jar=aiohttp.DummyCookieJar(),
+            # Pass compressed bodies through untouched
+            auto_decompress=False,
+            trace_configs=[self._trace_config()],
+        )
+
+    async def stop(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def session(self) -> aiohttp.ClientSession:
+        # Started lazily for scripts/tests that don't run the lifespan
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        cookies: Dict[str, str],
+        headers: Optional[dict] = None,
+        data=None
+    ) -> aiohttp.ClientResponse:
+        """Send a request, following redirects and recording Set-Cookie into `cookies`.
+        `data` may be an async iterator (streamed upload); such a body can't be
+        re-sent, so a 307/308 answer to it is returned instead of followed.
+        The caller must release the returned response (use `async with`)."""
+        http = await self.session()
+        headers = {"Accept-Encoding": ACCEPT_ENCODING, **(headers or {})}
+        for _ in range(self.max_redirects + 1):
+            self.requests += 1
+            resp = await http.request(
+                method, url, headers=headers, data=data, cookies=cookies, allow_redirects=False
+            )
+            for cookie in resp.cookies.values():
+                cookies[cookie.key] = cookie.value
+
+            location = resp.headers.get("Location")
+            if resp.status not in REDIRECT_STATUSES or not location:
+                return resp
+            replayable = data is None or isinstance(data, (bytes, str))
+            if resp.status in (307, 308) and not replayable:
+                return resp
+            # Drain the (small) redirect body so the connection goes back to the pool
+            await resp.read()
+
+            url = urljoin(str(resp.url), location)
+            if resp.status == 303 or (resp.status in (301, 302) and method == "POST"):
+                method, data = "GET", None
+                headers = {k: v for k, v in headers.items() if k.lower() not in ("content-type", "content-length")}
+
+        raise aiohttp.ClientError(f"More than {self.max_redirects} redirects (last: {url})")
+
+    def stats(self) -> dict:
+        return {
+            "running": self._session is not None and not self._session.closed,
+            "max_connections": self.max_connections,
+            "max_per_host": self.max_per_host,
+            "requests": self.requests,
+            "connections_created": self.connections_created,
+            "connections_reused": self.connections_reused,
+            "dns_lookups": self.dns_lookups,
+            "dns_cache_hits": self.dns_cache_hits,
+        }
+
+
+def decompressor(content_encoding: Optional[str]):
+    """zlib decompressobj for a Content-Encoding, None for identity; raises on anything else"""
+    encoding = (content_encoding or "").strip().lower()
+    if encoding in ("", "identity"):
+        return None
+    if encoding in ("gzip", "x-gzip"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        # Auto-detect zlib or gzip header
+        return zlib.decompressobj(32 + zlib.MAX_WBITS)
+    raise ValueError(f"Unsupported Content-Encoding: {content_encoding}")
+
+
+# Global upstream HTTP client instance
+upstream_http = UpstreamHTTPClient(
+    max_connections=int(os.getenv("UPSTREAM_HTTP_MAX_CONNECTIONS", "100")),
+    max_per_host=int(os.getenv("UPSTREAM_HTTP_MAX_PER_HOST", "8")),
+    keepalive_seconds=float(os.getenv("UPSTREAM_HTTP_KEEPALIVE_SECONDS", "30")),
+    dns_cache_seconds=int(os.getenv("UPSTREAM_HTTP_DNS_CACHE_SECONDS", "300")),
+    connect_timeout=float(os.getenv("UPSTREAM_HTTP_CONNECT_TIMEOUT_SECONDS", "10")),
+    read_timeout=float(os.getenv("UPSTREAM_HTTP_READ_TIMEOUT_SECONDS", "30")),
+)
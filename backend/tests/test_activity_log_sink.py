@@ -0,0 +1,112 @@
+"""
+Unit tests for the write-behind activity log sink
+"""
+import asyncio
+
+import pytest
+
+import database
+from services.activity_log_sink import ActivityLogSink, COUNTED_FIELD
+
+
+class FakeCollection:
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+
+    async def insert_many(self, documents, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("primary stepped down")
+        self.batches.append(list(documents))
+
+
+class FakeStatsCollection:
+    def __init__(self):
+        self.counts = {}
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            email = request._filter["_id"]
+            self.counts[email] = self.counts.get(email, 0) + request._doc["$inc"]["log_count"]
+
+
+class FakeDB:
+    def __init__(self):
+        self.activity_logs = FakeCollection()
+        self.activity_log_user_stats = FakeStatsCollection()
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    fake = FakeDB()
+    monkeypatch.setattr(database, "db", fake)
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_flushes_in_batches_on_size(fake_db):
+    sink = ActivityLogSink(max_batch=5, flush_interval=10, max_queue=100)
+    await sink.start()
+    ids = [await sink.enqueue({"action": f"a{i}"}) for i in range(10)]
+    await asyncio.sleep(0.05)
+    assert [len(b) for b in fake_db.activity_logs.batches] == [5, 5]
+    assert len(set(ids)) == 10
+    await asyncio.wait_for(sink.stop(), timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_pending_entries(fake_db):
+    sink = ActivityLogSink(max_batch=100, flush_interval=10, max_queue=100)
+    await sink.start()
+    for i in range(3):
+        await sink.enqueue({"action": f"a{i}"})
+    await asyncio.sleep(0)
+    await asyncio.wait_for(sink.stop(), timeout=5)
+    written = [doc for batch in fake_db.activity_logs.batches for doc in batch]
+    assert len(written) == 3
+    assert sink.stats()["written"] == 3
+
+
+@pytest.mark.asyncio
+async def test_writes_directly_when_not_started(fake_db):
+    sink = ActivityLogSink()
+    log_id = await sink.enqueue({"action": "direct"})
+    assert str(fake_db.activity_logs.batches[0][0]["_id"]) == log_id
+
+
+@pytest.mark.asyncio
+async def test_stop_returns_while_flusher_waits_for_more_entries(fake_db):
+    sink = ActivityLogSink(max_batch=100, flush_interval=30, max_queue=100)
+    await sink.start()
+    for i in range(3):
+        await sink.enqueue({"action": f"a{i}"})
+    # Let the flusher pick up the first entry and wait on the batch deadline
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(sink.stop(), timeout=5)
+    assert sum(len(b) for b in fake_db.activity_logs.batches) == 3
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_retried(fake_db):
+    fake_db.activity_logs.failures = 1
+    sink = ActivityLogSink(max_batch=10, flush_interval=10, retry_backoff=0)
+    await sink.enqueue({"action": "retried"})
+    assert len(fake_db.activity_logs.batches) == 1
+    assert sink.stats()["retries"] == 1
+    assert sink.stats()["failed"] == 0
+
+
+@pytest.mark.asyncio
+async def test_written_batches_update_per_user_counts(fake_db):
+    sink = ActivityLogSink(max_batch=10, flush_interval=10)
+    await sink.start()
+    for email in ("a@dsgtransport.net", "a@dsgtransport.net", "b@dsgtransport.net"):
+        await sink.enqueue({"user_email": email, "action": "x"})
+    await asyncio.wait_for(sink.stop(), timeout=5)
+    assert fake_db.activity_log_user_stats.counts == {"a@dsgtransport.net": 2, "b@dsgtransport.net": 1}
+    # Marked as counted so the one-off seed script never counts them again
+    assert all(doc[COUNTED_FIELD] for batch in fake_db.activity_logs.batches for doc in batch)
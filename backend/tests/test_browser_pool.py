@@ -0,0 +1,109 @@
+"""
+Tests for the browser pool's scheduling and recycling (with a stand-in browser)
+"""
+import asyncio
+
+import pytest
+
+from services.browser_pool import BrowserPool, BrowserPoolBusy
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self):
+        self.connected = True
+        self.closed = False
+        self.contexts = []
+
+    def is_connected(self):
+        return self.connected and not self.closed
+
+    async def new_context(self, **options):
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs) -> BrowserPool:
+    async def launch():
+        return FakeBrowser()
+    return BrowserPool(launcher=launch, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_contexts_are_fresh_and_browsers_reused():
+    pool = make_pool(browsers=1)
+    seen = []
+    for _ in range(5):
+        async with pool.context() as context:
+            seen.append(context)
+    assert len({id(c) for c in seen}) == 5
+    assert all(c.closed for c in seen)
+    assert len({id(c.browser) for c in seen}) == 1
+    assert pool.stats()["launches"] == 1
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_browser_is_recycled_after_max_uses():
+    pool = make_pool(browsers=1, max_uses=3)
+    browsers = []
+    for _ in range(7):
+        async with pool.context() as context:
+            browsers.append(context.browser)
+    assert browsers[0] is browsers[2]
+    assert browsers[3] is not browsers[2]
+    assert browsers[0].closed
+    assert pool.stats()["recycled"] == 2
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_crashed_browser_is_replaced():
+    pool = make_pool(browsers=1)
+    async with pool.context() as context:
+        context.browser.connected = False
+    async with pool.context() as context:
+        assert context.browser.is_connected()
+    assert pool.stats()["unhealthy"] == 1
+    assert pool.stats()["launches"] == 2
+    await pool.stop()
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_and_bounded_wait_queue():
+    pool = make_pool(browsers=2, max_concurrency=2, max_waiting=1, acquire_timeout=0.2)
+    release = asyncio.Event()
+
+    async def login():
+        async with pool.context():
+            await release.wait()
+
+    holders = [asyncio.create_task(login()) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    queued = asyncio.create_task(login())
+    await asyncio.sleep(0.01)
+    assert pool.stats()["active_contexts"] == 2
+    assert pool.stats()["waiting"] == 1
+
+    # Queue is full: rejected straight away rather than piling up
+    with pytest.raises(BrowserPoolBusy):
+        async with pool.context():
+            pass
+
+    release.set()
+    await asyncio.gather(*holders, queued)
+    assert pool.stats()["rejected"] == 1
+    assert pool.stats()["launches"] == 2
+    await pool.stop()
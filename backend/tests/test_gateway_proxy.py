@@ -0,0 +1,280 @@
+"""
+Tests for the gateway proxy's streaming relay
+"""
+import base64
+import gzip
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from fastapi import FastAPI
+
+from routes import gateway
+from services.asset_cache import asset_cache
+from services.gateway_session_store import gateway_session_store
+from services.secret_manager_service import FileSecretProvider, SecretManagerService
+from services.upstream_guard import upstream_guard
+from services.upstream_http import upstream_http
+
+EXPORT = b"load,origin,destination\n" * 20000
+BUNDLE = b"console.log('tms');\n" * 5000
+
+# Requests the upstream saw for the JS bundle: full downloads and 304s
+bundle_calls = {"full": 0, "not_modified": 0}
+flaky_calls = []
+
+
+@pytest_asyncio.fixture
+async def upstream():
+    async def export(request):
+        body = gzip.compress(EXPORT)
+        response = web.StreamResponse(headers={
+            "Content-Type": "text/csv",
+            "Content-Encoding": "gzip",
+            "Content-Length": str(len(body)),
+            "Cache-Control": "private, max-age=60",
+        })
+        await response.prepare(request)
+        for i in range(0, len(body), 4096):
+            await response.write(body[i:i + 4096])
+        return response
+
+    async def upload(request):
+        size = 0
+        async for chunk in request.content.iter_chunked(65536):
+            size += len(chunk)
+        return web.json_response({"received": size, "type": request.content_type})
+
+    async def page(request):
+        base = f"http://{request.host}"
+        html = f'<a href="{base}/loads">Loads</a><img src="{base}/logo.png">'
+        return web.Response(body=gzip.compress(html.encode()), headers={
+            "Content-Type": "text/html", "Content-Encoding": "gzip",
+        })
+
+    async def bundle(request):
+        if request.headers.get("If-None-Match") == '"v1"':
+            bundle_calls["not_modified"] += 1
+            return web.Response(status=304, headers={"ETag": '"v1"', "Cache-Control": "max-age=60"})
+        bundle_calls["full"] += 1
+        return web.Response(body=BUNDLE, headers={
+            "Content-Type": "application/javascript", "ETag": '"v1"', "Cache-Control": "max-age=60",
+        })
+
+    async def avatar(request):
+        # Per-user image: cacheable in the user's browser, not shareable
+        return web.Response(body=request.cookies.get("sid", "anon").encode(), headers={
+            "Content-Type": "image/png", "Cache-Control": "max-age=60",
+        })
+
+    async def logo(request):
+        return web.Response(body=b"logo", headers={
+            "Content-Type": "image/png", "Cache-Control": "public, max-age=60",
+        })
+
+    async def flaky(request):
+        flaky_calls.append(request.path)
+        return web.Response(status=503, text="upstream maintenance")
+
+    bundle_calls.update(full=0, not_modified=0)
+    flaky_calls.clear()
+    asset_cache.clear()
+    upstream_guard._hosts.clear()
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_get("/static/app.js", bundle)
+    app.router.add_get("/avatar.png", avatar)
+    app.router.add_get("/logo.png", logo)
+    app.router.add_get("/flaky", flaky)
+    app.router.add_get("/export", export)
+    app.router.add_post("/upload", upload)
+    app.router.add_get("/page", page)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/"
+    await runner.cleanup()
+    await upstream_http.stop()
+
+
+@pytest_asyncio.fixture
+async def proxy(upstream):
+    token = "test-session-token"
+    session_hash = hashlib.sha256(token.encode()).hexdigest()
+    await gateway_session_store.create(session_hash, {
+        "base_url": upstream,
+        "cookies": {},
+        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5),
+    })
+    app = FastAPI()
+    app.include_router(gateway.router, prefix="/api/gateway")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client, f"/api/gateway/proxy/{token}", upstream
+    await gateway_session_store.delete(session_hash)
+
+
+@pytest.mark.asyncio
+async def test_downloads_stream_through_compressed_with_headers(proxy):
+    client, prefix, _ = proxy
+    resp = await client.get(f"{prefix}/export")
+    assert resp.status_code == 200
+    assert resp.headers["content-encoding"] == "gzip"
+    assert resp.headers["cache-control"] == "private, max-age=60"
+    assert resp.headers["content-length"] == str(len(gzip.compress(EXPORT)))
+    assert resp.content == EXPORT
+
+
+@pytest.mark.asyncio
+async def test_uploads_are_streamed_upstream(proxy):
+    client, prefix, _ = proxy
+    payload = b"x" * (3 * 1024 * 1024)
+    resp = await client.post(f"{prefix}/upload", content=payload, headers={"Content-Type": "application/octet-stream"})
+    assert resp.json() == {"received": len(payload), "type": "application/octet-stream"}
+
+
+@pytest.mark.asyncio
+async def test_html_is_decompressed_and_rewritten(proxy):
+    client, prefix, upstream = proxy
+    resp = await client.get(f"{prefix}/page")
+    assert "content-encoding" not in resp.headers
+    assert f'href="{prefix}/loads"' in resp.text
+    assert f'src="{prefix}/logo.png"' in resp.text
+
+
+@pytest.mark.asyncio
+async def test_static_assets_are_shared_and_revalidated(proxy):
+    client, prefix, upstream = proxy
+    other_token = "other-session-token"
+    other_hash = hashlib.sha256(other_token.encode()).hexdigest()
+    await gateway_session_store.create(other_hash, {
+        "base_url": upstream,
+        "cookies": {"sid": "bob"},
+        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5),
+    })
+    try:
+        first = await client.get(f"{prefix}/static/app.js")
+        assert first.headers["x-gateway-cache"] == "MISS"
+        assert first.content == BUNDLE
+
+        # Another session gets the same bundle without going upstream
+        second = await client.get(f"/api/gateway/proxy/{other_token}/static/app.js")
+        assert second.headers["x-gateway-cache"] == "HIT"
+        assert second.content == BUNDLE
+        assert bundle_calls == {"full": 1, "not_modified": 0}
+
+        # The browser's own copy is confirmed with a 304
+        conditional = await client.get(f"{prefix}/static/app.js", headers={"If-None-Match": 'W/"v1"'})
+        assert conditional.status_code == 304
+        assert conditional.content == b""
+
+        # A stale entry is revalidated upstream instead of downloaded again
+        asset_cache.lookup(f"{upstream}static/app.js", {"Cache-Control": "no-cache"})
+        third = await client.get(f"{prefix}/static/app.js")
+        assert third.headers["x-gateway-cache"] == "REVALIDATED"
+        assert third.content == BUNDLE
+        assert bundle_calls == {"full": 1, "not_modified": 1}
+    finally:
+        await gateway_session_store.delete(other_hash)
+
+    stats = asset_cache.stats()
+    assert stats["hits"] == 2
+    assert stats["revalidated"] == 1
+    assert stats["misses"] == 1
+    assert stats["bytes_saved"] == 3 * len(BUNDLE)
+
+
+@pytest.mark.asyncio
+async def test_private_responses_are_not_cached(proxy):
+    client, prefix, _ = proxy
+    await client.get(f"{prefix}/export")
+    await client.get(f"{prefix}/export")
+    assert asset_cache.stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_responses_fetched_with_cookies_are_shared_only_if_public(proxy):
+    client, _, upstream = proxy
+    tokens = {"alice-token": "alice", "bob-token": "bob"}
+    for token, sid in tokens.items():
+        await gateway_session_store.create(hashlib.sha256(token.encode()).hexdigest(), {
+            "base_url": upstream,
+            "cookies": {"sid": sid},
+            "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5),
+        })
+    try:
+        alice = await client.get("/api/gateway/proxy/alice-token/avatar.png")
+        bob = await client.get("/api/gateway/proxy/bob-token/avatar.png")
+        assert (alice.content, bob.content) == (b"alice", b"bob")
+        assert "x-gateway-cache" not in bob.headers
+
+        await client.get("/api/gateway/proxy/alice-token/logo.png")
+        shared = await client.get("/api/gateway/proxy/bob-token/logo.png")
+        assert shared.headers["x-gateway-cache"] == "HIT"
+    finally:
+        for token in tokens:
+            await gateway_session_store.delete(hashlib.sha256(token.encode()).hexdigest())
+    assert asset_cache.stats()["entries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_fails_fast_without_calling_upstream(proxy):
+    client, prefix, _ = proxy
+    for _ in range(upstream_guard.failure_threshold):
+        resp = await client.get(f"{prefix}/flaky")
+        assert resp.status_code == 503
+    calls = len(flaky_calls)
+
+    resp = await client.get(f"{prefix}/flaky")
+    assert resp.status_code == 503
+    assert int(resp.headers["retry-after"]) > 0
+    assert "upstream maintenance" not in resp.text
+    assert len(flaky_calls) == calls
+
+
+@pytest.mark.asyncio
+async def test_view_uses_credentials_stored_on_the_session(proxy, monkeypatch):
+    client, _, upstream = proxy
+    token = "view-session-token"
+    session_hash = hashlib.sha256(token.encode()).hexdigest()
+    await gateway_session_store.create(session_hash, {
+        "tool_name": "Truckstop",
+        "base_url": upstream,
+        "credentials": {"username": "dispatch@example.com", "password": "pw", "login_url": upstream},
+        "cookies": {},
+        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5),
+    })
+
+    async def no_refetch(tool_name):
+        raise AssertionError("credentials were fetched again")
+
+    monkeypatch.setattr(gateway.secret_manager, "get_tool_credentials", no_refetch)
+    try:
+        resp = await client.get(f"/api/gateway/view/{token}")
+    finally:
+        await gateway_session_store.delete(session_hash)
+    assert resp.status_code == 200
+    assert base64.b64encode(b"dispatch@example.com").decode() in resp.text
+
+
+@pytest.mark.asyncio
+async def test_view_without_any_credentials_shows_the_error_page(proxy, monkeypatch, tmp_path):
+    client, _, upstream = proxy
+    token = "no-credentials-token"
+    session_hash = hashlib.sha256(token.encode()).hexdigest()
+    await gateway_session_store.create(session_hash, {
+        "tool_name": "Truckstop",
+        "base_url": upstream,
+        "cookies": {},
+        "expires_at": datetime.now(timezone.utc) + timedelta(minutes=5),
+    })
+    monkeypatch.setattr(gateway, "secret_manager", SecretManagerService(FileSecretProvider(str(tmp_path))))
+    try:
+        resp = await client.get(f"/api/gateway/view/{token}")
+    finally:
+        await gateway_session_store.delete(session_hash)
+    assert resp.status_code == 500
+    assert "Credentials Error" in resp.text
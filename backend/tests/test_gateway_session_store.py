@@ -0,0 +1,54 @@
+"""
+Tests for the in-memory gateway session store
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.gateway_session_store import InMemoryGatewaySessionStore
+
+
+def make_session(seconds: float) -> dict:
+    now = datetime.now(timezone.utc)
+    return {"cookies": {}, "created_at": now, "expires_at": now + timedelta(seconds=seconds)}
+
+
+@pytest.mark.asyncio
+async def test_sweeper_drops_abandoned_sessions_on_time():
+    store = InMemoryGatewaySessionStore(sweep_interval=10)
+    await store.start()
+    await asyncio.sleep(0)
+    try:
+        await store.create("short", make_session(0.05))
+        await store.create("long", make_session(60))
+
+        # Nobody touches "short" again; the heap wakes the sweeper at its expiry
+        await asyncio.sleep(0.2)
+        assert store.stats()["sessions"] == 1
+        assert store.stats()["expired"] == 1
+        assert await store.get("long") is not None
+    finally:
+        await store.stop()
+
+
+@pytest.mark.asyncio
+async def test_cap_evicts_the_session_closest_to_expiry():
+    store = InMemoryGatewaySessionStore(max_sessions=3)
+    for i, seconds in enumerate((300, 100, 200, 400)):
+        await store.create(f"s{i}", make_session(seconds))
+
+    assert await store.get("s1") is None
+    assert all([await store.get(name) for name in ("s0", "s2", "s3")])
+    assert store.stats()["evicted"] == 1
+
+
+@pytest.mark.asyncio
+async def test_deleted_sessions_do_not_grow_the_heap():
+    store = InMemoryGatewaySessionStore()
+    for i in range(1000):
+        await store.create(f"s{i}", make_session(600))
+        await store.delete(f"s{i}")
+
+    assert store.stats()["sessions"] == 0
+    assert store.stats()["heap_entries"] <= 128
@@ -0,0 +1,52 @@
+from utils.html_rewriter import StreamingHTMLEncoder, StreamingHTMLRewriter, charset_from_content_type
+
+BASE = "https://tool.example.com/login"
+PREFIX = "/api/gateway/proxy/abc"
+
+PAGE = """<html><head><base href="https://tool.example.com/"><meta http-equiv="refresh" content="5; url=/next">
+<link HREF="/a.css"><style>body{background:url('/bg.png')} .x{background:url(&quot;https://tool.example.com/i.png&quot;)}</style></head>
+<body><img src=/logo.png srcset="/a.png 1x, https://tool.example.com/b.png 2x"><a href='https://other.com/x'>o</a>
+<div data-src="/lazy.png" style="background: url(/s.png)"></div><form action="/login"></form>
+<a href="/api/gateway/proxy/abc/done">already</a>
+<script>var u = "/api/x"; x.split("/");</script></body></html>"""
+
+
+def rewrite(text: str, chunk: int) -> str:
+    rewriter = StreamingHTMLRewriter(BASE, PREFIX)
+    out = "".join(rewriter.feed(text[i:i + chunk]) for i in range(0, len(text), chunk))
+    return out + rewriter.close()
+
+
+def test_rewrites_attributes_srcset_css_base_and_refresh():
+    out = rewrite(PAGE, len(PAGE))
+
+    assert f'<base href="{PREFIX}/">' in out
+    assert f'content="5; url={PREFIX}/next"' in out
+    assert f'HREF="{PREFIX}/a.css"' in out
+    assert f"url('{PREFIX}/bg.png')" in out
+    assert f"url(&quot;{PREFIX}/i.png&quot;)" in out
+    assert f"src={PREFIX}/logo.png " in out
+    assert f'srcset="{PREFIX}/a.png 1x, {PREFIX}/b.png 2x"' in out
+    assert f'data-src="{PREFIX}/lazy.png"' in out
+    assert f"url({PREFIX}/s.png)" in out
+    assert f'action="{PREFIX}/login"' in out
+    # Off-origin links, already-proxied paths and script strings are untouched
+    assert "href='https://other.com/x'" in out
+    assert f'href="{PREFIX}/done"' in out
+    assert 'var u = "/api/x"; x.split("/");' in out
+
+
+def test_chunk_boundaries_do_not_change_output():
+    expected = rewrite(PAGE, len(PAGE))
+    for chunk in (1, 2, 7, 64):
+        assert rewrite(PAGE, chunk) == expected
+
+
+def test_encoder_keeps_page_charset():
+    page = '<a href="/café">café</a>'.encode("latin-1")
+    encoder = StreamingHTMLEncoder(
+        StreamingHTMLRewriter(BASE, PREFIX), charset_from_content_type("text/html; charset=ISO-8859-1")
+    )
+    out = b"".join(encoder.feed(page[i:i + 3]) for i in range(0, len(page), 3)) + encoder.close()
+
+    assert out == f'<a href="{PREFIX}/café">café</a>'.encode("latin-1")
@@ -0,0 +1,87 @@
+"""
+Tests for the shared Fernet key ring and scheduled key rotation
+"""
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from cryptography.fernet import Fernet, InvalidToken
+
+from services.key_ring import KeyRing, parse_key_ring, select_keys
+from services.secret_manager_service import FileSecretProvider, SecretManagerService
+
+OLD, NEW, NEXT = (Fernet.generate_key().decode() for _ in range(3))
+NOW = datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+OVERLAP = timedelta(minutes=10)
+
+
+def scheduled(*entries):
+    return parse_key_ring(json.dumps([
+        {"key": key, "not_before": when.isoformat() if when else None} for key, when in entries
+    ]))
+
+
+def test_plain_list_keeps_every_key_primary_first():
+    assert select_keys(parse_key_ring(f"{NEW},\n{OLD}"), NOW, OVERLAP) == ([NEW, OLD], None)
+
+
+def test_scheduled_rotation_overlaps_then_retires_the_old_key():
+    entries = scheduled((OLD, None), (NEW, NOW - timedelta(minutes=5)), (NEXT, NOW + timedelta(hours=1)))
+    keys, next_change = select_keys(entries, NOW, OVERLAP)
+    # NEW encrypts, OLD is still inside its overlap window, NEXT already decrypts
+    assert keys == [NEW, OLD, NEXT]
+    assert next_change == NOW + timedelta(minutes=5)
+
+    keys, next_change = select_keys(entries, NOW + timedelta(minutes=6), OVERLAP)
+    assert keys == [NEW, NEXT]
+    assert next_change == NOW + timedelta(hours=1)
+
+    keys, _ = select_keys(entries, NOW + timedelta(hours=1), OVERLAP)
+    assert keys == [NEXT, NEW]
+
+
+@pytest.mark.asyncio
+async def test_workers_sharing_the_secret_decrypt_each_others_payloads(tmp_path, monkeypatch):
+    (tmp_path / "extension-keys").write_text(OLD)
+    monkeypatch.setattr("services.key_ring.secret_manager", SecretManagerService(FileSecretProvider(str(tmp_path))))
+    worker_a, worker_b = KeyRing("extension-keys"), KeyRing("extension-keys")
+    payload = await worker_a.encrypt(b"creds")
+    assert await worker_b.decrypt(payload) == b"creds"
+    assert not worker_b.stats()["generated"]
+
+
+@pytest.mark.asyncio
+async def test_rotation_is_picked_up_and_old_payloads_still_decrypt(tmp_path, monkeypatch):
+    secrets = SecretManagerService(FileSecretProvider(str(tmp_path)), ttl_seconds=0, max_stale_seconds=0)
+    monkeypatch.setattr("services.key_ring.secret_manager", secrets)
+    (tmp_path / "extension-keys").write_text(OLD)
+    ring = KeyRing("extension-keys")
+    old_payload = await ring.encrypt(b"before")
+
+    (tmp_path / "extension-keys").write_text(f"{NEW},{OLD}")
+    new_payload = await ring.encrypt(b"after")
+    assert Fernet(NEW.encode()).decrypt(new_payload.encode()) == b"after"
+    assert await ring.decrypt(old_payload) == b"before"
+
+    # A broken rotation keeps the working ring
+    (tmp_path / "extension-keys").write_text("not-a-key")
+    assert await ring.decrypt(new_payload) == b"after"
+
+    (tmp_path / "extension-keys").write_text(NEW)
+    with pytest.raises(InvalidToken):
+        await ring.decrypt(old_payload)
+
+
+@pytest.mark.asyncio
+async def test_unreadable_secret_falls_back_to_a_per_process_key(monkeypatch):
+    class Unconfigured:
+        name = "gcp"
+
+        def read(self, secret_name, version="latest"):
+            raise RuntimeError("Your default credentials were not found")
+
+    monkeypatch.setattr("services.key_ring.secret_manager", SecretManagerService(Unconfigured()))
+    ring = KeyRing("extension-keys")
+    payload = await ring.encrypt(b"creds")
+    assert await ring.decrypt(payload) == b"creds"
+    assert ring.stats()["generated"]
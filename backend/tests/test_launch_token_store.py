@@ -0,0 +1,65 @@
+"""
+Tests for the in-memory one-time launch token store
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.launch_token_store import (
+    TOKEN_EXPIRED,
+    TOKEN_INVALID,
+    TOKEN_OK,
+    TOKEN_USED,
+    InMemoryLaunchTokenStore,
+)
+
+
+def make_token(seconds: float) -> dict:
+    return {"tool_id": "t1", "expires_at": datetime.now(timezone.utc) + timedelta(seconds=seconds)}
+
+
+@pytest.mark.asyncio
+async def test_token_is_consumed_exactly_once():
+    store = InMemoryLaunchTokenStore()
+    await store.create("h", make_token(60))
+
+    results = await asyncio.gather(*(store.consume("h") for _ in range(10)))
+    statuses = [status for status, _ in results]
+    assert statuses.count(TOKEN_OK) == 1
+    assert statuses.count(TOKEN_USED) == 9
+    assert next(token for status, token in results if status == TOKEN_OK)["tool_id"] == "t1"
+
+
+@pytest.mark.asyncio
+async def test_unknown_and_expired_tokens_are_rejected():
+    store = InMemoryLaunchTokenStore()
+    await store.create("old", make_token(-1))
+    assert await store.consume("old") == (TOKEN_EXPIRED, None)
+    assert await store.consume("nope") == (TOKEN_INVALID, None)
+    assert store.stats()["rejected"] == 2
+
+
+@pytest.mark.asyncio
+async def test_sweeper_drops_expired_tokens_without_a_cleanup_call():
+    store = InMemoryLaunchTokenStore(sweep_interval=10)
+    await store.start()
+    await asyncio.sleep(0)
+    try:
+        await store.create("short", make_token(0.05))
+        await store.create("long", make_token(60))
+        await asyncio.sleep(0.2)
+        assert store.stats()["tokens"] == 1
+        assert store.stats()["expired"] == 1
+    finally:
+        await store.stop()
+
+
+@pytest.mark.asyncio
+async def test_cap_evicts_the_token_closest_to_expiry():
+    store = InMemoryLaunchTokenStore(max_tokens=2)
+    for name, seconds in (("a", 300), ("b", 100), ("c", 200)):
+        await store.create(name, make_token(seconds))
+    assert (await store.consume("b"))[0] == TOKEN_INVALID
+    assert (await store.consume("a"))[0] == TOKEN_OK
+    assert store.stats()["evicted"] == 1
@@ -0,0 +1,65 @@
+"""
+Tests for login recipe keys, learned post-login URL patterns and recipe replay
+"""
+import pytest
+
+from services.login_recipes import recipe_key, success_url_pattern, url_matches
+from services.tool_login_service import _login_with_recipe, _PhaseTimer
+
+
+def test_recipe_is_keyed_by_login_page_not_query_or_case():
+    assert recipe_key("https://App.AscendTMS.com/login/?next=/loads") == "app.ascendtms.com/login"
+    assert recipe_key("https://app.ascendtms.com/login") == "app.ascendtms.com/login"
+    assert recipe_key("https://portal.example.com") == "portal.example.com/"
+
+
+def test_success_pattern_wildcards_ids_and_ignores_query():
+    pattern = success_url_pattern(
+        "https://app.ascendtms.com/company/4821/dashboard?tab=loads", "https://app.ascendtms.com/login"
+    )
+    assert pattern == "https://app.ascendtms.com/company/*/dashboard**"
+    assert url_matches(pattern, "https://app.ascendtms.com/company/77/dashboard")
+    assert not url_matches(pattern, "https://app.ascendtms.com/login")
+
+
+def test_no_pattern_is_learned_when_it_would_match_the_login_page():
+    assert success_url_pattern("https://one.dat.com/", "https://one.dat.com/login") is None
+    assert success_url_pattern("https://app.example.com/#/dashboard", "https://app.example.com/#/login") is None
+    assert success_url_pattern("https://app.example.com/home", "https://sso.example.com/login") == (
+        "https://app.example.com/home**"
+    )
+
+
+class FakeElement:
+    async def fill(self, value):
+        pass
+
+
+class FakePage:
+    """Stays wherever it is: a login rejected in place"""
+
+    def __init__(self, url):
+        self.url = url
+
+    async def wait_for_selector(self, selector, state=None, timeout=None):
+        return FakeElement()
+
+    async def click(self, selector):
+        pass
+
+    async def wait_for_url(self, url, timeout=None):
+        if not (url(self.url) if callable(url) else url_matches(url, self.url)):
+            raise TimeoutError("Timeout waiting for navigation")
+
+
+@pytest.mark.asyncio
+async def test_recipe_replay_fails_when_the_page_never_leaves_the_login_page():
+    login_url = "https://one.dat.com/login"
+    # A pattern learned before such patterns were refused
+    recipe = {"username_selector": "#u", "password_selector": "#p", "submit_selector": "#go",
+              "success_url": "https://one.dat.com/**"}
+    assert not await _login_with_recipe(FakePage(login_url), recipe, login_url, "u", "wrong", _PhaseTimer())
+
+    recipe["success_url"] = None
+    assert not await _login_with_recipe(FakePage(login_url + "?error=1"), recipe, login_url, "u", "wrong", _PhaseTimer())
+    assert await _login_with_recipe(FakePage("https://one.dat.com/search"), recipe, login_url, "u", "pw", _PhaseTimer())
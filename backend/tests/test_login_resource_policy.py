@@ -0,0 +1,75 @@
+"""
+Tests for the resource blocking policy and phase timings of tool logins
+"""
+import pytest
+
+from services.tool_login_service import LoginTimings, ResourcePolicy
+
+
+def test_blocks_heavy_resources_and_trackers_but_keeps_the_page_working():
+    policy = ResourcePolicy()
+    assert policy.blocks("image", "https://app.example.com/logo.png")
+    assert policy.blocks("font", "https://fonts.gstatic.com/inter.woff2")
+    assert policy.blocks("script", "https://www.googletagmanager.com/gtm.js")
+    assert policy.blocks("xhr", "https://api-js.mixpanel.com/track")
+    assert not policy.blocks("document", "https://app.example.com/login")
+    assert not policy.blocks("script", "https://app.example.com/app.js")
+    assert not policy.blocks("stylesheet", "https://app.example.com/app.css")
+    assert not policy.blocks("xhr", "https://app.example.com/api/session")
+
+
+def test_allow_list_by_resource_type_and_domain():
+    policy = ResourcePolicy(allow=["image", "hotjar.com"])
+    assert not policy.blocks("image", "https://app.example.com/captcha.png")
+    assert not policy.blocks("script", "https://static.hotjar.com/c/hotjar.js")
+    assert policy.blocks("font", "https://app.example.com/font.woff2")
+
+
+def test_disabled_policy_blocks_nothing():
+    assert not ResourcePolicy(enabled=False).blocks("image", "https://doubleclick.net/pixel.gif")
+
+
+def test_for_tool_merges_configured_allow_list(monkeypatch):
+    monkeypatch.setattr("services.tool_login_service.RESOURCE_ALLOW_LISTS", {"tms.example.com": ["font"]})
+    policy = ResourcePolicy.for_tool("https://TMS.example.com/login", ["Image"])
+    assert not policy.blocks("font", "https://tms.example.com/a.woff2")
+    assert not policy.blocks("image", "https://tms.example.com/a.png")
+    assert ResourcePolicy.for_tool("https://other.example.com/login").blocks("font", "https://x.com/a.woff2")
+
+
+@pytest.mark.asyncio
+async def test_installed_route_aborts_and_counts_blocked_requests():
+    class Route:
+        def __init__(self, resource_type, url):
+            self.request = type("Request", (), {"resource_type": resource_type, "url": url})()
+            self.outcome = None
+
+        async def abort(self):
+            self.outcome = "aborted"
+
+        async def continue_(self):
+            self.outcome = "continued"
+
+    class Context:
+        async def route(self, pattern, handler):
+            self.handler = handler
+
+    policy = ResourcePolicy()
+    context = Context()
+    await policy.install(context)
+    image, script = Route("image", "https://a.example.com/x.png"), Route("script", "https://a.example.com/x.js")
+    await context.handler(image)
+    await context.handler(script)
+    assert (image.outcome, script.outcome, policy.blocked) == ("aborted", "continued", 1)
+
+
+def test_login_timings_average_recent_logins_per_tool():
+    timings = LoginTimings(window=2)
+    timings.record("TMS", {"navigate": 900, "total": 3000}, blocked=10, success=False)
+    timings.record("TMS", {"navigate": 300, "total": 1000}, blocked=20, success=True)
+    timings.record("TMS", {"navigate": 100, "total": 600}, blocked=30, success=True)
+    report = timings.stats()["TMS"]
+    assert report["logins"] == 2
+    assert report["successes"] == 2
+    assert report["avg_ms"] == {"navigate": 200, "total": 800}
+    assert report["avg_blocked_requests"] == 25
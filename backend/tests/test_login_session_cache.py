@@ -0,0 +1,77 @@
+"""
+Tests for single-flight tool logins and the bounded session cache
+"""
+import asyncio
+
+import pytest
+
+from services.login_session_cache import LoginSessionCache, login_cache_key
+
+
+def counting_login(results, delay=0.05, success=True):
+    async def login():
+        await asyncio.sleep(delay)
+        results.append("login")
+        if not success:
+            return {"success": False, "error": "Login failed - please verify credentials"}
+        return {"success": True, "cookies": [{"name": "sid", "value": str(len(results))}], "final_url": "/home"}
+    return login
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_login():
+    cache = LoginSessionCache()
+    key = login_cache_key("https://tms.example.com/login", "dispatch", "secret")
+    logins = []
+    results = await asyncio.gather(*(cache.get_or_login(key, counting_login(logins)) for _ in range(10)))
+
+    assert logins == ["login"]
+    assert all(r["success"] and r["cookies"] == results[0]["cookies"] for r in results)
+    assert cache.stats()["coalesced"] == 9
+
+    # Later callers get the cached session without logging in
+    again = await cache.get_or_login(key, counting_login(logins))
+    assert again["cached"] is True
+    assert logins == ["login"]
+
+
+@pytest.mark.asyncio
+async def test_failed_logins_are_shared_but_not_cached():
+    cache = LoginSessionCache()
+    logins = []
+    results = await asyncio.gather(*(cache.get_or_login("k", counting_login(logins, success=False)) for _ in range(3)))
+    assert logins == ["login"]
+    assert not any(r["success"] for r in results)
+    await cache.get_or_login("k", counting_login(logins, success=False))
+    assert logins == ["login", "login"]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_login():
+    cache = LoginSessionCache()
+    logins = []
+    first = asyncio.create_task(cache.get_or_login("k", counting_login(logins)))
+    second = asyncio.create_task(cache.get_or_login("k", counting_login(logins)))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    result = await second
+    assert result["success"]
+    assert logins == ["login"]
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded_and_expires():
+    cache = LoginSessionCache(max_entries=2, ttl_seconds=0.05)
+    for key in ("a", "b", "c"):
+        await cache.put(key, {"success": True, "cookies": [], "final_url": "/"})
+    assert await cache.get("a") is None
+    assert await cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+    await asyncio.sleep(0.06)
+    assert await cache.get("c") is None
+
+
+def test_key_changes_with_credentials():
+    url = "https://tms.example.com/login"
+    assert login_cache_key(url, "dispatch", "old") != login_cache_key(url, "dispatch", "new")
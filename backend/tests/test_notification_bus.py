@@ -0,0 +1,103 @@
+"""
+Tests for resuming the MongoDB notification bus tail after a reconnect
+"""
+import asyncio
+
+import pytest
+
+from utils.notification_bus import MongoNotificationBus
+
+
+class FakeTailableCursor:
+    """Yields the documents present when opened; optionally dies after a few"""
+
+    def __init__(self, docs, fail_after=None):
+        self.docs = list(docs)
+        self.fail_after = fail_after
+        self.alive = True
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for index, doc in enumerate(self.docs):
+            if self.fail_after is not None and index == self.fail_after:
+                self.alive = False
+                raise ConnectionError("connection reset")
+            yield doc
+        self.alive = False
+
+
+class FakeCappedCollection:
+    """Documents in insertion order, like a capped collection's natural order"""
+
+    def __init__(self, docs):
+        self.docs = list(docs)
+        self.fail_next_after = None
+        self.opened = asyncio.Event()
+
+    def find(self, query, cursor_type=None):
+        docs = [doc for doc in self.docs if all(self._matches(doc[k], v) for k, v in query.items())]
+        cursor = FakeTailableCursor(docs, self.fail_next_after)
+        self.fail_next_after = None
+        self.opened.set()
+        return cursor
+
+    @staticmethod
+    def _matches(value, condition):
+        if isinstance(condition, dict):
+            return all(op == "$gt" and value > operand for op, operand in condition.items())
+        return value == condition
+
+
+def event(_id, origin="worker-b"):
+    return {"_id": _id, "origin": origin, "frame": f"frame-{_id}"}
+
+
+async def tail(collection, last_id, expected):
+    bus = MongoNotificationBus(retry_delay=0)
+    received = []
+
+    async def handler(doc):
+        received.append(doc["_id"])
+
+    async def fake_collection():
+        return collection
+
+    bus._collection = fake_collection
+    bus._origin, bus._handler = "worker-a", handler
+    task = asyncio.create_task(bus._tail(last_id))
+    try:
+        for _ in range(200):
+            if len(received) >= expected:
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    return bus, received
+
+
+@pytest.mark.asyncio
+async def test_reconnect_resumes_by_position_not_by_object_id():
+    # _ids from different workers don't follow insertion order
+    collection = FakeCappedCollection([{"_id": 50, "origin": "bus"}, event(90)])
+    collection.fail_next_after = 2
+
+    async def publish_during_outage():
+        await collection.opened.wait()
+        collection.docs += [event(30), event(70), event(10, origin="worker-a")]
+
+    publisher = asyncio.create_task(publish_during_outage())
+    bus, received = await tail(collection, 50, expected=3)
+    await publisher
+    assert received == [90, 30, 70]
+    assert bus.reconnects >= 1
+
+
+@pytest.mark.asyncio
+async def test_events_are_delivered_when_the_resume_point_rolled_off():
+    collection = FakeCappedCollection([event(40), event(20)])
+    _, received = await tail(collection, 99, expected=2)
+    assert received == [40, 20]
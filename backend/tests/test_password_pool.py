@@ -0,0 +1,72 @@
+"""
+Unit tests for the bcrypt worker pool behind hash_password_async / verify_password_async
+"""
+import asyncio
+import threading
+
+import pytest
+
+from utils import security
+from utils.security import (
+    _run_password_job,
+    hash_password_async,
+    password_pool_stats,
+    verify_password_async,
+)
+
+
+@pytest.fixture(autouse=True)
+def password_pool():
+    yield
+    security.shutdown_password_pool()
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_round_trip():
+    hashed = await hash_password_async("correct horse battery staple")
+    assert hashed != "correct horse battery staple"
+    assert hashed.startswith("$2b$")
+    assert await verify_password_async("correct horse battery staple", hashed) is True
+
+
+@pytest.mark.asyncio
+async def test_wrong_password_is_rejected():
+    hashed = await hash_password_async("correct horse battery staple")
+    assert await verify_password_async("Tr0ub4dor&3", hashed) is False
+    assert await verify_password_async("", hashed) is False
+
+
+@pytest.mark.asyncio
+async def test_stats_count_jobs_in_flight_and_completed(monkeypatch):
+    monkeypatch.setattr(security, "PASSWORD_HASH_WORKERS", 2)
+    release = threading.Event()
+    before = password_pool_stats()
+
+    # More jobs than workers: two run, the rest wait in the pool's queue
+    jobs = [asyncio.create_task(_run_password_job(release.wait, 5)) for _ in range(5)]
+    await asyncio.sleep(0.05)
+    during = password_pool_stats()
+    assert during["workers"] == 2
+    assert during["queue_depth"] == before["queue_depth"] + 5
+    assert during["queue_peak"] >= during["queue_depth"]
+    assert during["completed"] == before["completed"]
+
+    release.set()
+    assert await asyncio.gather(*jobs) == [True] * 5
+    after = password_pool_stats()
+    assert after["queue_depth"] == before["queue_depth"]
+    assert after["completed"] == before["completed"] + 5
+
+
+@pytest.mark.asyncio
+async def test_failed_jobs_leave_the_queue(monkeypatch):
+    def broken(password):
+        raise ValueError("hash backend unavailable")
+
+    monkeypatch.setattr(security, "hash_password", broken)
+    before = password_pool_stats()
+    with pytest.raises(ValueError):
+        await hash_password_async("secret")
+    after = password_pool_stats()
+    assert after["queue_depth"] == before["queue_depth"]
+    assert after["completed"] == before["completed"] + 1
@@ -0,0 +1,62 @@
+"""
+Unit tests for the in-process principal cache used by get_current_user
+"""
+import time
+
+from utils.principal_cache import PrincipalCache
+
+
+def test_hit_after_set_and_counters():
+    cache = PrincipalCache(ttl_seconds=60, max_entries=10)
+    assert cache.get("u1") is None
+    cache.set("u1", {"id": "u1", "status": "Active"}, cache.version("u1"))
+    assert cache.get("u1") == {"id": "u1", "status": "Active"}
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_invalidate_drops_entry_and_rejects_stale_write():
+    cache = PrincipalCache(ttl_seconds=60, max_entries=10)
+    version = cache.version("u1")
+    cache.set("u1", {"id": "u1", "status": "Active"}, version)
+    cache.invalidate("u1")
+    assert cache.get("u1") is None
+    # A read that started before the invalidation must not repopulate the cache
+    assert cache.set("u1", {"id": "u1", "status": "Active"}, version) is False
+    assert cache.get("u1") is None
+
+
+def test_lru_eviction_and_ttl_expiry():
+    cache = PrincipalCache(ttl_seconds=60, max_entries=2)
+    for user_id in ("a", "b"):
+        cache.set(user_id, {"id": user_id}, 0)
+    cache.get("a")
+    cache.set("c", {"id": "c"}, 0)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+    expired = PrincipalCache(ttl_seconds=0.0001, max_entries=2)
+    expired.set("a", {"id": "a"}, 0)
+    time.sleep(0.001)
+    assert expired.get("a") is None
+
+
+def test_returned_principal_is_a_copy():
+    cache = PrincipalCache(ttl_seconds=60, max_entries=2)
+    cache.set("a", {"id": "a", "role": "User"}, 0)
+    cache.get("a")["role"] = "Super Administrator"
+    assert cache.get("a")["role"] == "User"
+
+
+def test_invalidation_record_stays_bounded():
+    cache = PrincipalCache(ttl_seconds=60, max_entries=2)
+    stale_version = cache.version("u0")
+    for i in range(100):
+        cache.invalidate(f"u{i}")
+    cache.clear()
+    assert len(cache._invalidations) <= 2
+    # The pruned invalidation of u0 must still reject the read that raced it
+    assert cache.set("u0", {"id": "u0"}, stale_version) is False
+    assert cache.set("u0", {"id": "u0"}, cache.version("u0")) is True
@@ -0,0 +1,169 @@
+"""
+Tests for the secret providers and the TTL secret cache (stale-while-revalidate)
+"""
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from services.secret_manager_service import (
+    ChainSecretProvider,
+    EnvSecretProvider,
+    FileSecretProvider,
+    SecretManagerService,
+    create_secret_provider,
+)
+
+
+class CountingProvider(FileSecretProvider):
+    def __init__(self, directory, delay=0.0):
+        super().__init__(directory)
+        self.delay = delay
+        self.reads = 0
+        self.fail = False
+
+    def read(self, secret_name, version="latest"):
+        self.reads += 1
+        if self.fail:
+            raise ConnectionError("secret backend unreachable")
+        if self.delay:
+            time.sleep(self.delay)
+        return super().read(secret_name, version)
+
+
+def age_cache(service, seconds):
+    for key, (fetched_at, value) in service.cache.items():
+        service.cache[key] = (fetched_at - seconds, value)
+
+
+@pytest.mark.asyncio
+async def test_file_provider_reads_secrets_and_missing_is_none(tmp_path):
+    (tmp_path / "jwt-secret").write_text("s3cret\n")
+    service = SecretManagerService(FileSecretProvider(str(tmp_path)))
+    assert await service.get("jwt-secret") == "s3cret"
+    assert await service.get("nope") is None
+    assert await service.get("../jwt-secret") is None
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reads_share_one_fetch(tmp_path):
+    (tmp_path / "mongo-uri").write_text("mongodb://db")
+    provider = CountingProvider(str(tmp_path), delay=0.05)
+    service = SecretManagerService(provider)
+    values = await asyncio.gather(*(service.get("mongo-uri") for _ in range(10)))
+    assert values == ["mongodb://db"] * 10
+    assert provider.reads == 1
+    assert await service.get("mongo-uri") == "mongodb://db"
+    assert provider.reads == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_value_is_served_while_refreshing(tmp_path):
+    (tmp_path / "tms-password").write_text("old")
+    provider = CountingProvider(str(tmp_path))
+    service = SecretManagerService(provider, ttl_seconds=60, max_stale_seconds=600)
+    assert await service.get("tms-password") == "old"
+
+    (tmp_path / "tms-password").write_text("rotated")
+    age_cache(service, 120)
+    assert await service.get("tms-password") == "old"
+    await asyncio.gather(*service._inflight.values())
+    assert await service.get("tms-password") == "rotated"
+    assert service.stats()["stale_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_stale_value_but_expired_value_raises(tmp_path):
+    (tmp_path / "jwt-secret").write_text("value")
+    provider = CountingProvider(str(tmp_path))
+    service = SecretManagerService(provider, ttl_seconds=60, max_stale_seconds=600)
+    await service.get("jwt-secret")
+
+    provider.fail = True
+    age_cache(service, 120)
+    assert await service.get("jwt-secret") == "value"
+    await asyncio.gather(*service._inflight.values(), return_exceptions=True)
+    assert service.stats()["refresh_failures"] == 1
+
+    age_cache(service, 1000)
+    with pytest.raises(HTTPException):
+        await service.get("jwt-secret")
+
+
+@pytest.mark.asyncio
+async def test_tool_credentials_and_prefetch(tmp_path):
+    (tmp_path / "truckstop-username").write_text("dispatch")
+    (tmp_path / "truckstop-password").write_text("pw")
+    provider = CountingProvider(str(tmp_path))
+    service = SecretManagerService(provider)
+    assert await service.prefetch(["truckstop-username", "truckstop-password", "missing"]) == 2
+    assert await service.get_tool_credentials("Truckstop") == {"username": "dispatch", "password": "pw"}
+    # Only the (missing) bundled secret was read; the legacy pair came from the cache
+    assert provider.reads == 4
+    await service.get_tool_credentials("Truckstop")
+    assert provider.reads == 4
+
+
+def test_env_provider_uses_historical_names(monkeypatch):
+    monkeypatch.setenv("JWT_SECRET_KEY", "jwt")
+    monkeypatch.setenv("TRUCKSTOP_PASSWORD", "pw")
+    provider = EnvSecretProvider()
+    assert provider.read("jwt-secret") == "jwt"
+    assert provider.read("truckstop-password") == "pw"
+    assert provider.read("missing-secret") is None
+
+
+def test_chain_falls_through_missing_and_failing_providers(tmp_path, monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_KEY", "from-env")
+    broken = CountingProvider(str(tmp_path))
+    broken.fail = True
+    chain = ChainSecretProvider([broken, FileSecretProvider(str(tmp_path)), EnvSecretProvider()])
+    assert chain.read("encryption-key") == "from-env"
+    with pytest.raises(ConnectionError):
+        chain.read("not-anywhere")
+
+
+def test_provider_registry_from_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("SECRET_PROVIDER", "file, env")
+    monkeypatch.setenv("SECRETS_DIR", str(tmp_path))
+    assert create_secret_provider().name == "file,env"
+    monkeypatch.setenv("SECRET_PROVIDER", "env")
+    assert isinstance(create_secret_provider(), EnvSecretProvider)
+    monkeypatch.setenv("SECRET_PROVIDER", "vault")
+    with pytest.raises(RuntimeError):
+        create_secret_provider()
+
+
+@pytest.mark.asyncio
+async def test_bundled_tool_credentials_take_one_read(tmp_path):
+    (tmp_path / "rmis-credentials").write_text(
+        '{"username": "ops", "password": "pw", "login_url": "https://rmis.example.com/login", "extra": "x"}'
+    )
+    (tmp_path / "rmis-username").write_text("legacy")
+    provider = CountingProvider(str(tmp_path))
+    service = SecretManagerService(provider)
+    assert await service.get_tool_credentials("RMIS") == {
+        "username": "ops", "password": "pw", "login_url": "https://rmis.example.com/login",
+    }
+    assert provider.reads == 1
+
+
+@pytest.mark.asyncio
+async def test_malformed_bundle_is_an_error_not_a_fallback(tmp_path):
+    (tmp_path / "rmis-credentials").write_text('{"username": "ops"}')
+    (tmp_path / "rmis-username").write_text("legacy")
+    (tmp_path / "rmis-password").write_text("legacy")
+    service = SecretManagerService(FileSecretProvider(str(tmp_path)))
+    with pytest.raises(HTTPException):
+        await service.get_tool_credentials("rmis")
+
+
+@pytest.mark.asyncio
+async def test_missing_tool_credentials_are_an_error(tmp_path):
+    service = SecretManagerService(FileSecretProvider(str(tmp_path)))
+    with pytest.raises(HTTPException):
+        await service.get_tool_credentials("rmis")
+    (tmp_path / "rmis-username").write_text("ops")
+    with pytest.raises(HTTPException):
+        await service.get_tool_credentials("rmis")
@@ -0,0 +1,97 @@
+"""
+Tests for the per-host bulkhead and circuit breaker
+"""
+import asyncio
+
+import pytest
+
+from services.upstream_guard import CLOSED, HALF_OPEN, OPEN, UpstreamGuard, UpstreamRejected
+
+URL = "https://loads.example.com/board"
+
+
+async def fail(guard: UpstreamGuard):
+    with pytest.raises(ConnectionError):
+        async with guard.call(URL, deadline=1):
+            raise ConnectionError("reset by peer")
+
+
+@pytest.mark.asyncio
+async def test_breaker_opens_fails_fast_and_closes_after_probe():
+    guard = UpstreamGuard(failure_threshold=3, reset_timeout=0.1)
+    host = guard.for_host("loads.example.com")
+    for _ in range(3):
+        await fail(guard)
+    assert host.state == OPEN
+
+    with pytest.raises(UpstreamRejected) as rejected:
+        async with guard.call(URL, deadline=1):
+            pytest.fail("called a host whose circuit is open")
+    assert rejected.value.retry_after > 0
+
+    # After the cool-down one probe goes through; its success closes the circuit
+    await asyncio.sleep(0.15)
+    async with guard.call(URL, deadline=1) as permit:
+        assert host.state == HALF_OPEN
+        permit.record_status(200)
+    assert host.state == CLOSED
+    assert host.stats()["rejected_open"] == 1
+    assert host.stats()["trips"] == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_probe_reopens_with_longer_cooldown():
+    guard = UpstreamGuard(failure_threshold=1, reset_timeout=0.05)
+    host = guard.for_host("loads.example.com")
+    await fail(guard)
+    await asyncio.sleep(0.06)
+    await fail(guard)
+    assert host.state == OPEN
+    assert host.reset_timeout == pytest.approx(0.1)
+
+
+@pytest.mark.asyncio
+async def test_gateway_errors_count_and_other_hosts_are_unaffected():
+    guard = UpstreamGuard(failure_threshold=2)
+    for _ in range(2):
+        async with guard.call(URL, deadline=1) as permit:
+            permit.record_status(503)
+    assert guard.for_host("loads.example.com").state == OPEN
+
+    async with guard.call("https://fuel.example.com/", deadline=1) as permit:
+        permit.record_status(200)
+    assert guard.stats()["open_circuits"] == ["loads.example.com"]
+
+
+@pytest.mark.asyncio
+async def test_bulkhead_rejects_instead_of_queueing_forever():
+    guard = UpstreamGuard(max_concurrent_per_host=2, queue_timeout=0.05)
+    release = asyncio.Event()
+
+    async def slow_call():
+        async with guard.call(URL, deadline=5):
+            await release.wait()
+
+    holders = [asyncio.create_task(slow_call()) for _ in range(2)]
+    await asyncio.sleep(0)
+    with pytest.raises(UpstreamRejected):
+        async with guard.call(URL, deadline=5):
+            pass
+    release.set()
+    await asyncio.gather(*holders)
+
+    stats = guard.for_host("loads.example.com").stats()
+    assert stats["rejected_full"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["state"] == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_deadline_cancels_slow_calls_and_counts_as_failure():
+    guard = UpstreamGuard(failure_threshold=1)
+    with pytest.raises(TimeoutError):
+        async with guard.call(URL, deadline=0.05):
+            await asyncio.sleep(1)
+    stats = guard.for_host("loads.example.com").stats()
+    assert stats["timeouts"] == 1
+    assert stats["state"] == OPEN
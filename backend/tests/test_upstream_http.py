@@ -0,0 +1,74 @@
+"""
+Tests for the pooled upstream HTTP client used by the gateway proxy
+"""
+import asyncio
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from services.upstream_http import UpstreamHTTPClient
+
+
+@pytest_asyncio.fixture
+async def upstream():
+    async def login(request):
+        response = web.HTTPFound("/home")
+        response.set_cookie("sid", request.query.get("user", "anon"))
+        raise response
+
+    async def home(request):
+        return web.Response(text=f"sid={request.cookies.get('sid')}")
+
+    async def slow_export(request):
+        # Steady trickle: never idle for long, but longer overall than any read timeout
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for _ in range(8):
+            await response.write(b"x" * 1000)
+            await asyncio.sleep(0.2)
+        return response
+
+    app = web.Application()
+    app.router.add_get("/slow-export", slow_export)
+    app.router.add_get("/login", login)
+    app.router.add_get("/home", home)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_cookies_stay_per_session_and_connections_are_reused(upstream):
+    client = UpstreamHTTPClient(max_per_host=2)
+    alice, bob = {}, {}
+    try:
+        async with await client.request("GET", f"{upstream}/login?user=alice", alice) as resp:
+            assert await resp.text() == "sid=alice"
+        async with await client.request("GET", f"{upstream}/home", bob) as resp:
+            assert await resp.text() == "sid=None"
+        for _ in range(5):
+            async with await client.request("GET", f"{upstream}/home", alice) as resp:
+                assert await resp.text() == "sid=alice"
+    finally:
+        await client.stop()
+
+    assert alice == {"sid": "alice"} and bob == {}
+    assert client.requests == 8
+    assert client.connections_created == 1
+    assert client.connections_reused == 7
+
+
+@pytest.mark.asyncio
+async def test_long_streamed_body_is_not_cut_off(upstream):
+    client = UpstreamHTTPClient(read_timeout=1.0)
+    try:
+        async with await client.request("GET", f"{upstream}/slow-export", {}) as resp:
+            body = b"".join([chunk async for chunk in resp.content.iter_chunked(4096)])
+    finally:
+        await client.stop()
+    assert len(body) == 8000
@@ -0,0 +1,167 @@
+"""
+Tests for the WebSocket ConnectionManager fan-out
+"""
+import asyncio
+import json
+
+import pytest
+
+from utils import websocket_manager
+from utils.notification_bus import InMemoryNotificationBus
+from utils.notification_log import InMemoryNotificationLog
+from utils.websocket_manager import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.frames = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.frames.append(text)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+async def wait_for_frames(ws: FakeWebSocket, count: int):
+    while len(ws.frames) < count:
+        await asyncio.sleep(0.001)
+
+
+@pytest.mark.asyncio
+async def test_broadcast_serializes_once_and_reaches_every_connection():
+    manager = ConnectionManager()
+    sockets = [FakeWebSocket() for _ in range(3)]
+    for i, ws in enumerate(sockets):
+        await manager.connect(ws, f"user{i}@example.com")
+
+    await manager.broadcast({"type": "tool_created"}, exclude="user2@example.com")
+
+    await asyncio.wait_for(wait_for_frames(sockets[0], 1), timeout=2)
+    await asyncio.wait_for(wait_for_frames(sockets[1], 1), timeout=2)
+    assert sockets[0].frames[0] is sockets[1].frames[0]
+    assert sockets[2].frames == []
+    for ws in sockets:
+        manager.disconnect(ws)
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_delay_others_and_is_evicted(monkeypatch):
+    monkeypatch.setattr(websocket_manager, "WS_SEND_TIMEOUT", 0.05)
+    manager = ConnectionManager()
+    fast, slow = FakeWebSocket(), FakeWebSocket(delay=10)
+    await manager.connect(fast, "fast@example.com")
+    await manager.connect(slow, "slow@example.com")
+
+    await manager.broadcast({"type": "refresh_dashboard"})
+    await asyncio.wait_for(wait_for_frames(fast, 1), timeout=0.5)
+
+    await asyncio.sleep(0.2)
+    assert slow not in manager.connections
+    assert slow.closed_with == 1013
+    assert manager.evictions == 1
+    manager.disconnect(fast)
+
+
+@pytest.mark.asyncio
+async def test_notifications_reach_users_connected_to_other_workers():
+    bus = InMemoryNotificationBus()
+    worker_a, worker_b = ConnectionManager(), ConnectionManager()
+    await worker_a.attach_bus(bus)
+    await worker_b.attach_bus(bus)
+    on_a, on_b, other = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await worker_a.connect(on_a, "driver@example.com")
+    await worker_b.connect(on_b, "driver@example.com")
+    await worker_b.connect(other, "other@example.com")
+
+    await worker_a.send_to_user("driver@example.com", {"type": "user_suspended"})
+    await worker_a.broadcast({"type": "tool_created"}, exclude="driver@example.com")
+
+    await asyncio.wait_for(wait_for_frames(on_a, 1), timeout=2)
+    await asyncio.wait_for(wait_for_frames(on_b, 1), timeout=2)
+    await asyncio.wait_for(wait_for_frames(other, 1), timeout=2)
+    await asyncio.sleep(0.05)
+    assert len(on_a.frames) == 1 and len(on_b.frames) == 1
+    assert "tool_created" in other.frames[0]
+
+    await worker_a.detach_bus()
+    await worker_b.detach_bus()
+    for worker, ws in ((worker_a, on_a), (worker_b, on_b), (worker_b, other)):
+        worker.disconnect(ws)
+
+
+@pytest.mark.asyncio
+async def test_tool_deltas_redact_credentials_per_recipient_on_every_worker(monkeypatch):
+    bus = InMemoryNotificationBus()
+    worker_a, worker_b = ConnectionManager(), ConnectionManager()
+    await worker_a.attach_bus(bus)
+    await worker_b.attach_bus(bus)
+    admin, user, demoted = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+    await worker_a.connect(admin, "owner@example.com", "Super Administrator")
+    await worker_b.connect(user, "driver@example.com", "User")
+    await worker_b.connect(demoted, "former@example.com", "Super Administrator")
+
+    await worker_a.send_to_user("former@example.com", {"type": "role_changed"}, role="Administrator")
+    await asyncio.wait_for(wait_for_frames(demoted, 1), timeout=2)
+
+    monkeypatch.setattr(websocket_manager, "manager", worker_a)
+    tool = {"id": "t1", "name": "DAT", "version": 3, "has_credentials": True}
+    await websocket_manager.notify_tool_updated(tool, {"username": "dispatch", "password": "s3cret"})
+
+    await asyncio.wait_for(wait_for_frames(admin, 1), timeout=2)
+    await asyncio.wait_for(wait_for_frames(user, 1), timeout=2)
+    await asyncio.wait_for(wait_for_frames(demoted, 2), timeout=2)
+    admin_msg, user_msg, demoted_msg = (json.loads(ws.frames[-1]) for ws in (admin, user, demoted))
+    assert admin_msg["tool"]["credentials"]["password"] == "s3cret"
+    assert "credentials" not in user_msg["tool"] and "credentials" not in demoted_msg["tool"]
+    assert user_msg["version"] == 3 and user_msg["type"] == "tool_updated"
+
+    await worker_a.detach_bus()
+    await worker_b.detach_bus()
+    for worker, ws in ((worker_a, admin), (worker_b, user), (worker_b, demoted)):
+        worker.disconnect(ws)
+
+
+@pytest.mark.asyncio
+async def test_reconnecting_client_gets_only_missed_events_or_a_refresh():
+    manager = ConnectionManager()
+    manager.attach_event_log(InMemoryNotificationLog(per_user=3, broadcasts=10))
+    first = FakeWebSocket()
+    await manager.connect(first, "driver@example.com")
+    await manager.resume(first)
+    await manager.send_to_user("driver@example.com", {"type": "tool_access_updated"})
+    await asyncio.wait_for(wait_for_frames(first, 2), timeout=2)
+    sync, seen = (json.loads(frame) for frame in first.frames)
+    manager.disconnect(first)
+
+    # Missed while offline: one for us, one for someone else, one broadcast we're excluded from
+    await manager.send_to_user("driver@example.com", {"type": "role_changed"})
+    await manager.send_to_user("other@example.com", {"type": "role_changed"})
+    await manager.broadcast({"type": "tool_created"}, exclude="driver@example.com")
+    await manager.broadcast({"type": "tool_deleted"})
+
+    again = FakeWebSocket()
+    await manager.connect(again, "driver@example.com")
+    await manager.resume(again, sync["epoch"], seen["seq"])
+    await asyncio.wait_for(wait_for_frames(again, 3), timeout=2)
+    replayed = [json.loads(frame) for frame in again.frames]
+    assert [m["type"] for m in replayed] == ["role_changed", "tool_deleted", "sync"]
+    assert replayed[-1]["seq"] == replayed[1]["seq"] == 5
+    manager.disconnect(again)
+
+    # More targeted events than the per-user retention: the gap can't be replayed
+    for _ in range(4):
+        await manager.send_to_user("driver@example.com", {"type": "tool_access_updated"})
+    late = FakeWebSocket()
+    await manager.connect(late, "driver@example.com")
+    await manager.resume(late, sync["epoch"], 5)
+    await asyncio.wait_for(wait_for_frames(late, 2), timeout=2)
+    assert [json.loads(frame)["type"] for frame in late.frames] == ["refresh_dashboard", "sync"]
+    manager.disconnect(late)
@@ -0,0 +1,156 @@
+"""
+Streaming HTML Rewriter
+Rewrites upstream URLs in proxied tool pages so they load through the gateway.
+Text is processed incrementally in one pass as chunks arrive: each chunk is
+rewritten up to the last point where no URL can be cut in half, and only the
+short tail after it is carried into the next chunk.
+Covers href/src/action-style attributes (including <base>), srcset, CSS
+url(...) in style blocks and attributes (entity-quoted too), and
+<meta http-equiv="refresh">.
+"""
+import codecs
+import re
+from typing import Optional
+from urllib.parse import urlparse
+
+# Attributes whose whole value is one URL (plus any *src, e.g. data-src)
+URL_ATTRIBUTES = frozenset(("href", "src", "action", "formaction", "poster", "data", "background"))
+
+# A tail longer than this without a tag end is cut at a line/CSS boundary instead
+MAX_CARRY = 64 * 1024
+
+# Every alternative starts with a bare literal ("srcset", "=" or "url(") so the
+# scan can skip ahead cheaply - wrapping those literals in a group (or using
+# IGNORECASE) makes it several times slower. Only value spans are captured;
+# the attribute name in front of "=" is checked in the callback.
+_PATTERN = re.compile(
+    r"srcset\s*=\s*(?P<srcset_q>[\"'])(?P<srcset>[^\"']*)(?P=srcset_q)"
+    r"|=\s*(?:"
+    r"(?P<q>[\"'])(?P<qval>(?:/|https?:|\d+\s*;\s*[uU][rR][lL]\s*=)[^\"']*)(?P=q)"
+    r"|(?P<uval>(?:/|https?:)[^\s\"'=<>`]*)"
+    r")"
+    r"|url\(\s*(?P<css_q>&quot;|&#39;|[\"']?)(?P<css>[^\"')]*?)(?P=css_q)\s*\)"
+)
+
+_META_REFRESH = re.compile(r"(\d+\s*;\s*url\s*=\s*)(.*)", re.IGNORECASE | re.DOTALL)
+
+# Cut points when no tag has closed for MAX_CARRY characters
+_SOFT_BOUNDARY = re.compile(r"[\n;}]")
+
+
+class StreamingHTMLRewriter:
+    def __init__(self, base_url: str, proxy_prefix: str):
+        parsed = urlparse(base_url)
+        self.netloc = parsed.netloc.lower()
+        self.proxy_prefix = proxy_prefix.rstrip("/")
+        self._origins = tuple(scheme + self.netloc for scheme in ("https://", "http://", "//"))
+        self._carry = ""
+        self.rewrites = 0
+
+    def rewrite_url(self, url: str) -> str:
+        """Map an upstream URL onto the proxy; anything off-origin or relative is left alone"""
+        stripped = url.strip()
+        if stripped[:1] == "/" and stripped[1:2] != "/":
+            # Root-relative paths would otherwise hit the dashboard's own host
+            if stripped.startswith(self.proxy_prefix + "/"):
+                return url
+            self.rewrites += 1
+            return self.proxy_prefix + stripped
+        lowered = stripped.lower()
+        if not lowered.startswith(self._origins):
+            return url
+        for origin in self._origins:
+            if lowered.startswith(origin) and lowered[len(origin):len(origin) + 1] in ("", "/", "?", "#"):
+                self.rewrites += 1
+                rest = stripped[len(origin):]
+                return self.proxy_prefix + (rest if rest.startswith("/") else "/" + rest)
+        return url
+
+    def _rewrite_srcset(self, value: str) -> str:
+        candidates = []
+        for candidate in value.split(","):
+            parts = candidate.strip().split(None, 1)
+            if not parts:
+                continue
+            parts[0] = self.rewrite_url(parts[0])
+            candidates.append(" ".join(parts))
+        return ", ".join(candidates)
+
+    @staticmethod
+    def _attribute_name(text: str, end: int) -> str:
+        """Name of the attribute whose "=" is at `end` (empty if it isn't one)"""
+        head = text[max(0, end - 32):end].rstrip()
+        if not head or head[-1] in "\"'=;(){}":
+            return ""
+        return head.rsplit(None, 1)[-1].rsplit("<", 1)[-1].lower()
+
+    @staticmethod
+    def _splice(match: "re.Match", group: str, value: str) -> str:
+        start, end = match.span(group)
+        offset = match.start()
+        whole = match.group(0)
+        return whole[:start - offset] + value + whole[end - offset:]
+
+    def _replace(self, match: "re.Match") -> str:
+        group = match.lastgroup
+        if group == "css":
+            return self._splice(match, "css", self.rewrite_url(match.group("css")))
+        if group == "srcset":
+            return self._splice(match, "srcset", self._rewrite_srcset(match.group("srcset")))
+
+        name = self._attribute_name(match.string, match.start())
+        value = match.group(group)
+        if name in URL_ATTRIBUTES or name.endswith("src"):
+            return self._splice(match, group, self.rewrite_url(value))
+        if name == "content":
+            refresh = _META_REFRESH.match(value)
+            if refresh:
+                return self._splice(match, group, refresh.group(1) + self.rewrite_url(refresh.group(2)))
+        return match.group(0)
+
+    def _safe_cut(self, text: str) -> int:
+        """Index up to which `text` can be rewritten without splitting a URL"""
+        cut = text.rfind(">") + 1
+        if len(text) - cut > MAX_CARRY:
+            soft = None
+            for soft in _SOFT_BOUNDARY.finditer(text, cut):
+                pass
+            cut = soft.end() if soft else len(text)
+        return cut
+
+    def feed(self, text: str) -> str:
+        """Rewrite as much of the stream as is safe; the rest waits for the next chunk"""
+        text = self._carry + text
+        cut = self._safe_cut(text)
+        self._carry = text[cut:]
+        return _PATTERN.sub(self._replace, text[:cut])
+
+    def close(self) -> str:
+        text, self._carry = self._carry, ""
+        return _PATTERN.sub(self._replace, text)
+
+
+def charset_from_content_type(content_type: Optional[str], default: str = "utf-8") -> str:
+    match = re.search(r"charset=[\"']?([\w.:-]+)", content_type or "", re.IGNORECASE)
+    if match:
+        try:
+            return codecs.lookup(match.group(1)).name
+        except LookupError:
+            pass
+    return default
+
+
+class StreamingHTMLEncoder:
+    """Bytes in, rewritten bytes out, in the page's own charset"""
+
+    def __init__(self, rewriter: StreamingHTMLRewriter, charset: str = "utf-8"):
+        self.rewriter = rewriter
+        self.charset = charset
+        self._decoder = codecs.getincrementaldecoder(charset)(errors="replace")
+
+    def feed(self, data: bytes) -> bytes:
+        return self.rewriter.feed(self._decoder.decode(data)).encode(self.charset, errors="xmlcharrefreplace")
+
+    def close(self) -> bytes:
+        text = self.rewriter.feed(self._decoder.decode(b"", final=True)) + self.rewriter.close()
+        return text.encode(self.charset, errors="xmlcharrefreplace")
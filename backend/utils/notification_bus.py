@@ -0,0 +1,191 @@
+"""
+Notification Bus
+Pub/sub transport that lets every worker deliver WebSocket notifications to
+its own sockets. The ConnectionManager delivers locally, publishes the
+pre-serialized frame, and each other worker fans it out to its connections.
+Backends: in-memory (single process / tests) and a MongoDB capped collection
+tailed with an awaitable cursor (multiple workers or replicas).
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+NAMESPACE_EXISTS = 48
+
+EventHandler = Callable[[dict], Awaitable[None]]
+
+
+class InMemoryNotificationBus:
+    """Delivers events to every other subscriber in this process"""
+
+    def __init__(self):
+        self._handlers: Dict[str, EventHandler] = {}
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+
+    async def subscribe(self, origin: str, handler: EventHandler):
+        self._handlers[origin] = handler
+
+    async def unsubscribe(self, origin: str):
+        self._handlers.pop(origin, None)
+
+    async def publish(self, origin: str, event: dict):
+        self.published += 1
+        for subscriber, handler in list(self._handlers.items()):
+            if subscriber == origin:
+                continue
+            try:
+                await handler(event)
+                self.received += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"[WS Bus] Handler error: {e!r}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "subscribers": len(self._handlers),
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+
+class MongoNotificationBus:
+    """Publishes events to a capped collection that every worker tails"""
+
+    def __init__(self, collection_name: str = "ws_events", capped_bytes: int = 16 * 1024 * 1024,
+                 retry_delay: float = 1.0):
+        self.collection_name = collection_name
+        self.capped_bytes = capped_bytes
+        self.retry_delay = retry_delay
+        self._origin: Optional[str] = None
+        self._handler: Optional[EventHandler] = None
+        self._tailer: Optional[asyncio.Task] = None
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+        self.reconnects = 0
+
+    async def _collection(self):
+        from database import get_db
+
+        db = await get_db()
+        return db[self.collection_name]
+
+    async def _ensure_collection(self):
+        from database import get_db
+
+        db = await get_db()
+        try:
+            await db.create_collection(self.collection_name, capped=True, size=self.capped_bytes)
+        except CollectionInvalid:
+            pass
+        except OperationFailure as e:
+            # Another worker created it between the existence check and ours
+            if e.code != NAMESPACE_EXISTS:
+                raise
+        collection = db[self.collection_name]
+        # A tailable cursor on an empty capped collection dies immediately
+        if await collection.estimated_document_count() == 0:
+            await collection.insert_one({"origin": "bus", "created_at": datetime.now(timezone.utc)})
+        return collection
+
+    async def subscribe(self, origin: str, handler: EventHandler):
+        self._origin = origin
+        self._handler = handler
+        collection = await self._ensure_collection()
+        # Only deliver events published after this worker came up
+        latest = await collection.find_one({}, sort=[("$natural", -1)])
+        self._tailer = asyncio.create_task(self._tail(latest["_id"] if latest else None))
+
+    async def unsubscribe(self, origin: str):
+        if self._tailer is not None:
+            self._tailer.cancel()
+            try:
+                await self._tailer
+            except asyncio.CancelledError:
+                pass
+            self._tailer = None
+        self._handler = None
+
+    async def publish(self, origin: str, event: dict):
+        collection = await self._collection()
+        await collection.insert_one({**event, "origin": origin, "created_at": datetime.now(timezone.utc)})
+        self.published += 1
+
+    async def _tail(self, last_id):
+        while True:
+            try:
+                collection = await self._collection()
+                # Resume by position in the capped collection (insertion order), not by
+                # _id: ObjectIds minted by different workers aren't ordered, so an
+                # "_id > last seen" query can skip events. Documents up to and including
+                # the last one seen are read again and dropped.
+                cursor = collection.find({}, cursor_type=CursorType.TAILABLE_AWAIT)
+                skipped = [] if last_id is not None else None
+                while cursor.alive:
+                    async for doc in cursor:
+                        if skipped is not None:
+                            if doc["_id"] == last_id:
+                                skipped = None
+                            else:
+                                skipped.append(doc)
+                            continue
+                        last_id = doc["_id"]
+                        await self._dispatch(doc)
+                    if skipped is not None:
+                        # The last event seen has rolled out of the capped collection,
+                        # so everything still in it came after it
+                        print(f"[WS Bus] Resume point gone, delivering {len(skipped)} retained event(s)")
+                        pending, skipped = skipped, None
+                        for doc in pending:
+                            last_id = doc["_id"]
+                            await self._dispatch(doc)
+                    await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"[WS Bus] Tail error, reconnecting: {e!r}")
+            self.reconnects += 1
+            await asyncio.sleep(self.retry_delay)
+
+    async def _dispatch(self, doc: dict):
+        if doc.get("origin") == self._origin or "frame" not in doc or self._handler is None:
+            return
+        try:
+            await self._handler(doc)
+            self.received += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"[WS Bus] Handler error: {e!r}")
+
+    def stats(self) -> dict:
+        return {
+            "backend": "mongo",
+            "collection": self.collection_name,
+            "tailing": self._tailer is not None and not self._tailer.done(),
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+            "reconnects": self.reconnects,
+        }
+
+
+def create_notification_bus():
+    """Build the bus selected by WS_BUS_BACKEND (memory | mongo)"""
+    backend = os.getenv("WS_BUS_BACKEND", "memory").strip().lower()
+    if backend == "mongo":
+        return MongoNotificationBus(
+            collection_name=os.getenv("WS_BUS_COLLECTION", "ws_events"),
+            capped_bytes=int(os.getenv("WS_BUS_CAPPED_BYTES", str(16 * 1024 * 1024))),
+        )
+    if backend != "memory":
+        raise RuntimeError(f"Unknown WS_BUS_BACKEND '{backend}' (expected 'memory' or 'mongo').")
+    return InMemoryNotificationBus()
@@ -0,0 +1,220 @@
+"""
+Notification Log
+Bounded, sequence-numbered record of WebSocket notifications so a client that
+reconnects can be sent only what it missed. Every event gets the next value of
+a sequence (scoped to an epoch); replay returns the events addressed to one
+user after a given sequence, or None when the gap is older than retention and
+the client has to reload instead.
+Backends: in-memory (single worker) and a MongoDB capped collection shared by
+all workers.
+"""
+import os
+import uuid
+from collections import OrderedDict, deque
+from typing import Deque, List, Optional, Tuple
+
+from pymongo import ReturnDocument
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+NAMESPACE_EXISTS = 48
+
+# (frame, privileged_frame) ready to enqueue, oldest first
+ReplayFrames = List[Tuple[str, Optional[str]]]
+
+
+class _BoundedEvents:
+    """Deque of (seq, exclude, frame, privileged_frame) that remembers the newest seq it dropped"""
+
+    def __init__(self, max_events: int):
+        self.max_events = max_events
+        self.events: Deque[tuple] = deque()
+        self.dropped_through = 0
+
+    def append(self, entry: tuple):
+        self.events.append(entry)
+        while len(self.events) > self.max_events:
+            self.dropped_through = self.events.popleft()[0]
+
+    @property
+    def last_seq(self) -> int:
+        return self.events[-1][0] if self.events else self.dropped_through
+
+
+class InMemoryNotificationLog:
+    """Per-user and broadcast event logs held in this process (one worker only)"""
+
+    def __init__(self, per_user: int = 100, broadcasts: int = 200, max_users: int = 5000):
+        self.per_user = per_user
+        self.broadcasts = broadcasts
+        self.max_users = max_users
+        # A restart loses the log, so sequences from a previous process never match
+        self.epoch = uuid.uuid4().hex[:12]
+        self._seq = 0
+        self._users: "OrderedDict[str, _BoundedEvents]" = OrderedDict()
+        self._broadcast_events = _BoundedEvents(broadcasts)
+        # Replays from before this seq may have lost events of a forgotten user
+        self._floor = 0
+
+    async def next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    async def position(self) -> Tuple[str, int]:
+        return self.epoch, self._seq
+
+    async def append(self, seq: int, targets: Optional[List[str]], exclude: Optional[str],
+                     frame: str, privileged_frame: Optional[str]):
+        entry = (seq, exclude, frame, privileged_frame)
+        if targets is None:
+            self._broadcast_events.append(entry)
+            return
+        for email in targets:
+            user_events = self._users.get(email)
+            if user_events is None:
+                user_events = self._users[email] = _BoundedEvents(self.per_user)
+            self._users.move_to_end(email)
+            user_events.append(entry)
+        while len(self._users) > self.max_users:
+            _, forgotten = self._users.popitem(last=False)
+            self._floor = max(self._floor, forgotten.last_seq)
+
+    async def replay(self, email: str, after_seq: int) -> Optional[ReplayFrames]:
+        if after_seq > self._seq:
+            return None
+        user_events = self._users.get(email)
+        dropped = max(
+            self._floor,
+            self._broadcast_events.dropped_through,
+            user_events.dropped_through if user_events else 0,
+        )
+        if dropped > after_seq:
+            return None
+
+        missed = [e for e in self._broadcast_events.events if e[0] > after_seq and e[1] != email]
+        if user_events:
+            missed.extend(e for e in user_events.events if e[0] > after_seq)
+        missed.sort(key=lambda e: e[0])
+        return [(frame, privileged_frame) for _, _, frame, privileged_frame in missed]
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "epoch": self.epoch,
+            "seq": self._seq,
+            "users": len(self._users),
+            "broadcasts_retained": len(self._broadcast_events.events),
+        }
+
+
+class MongoNotificationLog:
+    """Events in a capped collection, sequence from a counter document (shared by all workers)"""
+
+    def __init__(self, collection_name: str = "ws_event_log", capped_bytes: int = 32 * 1024 * 1024,
+                 max_events: int = 20000, max_replay: int = 500):
+        self.collection_name = collection_name
+        self.capped_bytes = capped_bytes
+        self.max_events = max_events
+        self.max_replay = max_replay
+        self.epoch: Optional[str] = None
+        self._ready = False
+
+    async def _collection(self):
+        from database import get_db
+
+        db = await get_db()
+        collection = db[self.collection_name]
+        if not self._ready:
+            try:
+                await db.create_collection(
+                    self.collection_name, capped=True, size=self.capped_bytes, max=self.max_events
+                )
+            except CollectionInvalid:
+                pass
+            except OperationFailure as e:
+                if e.code != NAMESPACE_EXISTS:
+                    raise
+            await collection.create_index("seq")
+            self._ready = True
+        return collection
+
+    async def _bump(self, amount: int) -> dict:
+        from database import get_db
+
+        db = await get_db()
+        counter = await db.counters.find_one_and_update(
+            {"_id": self.collection_name},
+            {"$inc": {"seq": amount}, "$setOnInsert": {"epoch": uuid.uuid4().hex[:12]}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self.epoch = counter["epoch"]
+        return counter
+
+    async def next_seq(self) -> int:
+        return (await self._bump(1))["seq"]
+
+    async def position(self) -> Tuple[str, int]:
+        counter = await self._bump(0)
+        return counter["epoch"], counter["seq"]
+
+    async def append(self, seq: int, targets: Optional[List[str]], exclude: Optional[str],
+                     frame: str, privileged_frame: Optional[str]):
+        collection = await self._collection()
+        await collection.insert_one({
+            "seq": seq,
+            "targets": targets,
+            "exclude": exclude,
+            "frame": frame,
+            "privileged_frame": privileged_frame,
+        })
+
+    async def replay(self, email: str, after_seq: int) -> Optional[ReplayFrames]:
+        collection = await self._collection()
+        _, current = await self.position()
+        if after_seq > current:
+            return None
+        if after_seq == current:
+            return []
+        # The capped collection drops the oldest events first; if the next seq is gone, so might be ours
+        oldest = await collection.find_one({}, sort=[("seq", 1)])
+        if oldest is None or oldest["seq"] > after_seq + 1:
+            return None
+
+        cursor = collection.find(
+            {
+                "seq": {"$gt": after_seq},
+                "$or": [{"targets": email}, {"targets": None, "exclude": {"$ne": email}}],
+            },
+            {"frame": 1, "privileged_frame": 1},
+        ).sort("seq", 1).limit(self.max_replay + 1)
+        missed = await cursor.to_list(self.max_replay + 1)
+        if len(missed) > self.max_replay:
+            return None
+        return [(doc["frame"], doc.get("privileged_frame")) for doc in missed]
+
+    def stats(self) -> dict:
+        return {
+            "backend": "mongo",
+            "collection": self.collection_name,
+            "epoch": self.epoch,
+            "max_events": self.max_events,
+        }
+
+
+def create_notification_log():
+    """Build the replay log selected by WS_REPLAY_BACKEND (memory | mongo | off)"""
+    backend = os.getenv("WS_REPLAY_BACKEND", "memory").strip().lower()
+    if backend == "off":
+        return None
+    if backend == "mongo":
+        return MongoNotificationLog(
+            collection_name=os.getenv("WS_REPLAY_COLLECTION", "ws_event_log"),
+            max_events=int(os.getenv("WS_REPLAY_RETENTION", "20000")),
+            max_replay=int(os.getenv("WS_REPLAY_MAX_EVENTS", "500")),
+        )
+    if backend != "memory":
+        raise RuntimeError(f"Unknown WS_REPLAY_BACKEND '{backend}' (expected 'memory', 'mongo' or 'off').")
+    return InMemoryNotificationLog(
+        per_user=int(os.getenv("WS_REPLAY_PER_USER", "100")),
+        broadcasts=int(os.getenv("WS_REPLAY_BROADCASTS", "200")),
+    )
@@ -0,0 +1,106 @@
+"""
+Principal Cache
+In-process cache of authenticated user principals used by get_current_user.
+Entries expire after a TTL and the cache is bounded with LRU eviction.
+Reads capture a version from a global invalidation clock; a DB read that raced
+with a suspend/role change can never repopulate a stale principal. Only a
+bounded window of recent invalidations is remembered - reads older than that
+window are simply not cached.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class PrincipalCache:
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # user_id -> (principal, expires_at)
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()
+        # user_id -> clock value of its latest invalidation (bounded, oldest first)
+        self._invalidations: "OrderedDict[str, int]" = OrderedDict()
+        self._clock = 0
+        # Reads that started before this clock value are never cached
+        self._floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """Return a copy of the cached principal, or None on miss/expiry"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        principal, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return dict(principal)
+
+    def version(self, user_id: str) -> int:
+        """Current invalidation clock; capture before reading from the DB"""
+        return self._clock
+
+    def set(self, user_id: str, principal: dict, version: int) -> bool:
+        """Store principal if no invalidation happened since `version` was read"""
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return False
+        if version < self._floor or self._invalidations.get(user_id, -1) > version:
+            return False
+
+        self._entries[user_id] = (dict(principal), time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(user_id)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return True
+
+    def invalidate(self, user_id: str):
+        """Drop a user's principal and reject in-flight reads for it"""
+        self._clock += 1
+        self._invalidations[user_id] = self._clock
+        self._invalidations.move_to_end(user_id)
+        self._entries.pop(user_id, None)
+        self.invalidations += 1
+
+        while len(self._invalidations) > max(self.max_entries, 1):
+            _, stamp = self._invalidations.popitem(last=False)
+            # Forgotten invalidation: reject any read that may have raced it
+            self._floor = max(self._floor, stamp)
+
+    def clear(self):
+        """Drop every principal and reject all in-flight reads"""
+        self._clock += 1
+        self._floor = self._clock
+        self._entries.clear()
+        self._invalidations.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# Global principal cache instance
+principal_cache = PrincipalCache(
+    ttl_seconds=float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30")),
+    max_entries=int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "1024")),
+)
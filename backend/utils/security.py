@@ -1,4 +1,6 @@
 import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -19,8 +21,7 @@ def _required_secret(secret_name: str, env_var: str) -> str:
     value = ""
 
     try:
-        from services.secret_manager_service import SecretManagerService
-        secret_manager = SecretManagerService()
+        from services.secret_manager_service import secret_manager
         value = secret_manager.get_secret(secret_name) or ""
     except Exception as exc:
         print(f"Warning: Secret Manager unavailable for '{secret_name}': {exc}")
@@ -60,6 +61,54 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# Bcrypt runs in a dedicated, size-limited pool so a login burst never blocks
+# the event loop (bcrypt releases the GIL while hashing)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+_password_executor: Optional[ThreadPoolExecutor] = None
+_password_queue_depth = 0
+_password_queue_peak = 0
+_password_jobs_completed = 0
+
+def _get_password_executor() -> ThreadPoolExecutor:
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ThreadPoolExecutor(
+            max_workers=max(1, PASSWORD_HASH_WORKERS),
+            thread_name_prefix="bcrypt"
+        )
+    return _password_executor
+
+async def _run_password_job(func, *args):
+    global _password_queue_depth, _password_queue_peak, _password_jobs_completed
+    _password_queue_depth += 1
+    _password_queue_peak = max(_password_queue_peak, _password_queue_depth)
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_password_executor(), func, *args)
+    finally:
+        _password_queue_depth -= 1
+        _password_jobs_completed += 1
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_job(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await _run_password_job(verify_password, plain_password, hashed_password)
+
+def password_pool_stats() -> dict:
+    return {
+        "workers": max(1, PASSWORD_HASH_WORKERS),
+        "queue_depth": _password_queue_depth,
+        "queue_peak": _password_queue_peak,
+        "completed": _password_jobs_completed
+    }
+
+def shutdown_password_pool():
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=True)
+        _password_executor = None
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
     if expires_delta:
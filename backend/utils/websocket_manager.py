@@ -1,75 +1,308 @@
 """
 WebSocket Manager for Real-time Updates
-Handles real-time notifications for dashboard updates
+Handles real-time notifications for dashboard updates.
+Messages are serialized once and handed to a per-connection bounded queue;
+each connection's writer sends with a timeout, so one slow client can't
+delay delivery to anyone else. With a notification bus attached, frames are
+also published so other workers deliver them to their own sockets.
+Entity notifications carry the changed data and its version so dashboards can
+patch local state instead of re-fetching; messages that differ by role are
+serialized once per variant and picked per connection.
+Notifications are sequence-numbered into a bounded log, so a reconnecting
+client is sent only what it missed (or told to refresh if that was too long ago).
 """
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List, Set
+from typing import Dict, List, Optional, Set
 import json
 import asyncio
+import os
+import socket
+import uuid
+
+# Per-send deadline; a client that can't take a frame in time is evicted
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT_SECONDS", "5"))
+# Frames buffered per connection before the client is considered too slow
+WS_OUTBOUND_QUEUE_SIZE = int(os.getenv("WS_OUTBOUND_QUEUE_SIZE", "100"))
+
+# Only this role receives the unredacted variant of a notification (e.g. tool credentials)
+PRIVILEGED_ROLE = "Super Administrator"
+
+
+class ClientConnection:
+    """One websocket with its own bounded outbound queue and writer task"""
+
+    def __init__(self, websocket: WebSocket, user_email: str, role: str, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.user_email = user_email
+        self.role = role
+        self.manager = manager
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=WS_OUTBOUND_QUEUE_SIZE)
+        self.writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, frame: str) -> bool:
+        """Queue a pre-serialized frame; False if the client is too far behind"""
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def _write_loop(self):
+        while True:
+            frame = await self.queue.get()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(frame), timeout=WS_SEND_TIMEOUT)
+                self.manager.frames_sent += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[WS] Error sending to {self.user_email}: {e!r}")
+                self.manager.evict(self.websocket, reason="send failed")
+                return
+
+    def stop(self):
+        if self.writer and not self.writer.done() and self.writer is not asyncio.current_task():
+            self.writer.cancel()
+
 
 class ConnectionManager:
     def __init__(self):
         # Map user_email to their websocket connections
         self.active_connections: Dict[str, List[WebSocket]] = {}
-        # Map websocket to user_email for cleanup
-        self.connection_users: Dict[WebSocket, str] = {}
+        # Map websocket to its outbound connection state for cleanup
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.frames_sent = 0
+        self.evictions = 0
+        # Cross-worker pub/sub; None means this process only
+        self.bus = None
+        self.origin = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.bus_publish_errors = 0
+        # Replay log for reconnecting clients; None disables sequence numbers
+        self.event_log = None
+        self.event_log_errors = 0
+        self.replayed_frames = 0
+        self.replay_gaps = 0
+    
+    def attach_event_log(self, event_log):
+        self.event_log = event_log
+    
+    async def attach_bus(self, bus):
+        """Subscribe to a notification bus (call from the app lifespan)"""
+        await bus.subscribe(self.origin, self._on_bus_event)
+        self.bus = bus
+    
+    async def detach_bus(self):
+        if self.bus is not None:
+            bus, self.bus = self.bus, None
+            await bus.unsubscribe(self.origin)
     
-    async def connect(self, websocket: WebSocket, user_email: str):
-        """Accept websocket connection and register user"""
+    async def _on_bus_event(self, event: dict):
+        """Deliver a frame published by another worker to local sockets"""
+        targets = event.get("targets")
+        if targets is None:
+            exclude = event.get("exclude")
+            targets = [email for email in list(self.active_connections.keys()) if email != exclude]
+        if event.get("role"):
+            self._set_role(targets, event["role"])
+        self._fan_out(targets, event["frame"], event.get("privileged_frame"))
+    
+    async def _publish(self, frame: str, targets: Optional[List[str]] = None, exclude: str = None,
+                       privileged_frame: Optional[str] = None, role: Optional[str] = None):
+        if self.bus is None:
+            return
+        try:
+            await self.bus.publish(self.origin, {
+                "frame": frame,
+                "privileged_frame": privileged_frame,
+                "targets": targets,
+                "exclude": exclude,
+                "role": role,
+            })
+        except Exception as e:
+            # Local sockets already have the frame; remote workers miss this one
+            self.bus_publish_errors += 1
+            print(f"[WS] Failed to publish notification to bus: {e!r}")
+    
+    async def connect(self, websocket: WebSocket, user_email: str, role: str = "User"):
+        """Accept websocket connection and register user with their current role"""
         await websocket.accept()
         
         if user_email not in self.active_connections:
             self.active_connections[user_email] = []
         
+        connection = ClientConnection(websocket, user_email, role, self)
         self.active_connections[user_email].append(websocket)
-        self.connection_users[websocket] = user_email
-        print(f"[WS] User {user_email} connected. Total connections: {len(self.connection_users)}")
+        self.connections[websocket] = connection
+        connection.start()
+        print(f"[WS] User {user_email} connected. Total connections: {len(self.connections)}")
     
     def disconnect(self, websocket: WebSocket):
         """Remove websocket connection"""
-        if websocket in self.connection_users:
-            user_email = self.connection_users[websocket]
-            
-            if user_email in self.active_connections:
-                if websocket in self.active_connections[user_email]:
-                    self.active_connections[user_email].remove(websocket)
-                
-                # Clean up empty lists
-                if not self.active_connections[user_email]:
-                    del self.active_connections[user_email]
-            
-            del self.connection_users[websocket]
-            print(f"[WS] User {user_email} disconnected. Total connections: {len(self.connection_users)}")
-    
-    async def send_to_user(self, user_email: str, message: dict):
-        """Send message to specific user (all their connections)"""
+        connection = self.connections.pop(websocket, None)
+        if connection is None:
+            return
+        
+        connection.stop()
+        user_email = connection.user_email
         if user_email in self.active_connections:
-            disconnected = []
-            for connection in self.active_connections[user_email]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    print(f"[WS] Error sending to {user_email}: {e}")
-                    disconnected.append(connection)
+            if websocket in self.active_connections[user_email]:
+                self.active_connections[user_email].remove(websocket)
             
-            # Clean up disconnected sockets
-            for conn in disconnected:
-                self.disconnect(conn)
+            # Clean up empty lists
+            if not self.active_connections[user_email]:
+                del self.active_connections[user_email]
+        
+        print(f"[WS] User {user_email} disconnected. Total connections: {len(self.connections)}")
+    
+    def evict(self, websocket: WebSocket, reason: str = "slow consumer"):
+        """Drop a client that can't keep up and close its socket in the background"""
+        if websocket not in self.connections:
+            return
+        self.evictions += 1
+        print(f"[WS] Evicting connection: {reason}")
+        self.disconnect(websocket)
+        asyncio.create_task(self._close_quietly(websocket))
+    
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=WS_SEND_TIMEOUT)
+        except Exception:
+            pass
     
-    async def send_to_users(self, user_emails: List[str], message: dict):
-        """Send message to multiple users"""
+    def _enqueue(self, websocket: WebSocket, frame: str):
+        connection = self.connections.get(websocket)
+        if connection and not connection.enqueue(frame):
+            self.evict(websocket, reason="outbound queue full")
+    
+    def _enqueue_variant(self, websocket: WebSocket, frame: str, privileged_frame: Optional[str]):
+        connection = self.connections.get(websocket)
+        if privileged_frame is not None and connection and connection.role == PRIVILEGED_ROLE:
+            self._enqueue(websocket, privileged_frame)
+        else:
+            self._enqueue(websocket, frame)
+    
+    def _fan_out(self, user_emails, frame: str, privileged_frame: Optional[str] = None):
         for email in user_emails:
-            await self.send_to_user(email, message)
+            for websocket in list(self.active_connections.get(email, [])):
+                self._enqueue_variant(websocket, frame, privileged_frame)
     
-    async def broadcast(self, message: dict, exclude: str = None):
-        """Broadcast message to all connected users except excluded"""
-        for user_email in list(self.active_connections.keys()):
-            if user_email != exclude:
-                await self.send_to_user(user_email, message)
+    def _set_role(self, user_emails, role: str):
+        for email in user_emails:
+            for websocket in self.active_connections.get(email, []):
+                connection = self.connections.get(websocket)
+                if connection:
+                    connection.role = role
+    
+    async def _serialize(self, message: dict, privileged_message: Optional[dict] = None,
+                         targets: Optional[List[str]] = None, exclude: str = None):
+        """Stamp the next sequence number, serialize each variant once and record it for replay"""
+        seq = None
+        if self.event_log is not None:
+            try:
+                seq = await self.event_log.next_seq()
+            except Exception as e:
+                self.event_log_errors += 1
+                print(f"[WS] Failed to allocate notification sequence: {e!r}")
+        if seq is not None:
+            message = {**message, "seq": seq}
+            if privileged_message is not None:
+                privileged_message = {**privileged_message, "seq": seq}
+        
+        frame = json.dumps(message)
+        privileged_frame = json.dumps(privileged_message) if privileged_message is not None else None
+        
+        if seq is not None:
+            try:
+                await self.event_log.append(seq, targets, exclude, frame, privileged_frame)
+            except Exception as e:
+                # Live delivery still happens; a client reconnecting past this seq won't get it
+                self.event_log_errors += 1
+                print(f"[WS] Failed to record notification {seq} for replay: {e!r}")
+        return frame, privileged_frame
+    
+    async def resume(self, websocket: WebSocket, epoch: Optional[str] = None, last_seq: Optional[int] = None):
+        """Sync a newly connected client: replay what it missed since last_seq, or ask it to refresh"""
+        connection = self.connections.get(websocket)
+        if self.event_log is None or connection is None:
+            return
+        try:
+            current_epoch, current_seq = await self.event_log.position()
+            missed = None
+            if last_seq is not None and epoch == current_epoch:
+                missed = await self.event_log.replay(connection.user_email, last_seq)
+        except Exception as e:
+            self.event_log_errors += 1
+            print(f"[WS] Failed to replay notifications for {connection.user_email}: {e!r}")
+            return
+        
+        if missed is not None:
+            for frame, privileged_frame in missed:
+                self._enqueue_variant(websocket, frame, privileged_frame)
+            self.replayed_frames += len(missed)
+        elif last_seq is not None:
+            # Gap is older than retention (or the log restarted) - client must reload
+            self.replay_gaps += 1
+            self._enqueue(websocket, json.dumps({
+                "type": NotificationType.REFRESH_DASHBOARD,
+                "reason": "replay_gap",
+                "message": "Please refresh to see updates"
+            }))
+        self._enqueue(websocket, json.dumps({
+            "type": NotificationType.SYNC,
+            "epoch": current_epoch,
+            "seq": current_seq,
+            "replayed": len(missed) if missed else 0
+        }))
+    
+    async def send_text(self, websocket: WebSocket, text: str):
+        """Send a raw text frame (e.g. pong) through the connection's writer"""
+        self._enqueue(websocket, text)
+    
+    async def send_to_user(self, user_email: str, message: dict, role: Optional[str] = None):
+        """Send message to specific user (all their connections, on every worker).
+        `role` also records a role change on those connections before delivery."""
+        frame, _ = await self._serialize(message, targets=[user_email])
+        if role:
+            self._set_role([user_email], role)
+        self._fan_out([user_email], frame)
+        await self._publish(frame, targets=[user_email], role=role)
+    
+    async def send_to_users(self, user_emails: List[str], message: dict, privileged_message: Optional[dict] = None):
+        """Send message to multiple users - serialized once per variant, delivered concurrently"""
+        targets = list(set(user_emails))
+        frame, privileged_frame = await self._serialize(message, privileged_message, targets=targets)
+        self._fan_out(targets, frame, privileged_frame)
+        await self._publish(frame, targets=targets, privileged_frame=privileged_frame)
+    
+    async def broadcast(self, message: dict, exclude: str = None, privileged_message: Optional[dict] = None):
+        """Broadcast message to all connected users except excluded.
+        `privileged_message`, if given, goes to PRIVILEGED_ROLE connections instead."""
+        frame, privileged_frame = await self._serialize(message, privileged_message, exclude=exclude)
+        self._fan_out([email for email in list(self.active_connections.keys()) if email != exclude], frame, privileged_frame)
+        await self._publish(frame, exclude=exclude, privileged_frame=privileged_frame)
     
     def get_connected_users(self) -> List[str]:
         """Get list of connected user emails"""
         return list(self.active_connections.keys())
+    
+    def stats(self) -> dict:
+        return {
+            "connections": len(self.connections),
+            "users": len(self.active_connections),
+            "queued_frames": sum(conn.queue.qsize() for conn in self.connections.values()),
+            "frames_sent": self.frames_sent,
+            "evictions": self.evictions,
+            "bus": self.bus.stats() if self.bus is not None else None,
+            "bus_publish_errors": self.bus_publish_errors,
+            "event_log": self.event_log.stats() if self.event_log is not None else None,
+            "event_log_errors": self.event_log_errors,
+            "replayed_frames": self.replayed_frames,
+            "replay_gaps": self.replay_gaps,
+        }
 
 
 # Global connection manager instance
@@ -81,40 +314,46 @@ class NotificationType:
     TOOL_ACCESS_UPDATED = "tool_access_updated"
     TOOL_DELETED = "tool_deleted"
     TOOL_CREATED = "tool_created"
+    TOOL_UPDATED = "tool_updated"
     ROLE_CHANGED = "role_changed"
     USER_SUSPENDED = "user_suspended"
     USER_REACTIVATED = "user_reactivated"
     REFRESH_DASHBOARD = "refresh_dashboard"
     CREDENTIALS_UPDATED = "credentials_updated"
+    # Sent on connect: the client's resume position (epoch + latest seq)
+    SYNC = "sync"
 
 
-async def notify_tool_access_change(user_email: str, tool_ids: List[str], action: str = "updated"):
-    """Notify user when their tool access changes"""
+async def notify_tool_access_change(user_email: str, tool_ids: List[str], action: str = "updated", version: int = 0):
+    """Send a user their new allowed_tools set"""
     await manager.send_to_user(user_email, {
         "type": NotificationType.TOOL_ACCESS_UPDATED,
         "action": action,
         "tool_ids": tool_ids,
+        "version": version,
         "message": f"Your tool access has been {action}"
     })
 
 
-async def notify_tool_deleted(affected_users: List[str], tool_name: str, tool_id: str):
-    """Notify all affected users when a tool is deleted"""
-    await manager.send_to_users(affected_users, {
+async def notify_tool_deleted(tool_name: str, tool_id: str, version: int = 0):
+    """Tell every dashboard to drop a deleted tool"""
+    await manager.broadcast({
         "type": NotificationType.TOOL_DELETED,
         "tool_id": tool_id,
         "tool_name": tool_name,
+        "version": version,
         "message": f"Tool '{tool_name}' has been removed"
     })
 
 
-async def notify_role_changed(user_email: str, new_role: str):
+async def notify_role_changed(user_email: str, new_role: str, version: int = 0):
     """Notify user when their role changes"""
     await manager.send_to_user(user_email, {
         "type": NotificationType.ROLE_CHANGED,
         "new_role": new_role,
+        "version": version,
         "message": f"Your role has been changed to {new_role}"
-    })
+    }, role=new_role)
 
 
 async def notify_user_status_changed(user_email: str, status: str):
@@ -136,22 +375,33 @@ async def notify_refresh_dashboard(user_emails: List[str], reason: str = ""):
     })
 
 
-async def notify_tool_created(tool_name: str, tool_id: str):
-    """Broadcast to all connected users when a new tool is created"""
-    await manager.broadcast({
-        "type": NotificationType.TOOL_CREATED,
-        "tool_id": tool_id,
-        "tool_name": tool_name,
-        "message": f"New tool '{tool_name}' has been added"
-    })
+def _tool_messages(notification_type: str, tool: dict, credentials: Optional[dict], message: str):
+    """Redacted message for everyone, plus a credentialed variant for PRIVILEGED_ROLE"""
+    public = {
+        "type": notification_type,
+        "tool_id": tool["id"],
+        "tool_name": tool["name"],
+        "tool": tool,
+        "version": tool.get("version", 0),
+        "message": message
+    }
+    privileged = None
+    if credentials:
+        privileged = {**public, "tool": {**tool, "credentials": credentials}}
+    return public, privileged
 
 
-async def notify_tool_updated(tool_name: str, tool_id: str):
-    """Broadcast to all connected users when a tool is updated"""
-    await manager.broadcast({
-        "type": NotificationType.REFRESH_DASHBOARD,
-        "tool_id": tool_id,
-        "tool_name": tool_name,
-        "reason": "tool_updated",
-        "message": f"Tool '{tool_name}' has been updated"
-    })
+async def notify_tool_created(tool: dict, credentials: Optional[dict] = None):
+    """Broadcast a new tool (as returned by GET /api/tools, without credentials)"""
+    public, privileged = _tool_messages(
+        NotificationType.TOOL_CREATED, tool, credentials, f"New tool '{tool['name']}' has been added"
+    )
+    await manager.broadcast(public, privileged_message=privileged)
+
+
+async def notify_tool_updated(tool: dict, credentials: Optional[dict] = None):
+    """Broadcast an updated tool (as returned by GET /api/tools, without credentials)"""
+    public, privileged = _tool_messages(
+        NotificationType.TOOL_UPDATED, tool, credentials, f"Tool '{tool['name']}' has been updated"
+    )
+    await manager.broadcast(public, privileged_message=privileged)
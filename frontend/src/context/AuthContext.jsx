@@ -16,6 +16,16 @@ export const AuthProvider = ({ children }) => {
   const wsRef = useRef(null);
   const pingIntervalRef = useRef(null);
   const tokenRefreshIntervalRef = useRef(null);
+  // Listeners for delta notifications (tool/access changes carrying data + version)
+  const liveUpdateListenersRef = useRef(new Set());
+  // Resume position sent on reconnect so the server replays only missed notifications
+  const wsResumeRef = useRef({ epoch: null, lastSeq: null });
+  const reconnectTimeoutRef = useRef(null);
+  
+  const subscribeLiveUpdates = useCallback((listener) => {
+    liveUpdateListenersRef.current.add(listener);
+    return () => liveUpdateListenersRef.current.delete(listener);
+  }, []);
   
   // Token refresh interval - refresh every 25 minutes (before 30 min expiry)
   const TOKEN_REFRESH_INTERVAL = 25 * 60 * 1000; // 25 minutes in ms
@@ -26,6 +36,7 @@ export const AuthProvider = ({ children }) => {
     setToken(null);
     setDeviceStatus(null);
     setDeviceInfo(null);
+    wsResumeRef.current = { epoch: null, lastSeq: null };
     localStorage.removeItem("dsg_token");
     localStorage.removeItem("dsg_user");
     clearStoredDeviceStatus();
@@ -34,6 +45,8 @@ export const AuthProvider = ({ children }) => {
   // WebSocket connection effect
   useEffect(() => {
     if (!token) return;
+    let closedByEffect = false;
+    let reconnectAttempts = 0;
     
     const connectWebSocket = () => {
       // Get WebSocket URL - use current host if REACT_APP_BACKEND_URL not set
@@ -53,12 +66,19 @@ export const AuthProvider = ({ children }) => {
         return;
       }
       
+      // Resume position goes on every reconnect, whichever URL we connect to
+      const { epoch, lastSeq } = wsResumeRef.current;
+      if (epoch && lastSeq !== null) {
+        wsUrl += `${wsUrl.includes('?') ? '&' : '?'}epoch=${encodeURIComponent(epoch)}&last_seq=${lastSeq}`;
+      }
+      
       try {
         wsRef.current = new WebSocket(wsUrl);
         
         wsRef.current.onopen = () => {
           console.log('[WS] Connected');
           setWsConnected(true);
+          reconnectAttempts = 0;
           
           // Start ping interval
           pingIntervalRef.current = setInterval(() => {
@@ -75,11 +95,35 @@ export const AuthProvider = ({ children }) => {
             const data = JSON.parse(event.data);
             console.log('[WS] Message received:', data);
             
+            if (data.type === NotificationType.SYNC) {
+              // Same epoch: never move backwards past notifications already handled
+              // (a SYNC can trail frames delivered on this socket). New epoch: start over.
+              const resume = wsResumeRef.current;
+              const sameEpoch = resume.epoch === data.epoch && resume.lastSeq !== null;
+              wsResumeRef.current = {
+                epoch: data.epoch,
+                lastSeq: sameEpoch ? Math.max(resume.lastSeq, data.seq) : data.seq,
+              };
+              return;
+            }
+            if (typeof data.seq === 'number' && wsResumeRef.current.lastSeq !== null) {
+              wsResumeRef.current.lastSeq = Math.max(wsResumeRef.current.lastSeq, data.seq);
+            }
+            
             // Handle notification
             switch (data.type) {
               case NotificationType.TOOL_ACCESS_UPDATED:
               case NotificationType.TOOL_DELETED:
               case NotificationType.TOOL_CREATED:
+              case NotificationType.TOOL_UPDATED:
+                // Deltas are patched into local state by subscribers - no re-fetch
+                if (data.version !== undefined && liveUpdateListenersRef.current.size > 0) {
+                  liveUpdateListenersRef.current.forEach(listener => listener(data));
+                } else {
+                  setDashboardRefreshKey(prev => prev + 1);
+                }
+                break;
+                
               case NotificationType.REFRESH_DASHBOARD:
                 setDashboardRefreshKey(prev => prev + 1);
                 break;
@@ -106,12 +150,18 @@ export const AuthProvider = ({ children }) => {
           }
         };
         
-        wsRef.current.onclose = () => {
+        wsRef.current.onclose = (event) => {
           console.log('[WS] Disconnected');
           setWsConnected(false);
           if (pingIntervalRef.current) {
             clearInterval(pingIntervalRef.current);
           }
+          // Reconnect after network blips (4001-4003 = auth rejected, don't retry)
+          if (!closedByEffect && !(event.code >= 4001 && event.code <= 4003)) {
+            const delay = Math.min(30000, 1000 * 2 ** reconnectAttempts);
+            reconnectAttempts += 1;
+            reconnectTimeoutRef.current = setTimeout(connectWebSocket, delay);
+          }
         };
         
         wsRef.current.onerror = (error) => {
@@ -125,6 +175,10 @@ export const AuthProvider = ({ children }) => {
     connectWebSocket();
     
     return () => {
+      closedByEffect = true;
+      if (reconnectTimeoutRef.current) {
+        clearTimeout(reconnectTimeoutRef.current);
+      }
       if (pingIntervalRef.current) {
         clearInterval(pingIntervalRef.current);
       }
@@ -484,6 +538,7 @@ export const AuthProvider = ({ children }) => {
     isDeviceApproved,
     wsConnected,
     dashboardRefreshKey,
+    subscribeLiveUpdates,
     login,
     loginWithGoogle,
     loginWithToken,
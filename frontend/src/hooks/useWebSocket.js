@@ -3,11 +3,13 @@ export const NotificationType = {
   TOOL_ACCESS_UPDATED: 'tool_access_updated',
   TOOL_DELETED: 'tool_deleted',
   TOOL_CREATED: 'tool_created',
+  TOOL_UPDATED: 'tool_updated',
   ROLE_CHANGED: 'role_changed',
   USER_SUSPENDED: 'user_suspended',
   USER_REACTIVATED: 'user_reactivated',
   REFRESH_DASHBOARD: 'refresh_dashboard',
   CREDENTIALS_UPDATED: 'credentials_updated',
+  SYNC: 'sync',
 };
 
 // Note: WebSocket is now handled directly in AuthContext for simpler state management
@@ -123,6 +123,8 @@ export const ActivityLogsPage = () => {
   const [activityLogs, setActivityLogs] = useState([]);
   const [usersWithLogs, setUsersWithLogs] = useState([]);
   const [isLoading, setIsLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [selectedLogs, setSelectedLogs] = useState([]);
   
   // Delete dialogs
@@ -155,8 +157,9 @@ export const ActivityLogsPage = () => {
     setIsLoading(true);
     try {
       const userEmail = filterUser !== "all" ? filterUser : null;
-      const logs = await activityLogsAPI.getAll(200, filterType, filterRole, userEmail);
-      setActivityLogs(logs);
+      const page = await activityLogsAPI.getPage(200, null, filterType, filterRole, userEmail);
+      setActivityLogs(page.logs);
+      setNextCursor(page.next_cursor);
       setSelectedLogs([]);
     } catch (error) {
       console.error("Failed to fetch activity logs:", error);
@@ -166,6 +169,23 @@ export const ActivityLogsPage = () => {
     }
   }, [filterRole, filterType, filterUser]);
 
+  // Fetch the next (older) page of activity logs
+  const fetchMoreLogs = async () => {
+    if (!nextCursor) return;
+    setIsLoadingMore(true);
+    try {
+      const userEmail = filterUser !== "all" ? filterUser : null;
+      const page = await activityLogsAPI.getPage(200, nextCursor, filterType, filterRole, userEmail);
+      setActivityLogs(prev => [...prev, ...page.logs]);
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      console.error("Failed to fetch more activity logs:", error);
+      toast.error("Failed to load more activity logs");
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchUsersWithLogs();
   }, [fetchUsersWithLogs]);
@@ -555,6 +575,15 @@ export const ActivityLogsPage = () => {
         </CardContent>
       </Card>
 
+      {nextCursor && !isLoading && (
+        <div className="flex justify-center">
+          <Button variant="outline" className="gap-2" onClick={fetchMoreLogs} disabled={isLoadingMore}>
+            <RefreshCw className={`h-4 w-4 ${isLoadingMore ? "animate-spin" : ""}`} />
+            {isLoadingMore ? "Loading..." : "Load older logs"}
+          </Button>
+        </div>
+      )}
+
       {filteredLogs.length === 0 && !isLoading && (
         <div className="text-center py-12">
           <AlertCircle className="h-12 w-12 text-muted-foreground mx-auto mb-4" />
@@ -1,4 +1,4 @@
-import { useState, useEffect } from "react";
+import { useState, useEffect, useMemo, useRef } from "react";
 import { HeaderCard } from "@/components/dashboard/HeaderCard";
 import { StatCard } from "@/components/dashboard/StatCard";
 import { ToolCard } from "@/components/dashboard/ToolCard";
@@ -22,6 +22,7 @@ import {
   SelectValue,
 } from "@/components/ui/select";
 import { useAuth } from "@/context/AuthContext";
+import { NotificationType } from "@/hooks/useWebSocket";
 import { toolsAPI, usersAPI } from "@/services/api";
 import { toast } from "sonner";
 import {
@@ -82,8 +83,11 @@ const categoryOptions = [
 ];
 
 export const DashboardPage = ({ currentUser }) => {
-  const { user, addToolCredential, dashboardRefreshKey } = useAuth();
-  const [tools, setTools] = useState([]);
+  const { user, addToolCredential, dashboardRefreshKey, subscribeLiveUpdates } = useAuth();
+  // Every tool (with version), and the ids this user may see (null = no filter)
+  const [allTools, setAllTools] = useState([]);
+  const [allowedToolIds, setAllowedToolIds] = useState(null);
+  const accessVersionRef = useRef(-1);
   const [usersCount, setUsersCount] = useState(0);
   const [isLoading, setIsLoading] = useState(true);
   const [isAddDialogOpen, setIsAddDialogOpen] = useState(false);
@@ -108,39 +112,45 @@ export const DashboardPage = ({ currentUser }) => {
   const isAdmin = user?.role === "Administrator";
   const isRegularUser = user?.role === "User";
 
+  const tools = useMemo(
+    () => (allowedToolIds === null ? allTools : allTools.filter(tool => allowedToolIds.includes(tool.id))),
+    [allTools, allowedToolIds]
+  );
+
+  const withIcon = (tool) => ({
+    ...tool,
+    icon: iconMap[tool.icon] || Globe,
+    iconName: tool.icon,
+  });
+
+  // Load all tools and (for Admin/User) the assigned tool ids
+  const loadTools = async () => {
+    const toolsData = await toolsAPI.getAll();
+    setAllTools(toolsData.map(withIcon));
+
+    // Super Admin sees ALL tools
+    // Admin and User only see ASSIGNED tools
+    if (isSuperAdmin || !user) {
+      setAllowedToolIds(null);
+      return;
+    }
+    try {
+      const accessData = await usersAPI.getToolAccess(user.id);
+      // Always filter - even if 0 tools assigned
+      setAllowedToolIds(accessData.allowed_tools || []);
+      accessVersionRef.current = accessData.version ?? 0;
+    } catch (error) {
+      // If can't fetch access, show no tools for safety
+      console.error("Could not fetch tool access:", error);
+      setAllowedToolIds([]);
+    }
+  };
+
   // Fetch tools and users count on mount or when dashboardRefreshKey changes
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const toolsData = await toolsAPI.getAll();
-        
-        // Map icon string to actual component
-        let toolsWithIcons = toolsData.map(tool => ({
-          ...tool,
-          icon: iconMap[tool.icon] || Globe,
-          iconName: tool.icon,
-        }));
-
-        // Super Admin sees ALL tools
-        // Admin and User only see ASSIGNED tools
-        if (!isSuperAdmin && user) {
-          try {
-            console.log("Fetching tool access for user:", user.id, user.role);
-            const accessData = await usersAPI.getToolAccess(user.id);
-            const allowedToolIds = accessData.allowed_tools || [];
-            console.log("Allowed tool IDs:", allowedToolIds);
-            
-            // Filter to only show assigned tools - even if 0 tools assigned
-            toolsWithIcons = toolsWithIcons.filter(tool => allowedToolIds.includes(tool.id));
-            console.log("Filtered tools count:", toolsWithIcons.length);
-          } catch (error) {
-            // If can't fetch access, show no tools for safety
-            console.error("Could not fetch tool access:", error);
-            toolsWithIcons = [];
-          }
-        }
-
-        setTools(toolsWithIcons);
+        await loadTools();
 
         // Get users count only for Super Admin
         if (isSuperAdmin) {
@@ -164,6 +174,37 @@ export const DashboardPage = ({ currentUser }) => {
     }
   }, [user, isSuperAdmin, dashboardRefreshKey]); // Added dashboardRefreshKey as dependency
 
+  // Patch local state from WebSocket deltas; versions drop stale/out-of-order updates
+  useEffect(() => {
+    return subscribeLiveUpdates((update) => {
+      switch (update.type) {
+        case NotificationType.TOOL_CREATED:
+        case NotificationType.TOOL_UPDATED:
+          setAllTools(prev => {
+            const existing = prev.find(tool => tool.id === update.tool.id);
+            if (existing && (existing.version ?? 0) >= update.version) return prev;
+            const patched = withIcon(update.tool);
+            return existing ? prev.map(tool => (tool.id === patched.id ? patched : tool)) : [...prev, patched];
+          });
+          break;
+
+        case NotificationType.TOOL_DELETED:
+          setAllTools(prev => prev.filter(tool => tool.id !== update.tool_id));
+          break;
+
+        case NotificationType.TOOL_ACCESS_UPDATED:
+          if (!isSuperAdmin && update.version > accessVersionRef.current) {
+            accessVersionRef.current = update.version;
+            setAllowedToolIds(update.tool_ids || []);
+          }
+          break;
+
+        default:
+          break;
+      }
+    });
+  }, [subscribeLiveUpdates, isSuperAdmin]);
+
   const stats = [
     { value: String(tools.length), label: "Active Tools", variant: "blue", icon: Wrench },
     { value: String(usersCount || "—"), label: "Total Users", variant: "indigo", icon: Users },
@@ -201,17 +242,13 @@ export const DashboardPage = ({ currentUser }) => {
       const createdTool = await toolsAPI.create(toolData);
 
       // Add to local state with icon component
-      const toolWithIcon = {
-        ...createdTool,
-        icon: iconMap[createdTool.icon] || Globe,
-        iconName: createdTool.icon,
-      };
+      const toolWithIcon = withIcon(createdTool);
 
       toast.success(`${createdTool.name} added successfully!`, {
         description: addCredentials ? "Tool and credentials saved securely." : `New tool added to ${createdTool.category} category.`,
       });
 
-      setTools([...tools, toolWithIcon]);
+      setAllTools(prev => (prev.some(tool => tool.id === toolWithIcon.id) ? prev : [...prev, toolWithIcon]));
 
       // Reset form
       setNewTool({
@@ -233,31 +270,13 @@ export const DashboardPage = ({ currentUser }) => {
   };
 
   const handleDeleteTool = async (toolId) => {
-    setTools(tools.filter((t) => t.id !== toolId));
+    setAllTools(prev => prev.filter((t) => t.id !== toolId));
   };
 
   // Refresh tools data
   const handleToolUpdate = async () => {
     try {
-      const toolsData = await toolsAPI.getAll();
-      let toolsWithIcons = toolsData.map(tool => ({
-        ...tool,
-        icon: iconMap[tool.icon] || Globe,
-        iconName: tool.icon,
-      }));
-
-      if (!isSuperAdmin && user) {
-        try {
-          const accessData = await usersAPI.getToolAccess(user.id);
-          const allowedToolIds = accessData.allowed_tools || [];
-          // Always filter - even if 0 tools assigned
-          toolsWithIcons = toolsWithIcons.filter(tool => allowedToolIds.includes(tool.id));
-        } catch {
-          toolsWithIcons = [];
-        }
-      }
-
-      setTools(toolsWithIcons);
+      await loadTools();
     } catch (error) {
       console.error("Failed to refresh tools:", error);
     }
@@ -392,6 +392,24 @@ export const activityLogsAPI = {
     return fetchAPI(url);
   },
   
+  // Cursor-paginated logs - returns { logs, next_cursor }
+  getPage: (limit = 50, cursor = null, activityType = null, userRole = null, userEmail = null) => {
+    let url = `/api/activity-logs/page?limit=${limit}`;
+    if (cursor) {
+      url += `&cursor=${encodeURIComponent(cursor)}`;
+    }
+    if (activityType && activityType !== 'all') {
+      url += `&activity_type=${activityType}`;
+    }
+    if (userRole && userRole !== 'all') {
+      url += `&user_role=${encodeURIComponent(userRole)}`;
+    }
+    if (userEmail) {
+      url += `&user_email=${encodeURIComponent(userEmail)}`;
+    }
+    return fetchAPI(url);
+  },
+  
   create: (logData) => 
     fetchAPI('/api/activity-logs', {
       method: 'POST',